@@ -26,6 +26,10 @@ class Config:
     gcal_daily_hour: int
     gemini_api_keys: list[str]
     gemini_model: str
+    gemini_rpm: int
+    openai_rpm: int
+    openai_tpm: int
+    openai_max_concurrency: int
     weather_lat: float
     weather_lon: float
     weather_city: str
@@ -71,6 +75,10 @@ class Config:
             gcal_daily_hour=int(os.getenv("GCAL_DAILY_HOUR", "8")),
             gemini_api_keys=[k.strip() for k in (os.getenv("GEMINI_API_KEY") or "").split(",") if k.strip()],
             gemini_model=os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
+            gemini_rpm=int(os.getenv("GEMINI_RPM", "15")),
+            openai_rpm=int(os.getenv("OPENAI_RPM", "0")),
+            openai_tpm=int(os.getenv("OPENAI_TPM", "0")),
+            openai_max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "8")),
             weather_lat=float(os.getenv("WEATHER_LAT", "55.1540")),
             weather_lon=float(os.getenv("WEATHER_LON", "61.4291")),
             weather_city=os.getenv("WEATHER_CITY", "Челябинск"),
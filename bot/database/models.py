@@ -25,6 +25,7 @@ CREATE TABLE IF NOT EXISTS messages (
     content_type    TEXT DEFAULT 'text',
     image_url       TEXT,
     tokens_used     INTEGER DEFAULT 0,
+    char_len        INTEGER,
     created_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -1,5 +1,9 @@
 from __future__ import annotations
 
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
 import aiosqlite
 
 from bot.database.models import SCHEMA
@@ -9,10 +13,18 @@ class Repository:
     def __init__(self, db_path: str) -> None:
         self._db_path = db_path
         self._db: aiosqlite.Connection | None = None
+        # separate read-only connection for hot per-message reads (same as _db for :memory:)
+        self._read_db: aiosqlite.Connection | None = None
+        # bumped on every user_memory write so callers can cache derived data
+        self._facts_version: dict[int, int] = {}
+        # user_id -> (UTC day, tokens today, tokens this month), kept current by api_usage writes
+        self._usage_totals: dict[int, tuple[str, int, int]] = {}
 
     async def connect(self) -> None:
         self._db = await aiosqlite.connect(self._db_path)
         self._db.row_factory = aiosqlite.Row
+        # SQLite's lower() only folds ASCII; facts are often in Russian
+        await self._db.create_function("casefold", 1, str.casefold, deterministic=True)
         await self._db.executescript(SCHEMA)
         # migrations for existing databases
         cursor = await self._db.execute("PRAGMA table_info(users)")
@@ -27,6 +39,10 @@ class Repository:
             await self._db.execute("ALTER TABLE messages ADD COLUMN content_type TEXT DEFAULT 'text'")
         if "image_url" not in msg_cols:
             await self._db.execute("ALTER TABLE messages ADD COLUMN image_url TEXT")
+        if "char_len" not in msg_cols:
+            # content length stored once so the history budget doesn't re-measure every row
+            await self._db.execute("ALTER TABLE messages ADD COLUMN char_len INTEGER")
+            await self._db.execute("UPDATE messages SET char_len = LENGTH(content)")
         # migrate api_usage CHECK constraint to include vision/tts
         cursor = await self._db.execute(
             "SELECT sql FROM sqlite_master WHERE type='table' AND name='api_usage'"
@@ -142,7 +158,17 @@ class Repository:
             """)
         await self._db.commit()
 
+        if self._db_path == ":memory:":
+            self._read_db = self._db
+        else:
+            # WAL lets the reader connection run while the writer commits
+            await self._db.execute("PRAGMA journal_mode=WAL")
+            self._read_db = await aiosqlite.connect(f"{Path(self._db_path).resolve().as_uri()}?mode=ro", uri=True)
+            self._read_db.row_factory = aiosqlite.Row
+
     async def close(self) -> None:
+        if self._read_db and self._read_db is not self._db:
+            await self._read_db.close()
         if self._db:
             await self._db.close()
 
@@ -202,7 +228,7 @@ class Repository:
     # ── conversations ──────────────────────────────────────
 
     async def get_active_conversation(self, user_id: int) -> dict | None:
-        cursor = await self._db.execute(
+        cursor = await self._read_db.execute(
             "SELECT * FROM conversations WHERE user_id = ? AND is_active = 1 ORDER BY created_at DESC LIMIT 1",
             (user_id,),
         )
@@ -235,16 +261,18 @@ class Repository:
         await self._db.commit()
         return True
 
-    async def create_conversation(self, user_id: int, model: str, system_prompt: str = "You are a helpful assistant.") -> int:
+    async def create_conversation(self, user_id: int, model: str, system_prompt: str = "You are a helpful assistant.") -> dict:
+        """Deactivate the current conversation and return the newly created one."""
         await self._db.execute(
             "UPDATE conversations SET is_active = 0 WHERE user_id = ? AND is_active = 1", (user_id,)
         )
         cursor = await self._db.execute(
-            "INSERT INTO conversations (user_id, model, system_prompt) VALUES (?, ?, ?)",
+            "INSERT INTO conversations (user_id, model, system_prompt) VALUES (?, ?, ?) RETURNING *",
             (user_id, model, system_prompt),
         )
+        row = await cursor.fetchone()
         await self._db.commit()
-        return cursor.lastrowid
+        return dict(row)
 
     async def update_conversation_model(self, conv_id: int, model: str) -> None:
         await self._db.execute("UPDATE conversations SET model = ? WHERE id = ?", (model, conv_id))
@@ -263,47 +291,105 @@ class Repository:
     async def add_message(self, conversation_id: int, role: str, content: str,
                           tokens_used: int = 0, content_type: str = "text", image_url: str | None = None) -> int:
         cursor = await self._db.execute(
-            "INSERT INTO messages (conversation_id, role, content, tokens_used, content_type, image_url) VALUES (?, ?, ?, ?, ?, ?)",
-            (conversation_id, role, content, tokens_used, content_type, image_url),
+            """INSERT INTO messages (conversation_id, role, content, tokens_used, content_type, image_url, char_len)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (conversation_id, role, content, tokens_used, content_type, image_url, len(content)),
         )
         await self._db.commit()
         return cursor.lastrowid
 
+    async def finalize_turn(self, conversation_id: int, user_id: int, user_message: str, assistant_message: str,
+                            tokens_used: int, usage_type: str, model: str,
+                            content_type: str = "text", image_url: str | None = None) -> None:
+        """Store a finished exchange and its API usage in one transaction.
+
+        The user message is written together with the answer, so a failed
+        request leaves nothing behind to clean up.
+        """
+        await self._db.execute(
+            """INSERT INTO messages (conversation_id, role, content, tokens_used, content_type, image_url, char_len)
+               VALUES (?, 'user', ?, 0, ?, ?, ?), (?, 'assistant', ?, ?, 'text', NULL, ?)""",
+            (conversation_id, user_message, content_type, image_url, len(user_message),
+             conversation_id, assistant_message, tokens_used, len(assistant_message)),
+        )
+        await self._db.execute(
+            "INSERT INTO api_usage (user_id, type, model, tokens_used) VALUES (?, ?, ?, ?)",
+            (user_id, usage_type, model, tokens_used),
+        )
+        await self._db.commit()
+        self._count_usage(user_id, tokens_used)
+
     async def get_messages(self, conversation_id: int, limit: int = 50) -> list[dict]:
-        cursor = await self._db.execute(
+        cursor = await self._read_db.execute(
             """SELECT role, content, content_type, image_url FROM messages
                WHERE conversation_id = ?
-               ORDER BY created_at DESC LIMIT ?""",
+               ORDER BY created_at DESC, id DESC LIMIT ?""",
             (conversation_id, limit),
         )
         rows = await cursor.fetchall()
         return [dict(r) for r in reversed(rows)]
 
+    async def get_chat_context(self, user_id: int, max_messages: int = 50, max_facts: int = 30,
+                               max_chars: int | None = None) -> dict:
+        """Load active conversation, its last messages and user facts in one query.
+
+        If max_chars is given, only the newest messages whose cumulative content
+        length fits the budget are returned (computed in SQL with a window sum).
+
+        Returns {"conversation": dict | None, "messages": [...], "facts": [...]}.
+        Messages are in chronological order, facts are newest first.
+        """
+        cursor = await self._read_db.execute(
+            """WITH conv AS (
+                   SELECT * FROM conversations
+                   WHERE user_id = ? AND is_active = 1
+                   ORDER BY created_at DESC LIMIT 1
+               )
+               SELECT
+                   (SELECT json_object(
+                        'id', id, 'user_id', user_id, 'title', title, 'model', model,
+                        'system_prompt', system_prompt, 'created_at', created_at,
+                        'is_active', is_active)
+                    FROM conv) AS conversation,
+                   (SELECT json_group_array(json_object(
+                        'role', role, 'content', content,
+                        'content_type', content_type, 'image_url', image_url))
+                    FROM (SELECT role, content, content_type, image_url
+                          FROM (SELECT role, content, content_type, image_url, created_at, id,
+                                       SUM(COALESCE(char_len, LENGTH(content)))
+                                           OVER (ORDER BY created_at DESC, id DESC) AS cum_chars
+                                FROM messages
+                                WHERE conversation_id = (SELECT id FROM conv)
+                                ORDER BY created_at DESC, id DESC LIMIT ?)
+                          WHERE ? IS NULL OR cum_chars <= ?
+                          ORDER BY created_at DESC, id DESC)) AS messages,
+                   (SELECT json_group_array(fact)
+                    FROM (SELECT fact FROM user_memory
+                          WHERE user_id = ?
+                          ORDER BY created_at DESC LIMIT ?)) AS facts""",
+            (user_id, max_messages, max_chars, max_chars, user_id, max_facts),
+        )
+        row = await cursor.fetchone()
+        return {
+            "conversation": json.loads(row["conversation"]) if row["conversation"] else None,
+            "messages": list(reversed(json.loads(row["messages"]))),
+            "facts": json.loads(row["facts"]),
+        }
+
     async def get_last_assistant_message(self, conversation_id: int) -> dict | None:
         cursor = await self._db.execute(
             """SELECT id, content FROM messages
                WHERE conversation_id = ? AND role = 'assistant'
-               ORDER BY created_at DESC LIMIT 1""",
+               ORDER BY created_at DESC, id DESC LIMIT 1""",
             (conversation_id,),
         )
         row = await cursor.fetchone()
         return dict(row) if row else None
 
-    async def delete_last_user_message(self, conversation_id: int) -> None:
-        """Delete the most recent user message (used for Gemini→OpenAI fallback cleanup)."""
-        cursor = await self._db.execute(
-            "SELECT id FROM messages WHERE conversation_id = ? AND role = 'user' ORDER BY created_at DESC LIMIT 1",
-            (conversation_id,),
-        )
-        row = await cursor.fetchone()
-        if row:
-            await self._db.execute("DELETE FROM messages WHERE id = ?", (row["id"],))
-            await self._db.commit()
-
     async def delete_last_exchange(self, conversation_id: int) -> bool:
         """Delete the last user+assistant message pair for retry."""
         cursor = await self._db.execute(
-            "SELECT id, role FROM messages WHERE conversation_id = ? ORDER BY created_at DESC LIMIT 2",
+            "SELECT id, role FROM messages WHERE conversation_id = ? ORDER BY created_at DESC, id DESC LIMIT 2",
             (conversation_id,),
         )
         rows = await cursor.fetchall()
@@ -343,7 +429,7 @@ class Repository:
 
     async def get_all_messages_for_export(self, conversation_id: int) -> list[dict]:
         cursor = await self._db.execute(
-            "SELECT role, content, created_at FROM messages WHERE conversation_id = ? ORDER BY created_at",
+            "SELECT role, content, created_at FROM messages WHERE conversation_id = ? ORDER BY created_at, id",
             (conversation_id,),
         )
         return [dict(r) for r in await cursor.fetchall()]
@@ -352,7 +438,7 @@ class Repository:
         cursor = await self._db.execute(
             """SELECT role, content, created_at FROM messages
                WHERE conversation_id = ?
-               ORDER BY created_at DESC LIMIT ?""",
+               ORDER BY created_at DESC, id DESC LIMIT ?""",
             (conversation_id, limit),
         )
         rows = await cursor.fetchall()
@@ -366,6 +452,7 @@ class Repository:
             (user_id, usage_type, model, tokens_used),
         )
         await self._db.commit()
+        self._count_usage(user_id, tokens_used)
 
     async def get_api_usage_summary(self, user_id: int) -> list[dict]:
         cursor = await self._db.execute(
@@ -391,6 +478,33 @@ class Repository:
         )
         return [dict(r) for r in await cursor.fetchall()]
 
+    async def get_usage_totals(self, user_id: int) -> tuple[int, int]:
+        """Return (tokens today, tokens this month), UTC.
+
+        Queried once per user and day, then served from memory and updated by
+        finalize_turn / log_api_usage.
+        """
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        cached = self._usage_totals.get(user_id)
+        if cached is not None and cached[0] == day:
+            return cached[1], cached[2]
+        cursor = await self._db.execute(
+            """SELECT COALESCE(SUM(CASE WHEN created_at >= date('now') THEN tokens_used END), 0) AS daily,
+                      COALESCE(SUM(tokens_used), 0) AS monthly
+               FROM api_usage
+               WHERE user_id = ? AND created_at >= date('now', 'start of month')""",
+            (user_id,),
+        )
+        row = await cursor.fetchone()
+        self._usage_totals[user_id] = (day, row["daily"], row["monthly"])
+        return row["daily"], row["monthly"]
+
+    def _count_usage(self, user_id: int, tokens_used: int) -> None:
+        cached = self._usage_totals.get(user_id)
+        if cached is not None and tokens_used:
+            day, daily, monthly = cached
+            self._usage_totals[user_id] = (day, daily + tokens_used, monthly + tokens_used)
+
     async def get_daily_tokens(self, user_id: int) -> int:
         cursor = await self._db.execute(
             """SELECT COALESCE(SUM(tokens_used), 0) AS total
@@ -427,8 +541,16 @@ class Repository:
         )
         return [dict(r) for r in await cursor.fetchall()]
 
-    async def mark_reminder_sent(self, reminder_id: int) -> None:
-        await self._db.execute("UPDATE reminders SET sent = 1 WHERE id = ?", (reminder_id,))
+    async def get_next_due_at(self) -> datetime | None:
+        """remind_at of the earliest unsent reminder (naive UTC), None if there are none."""
+        cursor = await self._db.execute("SELECT MIN(remind_at) AS due FROM reminders WHERE sent = 0")
+        row = await cursor.fetchone()
+        return datetime.fromisoformat(row["due"]) if row["due"] else None
+
+    async def mark_reminders_sent(self, reminder_ids: list[int]) -> None:
+        if not reminder_ids:
+            return
+        await self._db.executemany("UPDATE reminders SET sent = 1 WHERE id = ?", [(i,) for i in reminder_ids])
         await self._db.commit()
 
     async def get_user_reminders(self, user_id: int) -> list[dict]:
@@ -447,16 +569,40 @@ class Repository:
 
     # ── user memory ───────────────────────────────────────
 
+    def facts_version(self, user_id: int) -> int:
+        """Counter that changes whenever the user's facts are modified."""
+        return self._facts_version.get(user_id, 0)
+
+    def _bump_facts_version(self, user_id: int) -> None:
+        self._facts_version[user_id] = self._facts_version.get(user_id, 0) + 1
+
     async def add_user_fact(self, user_id: int, fact: str) -> int:
         cursor = await self._db.execute(
             "INSERT INTO user_memory (user_id, fact) VALUES (?, ?)",
             (user_id, fact),
         )
         await self._db.commit()
+        self._bump_facts_version(user_id)
         return cursor.lastrowid
 
+    async def add_user_facts(self, user_id: int, facts: list[str]) -> int:
+        """Insert facts the user doesn't have yet (case-insensitive), return how many were added."""
+        if not facts:
+            return 0
+        cursor = await self._db.executemany(
+            """INSERT INTO user_memory (user_id, fact)
+               SELECT ?1, ?2 WHERE NOT EXISTS (
+                   SELECT 1 FROM user_memory WHERE user_id = ?1 AND casefold(fact) = casefold(?2)
+               )""",
+            [(user_id, fact) for fact in facts],
+        )
+        await self._db.commit()
+        if cursor.rowcount > 0:
+            self._bump_facts_version(user_id)
+        return cursor.rowcount
+
     async def get_user_facts(self, user_id: int, limit: int = 50) -> list[dict]:
-        cursor = await self._db.execute(
+        cursor = await self._read_db.execute(
             "SELECT * FROM user_memory WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
             (user_id, limit),
         )
@@ -467,6 +613,7 @@ class Repository:
             "DELETE FROM user_memory WHERE id = ? AND user_id = ?", (fact_id, user_id)
         )
         await self._db.commit()
+        self._bump_facts_version(user_id)
         return cursor.rowcount > 0
 
     async def clear_user_memory(self, user_id: int) -> int:
@@ -474,6 +621,7 @@ class Repository:
             "DELETE FROM user_memory WHERE user_id = ?", (user_id,)
         )
         await self._db.commit()
+        self._bump_facts_version(user_id)
         return cursor.rowcount
 
     # ── expenses ──────────────────────────────────────────
@@ -723,28 +871,34 @@ class Repository:
 
     # ── vps metrics ────────────────────────────────────────
 
-    async def add_vps_metric(self, server_id: int, **metrics) -> None:
-        await self._db.execute(
+    async def add_vps_metrics(self, metrics: list[tuple[int, dict]]) -> None:
+        """Store one polling cycle's (server_id, metrics) rows in a single transaction."""
+        if not metrics:
+            return
+        await self._db.executemany(
             """INSERT INTO vps_metrics
                (server_id, cpu_pct, mem_pct, mem_used_mb, mem_total_mb,
                 disk_pct, disk_used_gb, disk_total_gb, uptime_sec,
                 load_1, load_5, load_15, containers_json)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                server_id,
-                metrics.get("cpu_pct"),
-                metrics.get("mem_pct"),
-                metrics.get("mem_used_mb"),
-                metrics.get("mem_total_mb"),
-                metrics.get("disk_pct"),
-                metrics.get("disk_used_gb"),
-                metrics.get("disk_total_gb"),
-                metrics.get("uptime_sec"),
-                metrics.get("load_1"),
-                metrics.get("load_5"),
-                metrics.get("load_15"),
-                metrics.get("containers_json"),
-            ),
+            [
+                (
+                    server_id,
+                    m.get("cpu_pct"),
+                    m.get("mem_pct"),
+                    m.get("mem_used_mb"),
+                    m.get("mem_total_mb"),
+                    m.get("disk_pct"),
+                    m.get("disk_used_gb"),
+                    m.get("disk_total_gb"),
+                    m.get("uptime_sec"),
+                    m.get("load_1"),
+                    m.get("load_5"),
+                    m.get("load_15"),
+                    m.get("containers_json"),
+                )
+                for server_id, m in metrics
+            ],
         )
         await self._db.commit()
 
@@ -85,14 +85,8 @@ async def handle_text(message: Message, llm: LLMService, repo: Repository, confi
                 await _send_response(typing, message, response)
                 return
 
-        # check if web search is needed
-        needs_search = await llm.should_search(message.text)
-
-        if needs_search:
-            await typing.edit_text("🔍 Searching the web…")
-            response = await llm.chat_web_search(user.id, message.text, on_chunk)
-        else:
-            response = await llm.chat_stream(user.id, message.text, on_chunk)
+        # the model decides itself whether the answer needs a web search
+        response = await llm.chat_auto(user.id, message.text, on_chunk)
     except Exception:
         logger.exception("LLM error")
         try:
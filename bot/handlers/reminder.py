@@ -10,14 +10,14 @@ from aiogram.types import Message
 
 from bot.config import Config
 from bot.database.repository import Repository
-from bot.services.reminder import parse_remind_time
+from bot.services.reminder import ReminderService, parse_remind_time
 
 logger = logging.getLogger(__name__)
 router = Router()
 
 
 @router.message(Command("remind"))
-async def cmd_remind(message: Message, repo: Repository, config: Config) -> None:
+async def cmd_remind(message: Message, repo: Repository, config: Config, reminder_service: ReminderService) -> None:
     """Set a reminder: /remind через 30 минут купить молоко"""
     parts = message.text.split(maxsplit=1)
     if len(parts) < 2:
@@ -48,6 +48,7 @@ async def cmd_remind(message: Message, repo: Repository, config: Config) -> None
         text=reminder_text,
         remind_at=remind_at.strftime("%Y-%m-%d %H:%M:%S"),
     )
+    reminder_service.notify()  # the new reminder may be due before the scheduler's next wake-up
 
     # format time nicely
     delta = remind_at - datetime.now(timezone.utc).replace(tzinfo=None)
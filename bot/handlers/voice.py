@@ -4,6 +4,7 @@ import html
 import os
 import tempfile
 import logging
+from pathlib import Path
 
 from aiogram import Router, F
 from aiogram.types import Message
@@ -43,7 +44,6 @@ async def handle_voice(message: Message, llm: LLMService, stt: STTService, repo:
         await typing.edit_text("Failed to process voice message.")
         return
     finally:
-        from pathlib import Path
         Path(ogg_path).unlink(missing_ok=True)
 
     safe_text = html.escape(text)
@@ -78,6 +78,7 @@ async def main() -> None:
 
     # reminder scheduler
     reminder_service = ReminderService(bot, repo)
+    dp["reminder_service"] = reminder_service
 
     # register routers (order matters)
     dp.include_router(admin.router)      # callbacks + admin commands
@@ -152,12 +153,18 @@ async def main() -> None:
     except ImportError:
         logger.warning("asyncssh not installed — VPS monitoring disabled")
 
+    # connect to OpenAI while polling starts (keep the reference so the task isn't collected)
+    prewarm_task = asyncio.create_task(llm.prewarm())
+
     try:
         await dp.start_polling(bot)
     finally:
+        prewarm_task.cancel()
         await gcal_digest.stop()
         await reminder_service.stop()
         await vps_monitor.stop()
+        await weather_service.aclose()
+        await llm.aclose()
         await repo.close()
         await bot.session.close()
 
@@ -2,6 +2,9 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import re
+import time
+from collections import OrderedDict
 
 import httpx
 from google import genai
@@ -9,16 +12,68 @@ from google.genai import types
 
 from bot.config import Config
 from bot.database.repository import Repository
+from bot.services.rate_limiter import AsyncTokenBucket
+from bot.services.streaming import STREAM_CURSOR, CoalescingEditor
+from bot.utils import append_sources, estimate_tokens, likely_has_facts
 
 logger = logging.getLogger(__name__)
 
 STREAM_EDIT_INTERVAL = 1.5
 
+# per-user memory prompt cache (invalidated early by Repository.facts_version)
+MEMORY_CACHE_TTL = 60
+MEMORY_CACHE_SIZE = 10_000
+SYSTEM_CACHE_SIZE = 4096
+
+# max concurrent background tasks (fact extraction) per service
+BACKGROUND_CONCURRENCY = 4
+
+# rate-limit handling: per-key exponential cooldown, capped
+RATE_LIMIT_MAX_BACKOFF = 60
+RATE_LIMIT_MAX_WAIT = 10  # longer waits fail fast so LLMService can fall back to OpenAI
+RATE_LIMIT_EXTRA_RETRIES = 2
+# matches "retryDelay": "37s", "retry in 12.5s", "Retry-After: 30"
+_RETRY_DELAY_RE = re.compile(r"(?:retryDelay['\"]?:\s*['\"]?|retry in |Retry-After:\s*)(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+_FACT_EXTRACT_SYS = (
+    "Extract personal facts about the user from this conversation exchange. "
+    "Only extract FACTUAL info the user explicitly stated about themselves: "
+    "name, age, location, profession, hobbies, preferences, family, pets, etc. "
+    "Do NOT extract opinions, questions, or temporary states. "
+    "Return each fact on a new line, without numbering or bullets. "
+    "If there are no personal facts, respond with exactly: NONE"
+)
+_CONTEXT_HEADER = (
+    "IMPORTANT: The following data was obtained for the user's query. "
+    "You MUST use it to provide an accurate answer. "
+    "Cite sources with URLs where appropriate.\n\n"
+)
+MAX_SOURCES = 5  # citations appended to grounded answers
+_GOOGLE_SEARCH_TOOL = types.Tool(google_search=types.GoogleSearch())
+# static request configs — built once, never mutated by the SDK
+_IMAGE_GEN_CONFIG = types.GenerateContentConfig(response_modalities=["IMAGE", "TEXT"])
+_FACT_EXTRACT_CONFIG = types.GenerateContentConfig(system_instruction=_FACT_EXTRACT_SYS, max_output_tokens=200)
+
+# Telegram bots can't download files larger than this anyway
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+
+# image signatures for MIME sniffing (WEBP is checked separately: RIFF....WEBP)
+_IMAGE_MAGIC = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+# DB role -> Gemini role (everything else is sent as "user")
+_GEMINI_ROLES = {"assistant": "model"}
+
 
 def _extract_text(response) -> str:
     """Safely extract text from Gemini response (response.text can be None)."""
-    if response.text:
-        return response.text
+    text = response.text  # the SDK property joins all parts on every access
+    if text:
+        return text
     # fallback: manually extract from parts
     if response.candidates:
         for part in response.candidates[0].content.parts:
@@ -27,119 +82,337 @@ def _extract_text(response) -> str:
     raise ValueError("Gemini returned empty response")
 
 
+def _collect_sources(response, sources: list[str], seen: set[str]) -> None:
+    """Append unique (by URI) grounding citations to sources, up to MAX_SOURCES."""
+    if len(sources) >= MAX_SOURCES or not response.candidates:
+        return
+    gm = response.candidates[0].grounding_metadata
+    if not gm or not gm.grounding_chunks:
+        return
+    for gc in gm.grounding_chunks:
+        if gc.web and gc.web.uri and gc.web.uri not in seen:
+            seen.add(gc.web.uri)
+            sources.append(f"[{gc.web.title or gc.web.uri}]({gc.web.uri})")
+            if len(sources) >= MAX_SOURCES:
+                return
+
+
+def _sniff_mime(data: bytes) -> str | None:
+    """Detect image MIME type from magic bytes."""
+    head = data[:12]
+    for magic, mime in _IMAGE_MAGIC:
+        if head.startswith(magic):
+            return mime
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def _is_rate_limit(err_str: str) -> bool:
+    return "429" in err_str or "RESOURCE_EXHAUSTED" in err_str
+
+
+def _retry_delay(err_str: str) -> float | None:
+    """Extract server-suggested retry delay (seconds) from a rate-limit error."""
+    m = _RETRY_DELAY_RE.search(err_str)
+    if not m:
+        return None
+    return min(float(m.group(1)), RATE_LIMIT_MAX_BACKOFF)
+
+
 class GeminiService:
     def __init__(self, config: Config, repo: Repository) -> None:
         self._clients = [genai.Client(api_key=key) for key in config.gemini_api_keys]
-        self._current_idx = 0
+        self._next_idx = 0  # round-robin tie-break for _pick_key
+        self._inflight: list[int] = [0] * len(self._clients)
+        # monotonic time until which each key is rate-limited
+        self._cooldown_until: list[float] = [0.0] * len(self._clients)
+        # client-side per-key throttle so we wait instead of burning requests on 429s
+        self._buckets = (
+            [AsyncTokenBucket(config.gemini_rpm, 60) for _ in self._clients]
+            if config.gemini_rpm > 0 else []
+        )
         self._config = config
+        # history budget, ~4 chars per token
+        self._max_chars = config.max_context_tokens * 4
         self._repo = repo
+        # shared pool for image downloads (keeps TLS connections to Telegram alive)
+        self._http = httpx.AsyncClient(
+            timeout=30, limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60),
+        )
         self._skills_prompt: str = ""
+        self._skills_version = 0
+        # (conv_id, skills_version, memory_prompt) -> (base system prompt, full instruction)
+        self._sys_cache: OrderedDict[tuple[int, int, str], tuple[str, str]] = OrderedDict()
+        # user_id -> (created_at, facts_version, prompt), LRU-ordered
+        self._memory_cache: OrderedDict[int, tuple[float, int, str]] = OrderedDict()
+        # background work (fact extraction) is bounded so it can't starve user requests
+        self._bg_sem = asyncio.Semaphore(BACKGROUND_CONCURRENCY)
+        self._bg_tasks: set[asyncio.Task] = set()
+        # users with a fact extraction queued or running
+        self._fact_pending: set[int] = set()
+        # user_id -> task writing the user's last exchange
+        self._pending_turns: dict[int, asyncio.Task] = {}
+
+    def _pick_key(self) -> tuple[int, float]:
+        """Choose the least-loaded key.
+
+        Preference order: not cooling down, fewest in-flight requests, free
+        rate-limit slot, soonest cooldown end, then round-robin. Returns
+        (idx, seconds until the key's cooldown ends).
+        """
+        now = time.monotonic()
+        n = len(self._clients)
+        start = self._next_idx
+
+        def load(i: int) -> tuple:
+            return (
+                self._cooldown_until[i] > now,
+                self._inflight[i],
+                self._buckets[i].wait_time() if self._buckets else 0.0,
+                self._cooldown_until[i],
+                (i - start) % n,
+            )
 
-    @property
-    def _client(self) -> genai.Client:
-        """Current client (round-robin)."""
-        return self._clients[self._current_idx % len(self._clients)]
+        idx = min(range(n), key=load)
+        self._next_idx = (idx + 1) % n
+        return idx, max(0.0, self._cooldown_until[idx] - now)
 
-    def _rotate(self) -> None:
-        """Switch to next API key."""
-        old = self._current_idx
-        self._current_idx = (self._current_idx + 1) % len(self._clients)
-        logger.info("Gemini key rotated: %d -> %d", old, self._current_idx)
+    async def _wait_for_key(self, last_err: Exception | None) -> int:
+        """Pick a key, waiting if every key is cooling down, and return its index.
+
+        Raises (last_err if known) when the wait would exceed RATE_LIMIT_MAX_WAIT
+        so the caller can fall back to OpenAI instead of stalling the user.
+        """
+        idx, wait = self._pick_key()
+        if wait > 0:
+            if wait > RATE_LIMIT_MAX_WAIT:
+                raise last_err or RuntimeError("All Gemini API keys are rate-limited")
+            logger.info("All Gemini keys cooling down, waiting %.1fs", wait)
+            await asyncio.sleep(wait)
+        return idx
+
+    def _cool_down(self, idx: int, attempt: int, err_str: str) -> None:
+        """Put key idx on cooldown after a rate-limit error."""
+        backoff = _retry_delay(err_str) or min(RATE_LIMIT_MAX_BACKOFF, 2 ** attempt)
+        self._cooldown_until[idx] = time.monotonic() + backoff
+        logger.warning("Gemini rate limit on key %d, cooling down %.1fs: %s", idx, backoff, err_str[:100])
+
+    async def _throttle(self, idx: int) -> None:
+        """Wait for a request slot on key idx (no-op when GEMINI_RPM=0)."""
+        if self._buckets:
+            await self._buckets[idx].acquire()
 
     async def _call_with_rotation(self, func, *args, **kwargs):
-        """Call func(client, *args, **kwargs) with key rotation on rate-limit errors."""
+        """Call func(client, *args, **kwargs) with key rotation on rate-limit errors.
+
+        Rate-limited keys are put on an exponential cooldown; when every key is
+        cooling down we sleep until the first one frees up.
+        """
         last_err = None
-        for _ in range(len(self._clients)):
+        for attempt in range(len(self._clients) + RATE_LIMIT_EXTRA_RETRIES):
+            idx = await self._wait_for_key(last_err)
+            self._inflight[idx] += 1
             try:
-                result = await func(self._client, *args, **kwargs)
-                self._rotate()  # round-robin for next call
-                return result
+                await self._throttle(idx)
+                return await func(self._clients[idx], *args, **kwargs)
             except Exception as e:
                 err_str = str(e)
-                if "429" in err_str or "RESOURCE_EXHAUSTED" in err_str:
-                    logger.warning("Gemini rate limit on key %d: %s", self._current_idx, err_str[:100])
+                if _is_rate_limit(err_str):
                     last_err = e
-                    self._rotate()
+                    self._cool_down(idx, attempt, err_str)
                     continue
                 raise  # non-rate-limit error — don't retry
+            finally:
+                self._inflight[idx] -= 1
         raise last_err  # all keys exhausted
 
-    async def _stream_with_rotation(self, make_stream_fn, on_chunk) -> str:
+    async def _stream_with_rotation(self, make_stream_fn, on_chunk, sources: list[str] | None = None,
+                                    usage: dict | None = None) -> str:
         """Stream response with key rotation on rate-limit errors.
 
         Retries with next key only if the error occurs before any chunks arrive.
         Mid-stream failures are re-raised immediately (can't retry cleanly).
+        If sources is given, unique grounding citations from the chunks are appended to it.
+        If usage is given, the reported token count is stored in it as "total_tokens".
         """
         last_err = None
-        for _ in range(len(self._clients)):
-            client = self._client
-            self._rotate()
-            full_text = ""
+        for attempt in range(len(self._clients) + RATE_LIMIT_EXTRA_RETRIES):
+            if sources is not None:
+                sources.clear()
+                seen_uris: set[str] = set()
+            idx = await self._wait_for_key(last_err)
+            self._inflight[idx] += 1
+            editor = CoalescingEditor(on_chunk, suffix=STREAM_CURSOR)
+            loop_time = asyncio.get_running_loop().time
+            parts: list[str] = []  # joined only when emitting, avoids O(n²) concatenation
             last_edit = 0.0
             try:
-                async for chunk in make_stream_fn(client):
-                    delta = chunk.text or ""
-                    full_text += delta
-                    now = asyncio.get_running_loop().time()
-                    if now - last_edit >= STREAM_EDIT_INTERVAL and full_text:
-                        await on_chunk(full_text + " ▌")
+                await self._throttle(idx)
+                async for chunk in make_stream_fn(self._clients[idx]):
+                    if chunk.text:
+                        parts.append(chunk.text)
+                    if sources is not None:
+                        _collect_sources(chunk, sources, seen_uris)
+                    if usage is not None and chunk.usage_metadata and chunk.usage_metadata.total_token_count:
+                        usage["total_tokens"] = chunk.usage_metadata.total_token_count
+                    now = loop_time()
+                    if parts and now - last_edit >= STREAM_EDIT_INTERVAL:
+                        editor.update("".join(parts))
                         last_edit = now
+                full_text = "".join(parts)
                 if full_text:
-                    await on_chunk(full_text)
+                    await editor.finish(full_text)
                 return full_text
             except Exception as e:
+                editor.cancel()
                 err_str = str(e)
-                if ("429" in err_str or "RESOURCE_EXHAUSTED" in err_str) and not full_text:
-                    logger.warning("Gemini stream rate limit on key %d, rotating", self._current_idx)
+                if _is_rate_limit(err_str) and not parts:
                     last_err = e
+                    self._cool_down(idx, attempt, err_str)
                     continue
                 raise  # non-rate-limit error or mid-stream failure — don't retry
+            finally:
+                self._inflight[idx] -= 1
         raise last_err  # all keys exhausted
 
     def set_skills_prompt(self, prompt: str) -> None:
         self._skills_prompt = prompt
+        self._skills_version += 1
+
+    def _spawn_bg(self, coro) -> None:
+        """Run coro in the background, at most BACKGROUND_CONCURRENCY at a time."""
+        async def _run():
+            async with self._bg_sem:
+                await coro
+
+        task = asyncio.create_task(_run())
+        self._bg_tasks.add(task)
+        task.add_done_callback(self._bg_tasks.discard)
+
+    def _schedule_fact_extraction(self, user_id: int, user_message: str, reply: str) -> None:
+        """Extract facts in the background, at most one extraction per user at a time.
+
+        A message that arrives while the previous one is still being processed
+        is skipped; consecutive messages rarely state new facts.
+        """
+        if user_id in self._fact_pending or not likely_has_facts(user_message):
+            return
+        self._fact_pending.add(user_id)
+
+        async def _extract():
+            try:
+                await self._extract_and_save_facts(user_id, user_message, reply)
+            finally:
+                self._fact_pending.discard(user_id)
+
+        self._spawn_bg(_extract())
+
+    def _store_turn(self, conv_id: int, user_id: int, *args, **kwargs) -> None:
+        """Write the exchange in the background; see LLMService._store_turn."""
+        task = asyncio.create_task(self._repo.finalize_turn(conv_id, user_id, *args, **kwargs))
+        self._pending_turns[user_id] = task
+        self._bg_tasks.add(task)
+
+        def _done(t: asyncio.Task) -> None:
+            self._bg_tasks.discard(t)
+            if self._pending_turns.get(user_id) is t:
+                del self._pending_turns[user_id]
+            if not t.cancelled() and t.exception() is not None:
+                logger.error("Failed to store exchange for user %d: %s", user_id, t.exception())
+
+        task.add_done_callback(_done)
+
+    async def _wait_stored(self, user_id: int) -> None:
+        """Wait until the user's previous exchange is in the database."""
+        task = self._pending_turns.get(user_id)
+        if task is not None:
+            await asyncio.wait([task])
+
+    async def aclose(self) -> None:
+        """Wait for pending background tasks and close HTTP connections (call on shutdown)."""
+        await asyncio.gather(*self._bg_tasks, return_exceptions=True)
+        await self._http.aclose()
 
     # ── helpers ──────────────────────────────────────────────────
 
     async def _ensure_conversation(self, user_id: int) -> tuple[int, dict]:
         conv = await self._repo.get_active_conversation(user_id)
         if conv is None:
-            await self._repo.create_conversation(user_id, self._config.default_model)
-            conv = await self._repo.get_active_conversation(user_id)
+            conv = await self._repo.create_conversation(user_id, self._config.default_model)
         return conv["id"], conv
 
-    async def _get_memory_prompt(self, user_id: int) -> str:
-        facts = await self._repo.get_user_facts(user_id, limit=30)
+    async def _prepare_turn(self, user_id: int, user_message: str) -> tuple[int, dict, list[dict], str]:
+        """Return (conv_id, conv, history, memory_prompt) for a new user message.
+
+        Conversation, recent history and user facts are loaded in a single query.
+        The message itself is appended to history here and stored by
+        Repository.finalize_turn together with the answer.
+        """
+        max_messages = self._config.max_context_messages
+        memory_prompt = self._cached_memory_prompt(user_id)
+        facts_version = self._repo.facts_version(user_id)
+        # history is trimmed to the char budget in SQL; the new message counts towards it
+        max_chars = self._max_chars - len(user_message)
+        ctx = await self._repo.get_chat_context(
+            user_id, max_messages, max_facts=30 if memory_prompt is None else 0, max_chars=max(max_chars, 0),
+        )
+        if memory_prompt is None:
+            memory_prompt = self._format_memory_prompt(ctx["facts"])
+            self._store_memory_prompt(user_id, facts_version, memory_prompt)
+        conv = ctx["conversation"]
+        if conv is None:
+            conv = await self._repo.create_conversation(user_id, self._config.default_model)
+        history = (ctx["messages"] + [{"role": "user", "content": user_message}])[-max_messages:]
+        return conv["id"], conv, history, memory_prompt
+
+    def _cached_memory_prompt(self, user_id: int) -> str | None:
+        """Return cached memory prompt if it is fresh and facts haven't changed."""
+        entry = self._memory_cache.get(user_id)
+        if entry is None:
+            return None
+        ts, version, prompt = entry
+        if time.monotonic() - ts >= MEMORY_CACHE_TTL or version != self._repo.facts_version(user_id):
+            return None
+        self._memory_cache.move_to_end(user_id)
+        return prompt
+
+    def _store_memory_prompt(self, user_id: int, version: int, prompt: str) -> None:
+        self._memory_cache[user_id] = (time.monotonic(), version, prompt)
+        self._memory_cache.move_to_end(user_id)
+        if len(self._memory_cache) > MEMORY_CACHE_SIZE:
+            self._memory_cache.popitem(last=False)
+
+    @staticmethod
+    def _format_memory_prompt(facts: list[str]) -> str:
         if not facts:
             return ""
-        lines = ["Known facts about this user (use them to personalize your responses):"]
-        for f in facts:
-            lines.append(f"- {f['fact']}")
-        return "\n".join(lines)
+        return "Known facts about this user (use them to personalize your responses):\n" + "\n".join(
+            f"- {fact}" for fact in facts
+        )
 
     def _build_system_instruction(self, conv: dict, memory_prompt: str = "") -> str:
-        system = conv["system_prompt"]
-        if self._skills_prompt:
-            system += "\n\n" + self._skills_prompt
-        if memory_prompt:
-            system += "\n\n" + memory_prompt
+        # memory_prompt is usually the same cached str object, so hashing it is O(1)
+        key = (conv["id"], self._skills_version, memory_prompt)
+        cached = self._sys_cache.get(key)
+        if cached is not None and cached[0] == conv["system_prompt"]:
+            self._sys_cache.move_to_end(key)
+            return cached[1]
+
+        system = "\n\n".join(p for p in (conv["system_prompt"], self._skills_prompt, memory_prompt) if p)
+        self._sys_cache[key] = (conv["system_prompt"], system)
+        self._sys_cache.move_to_end(key)
+        if len(self._sys_cache) > SYSTEM_CACHE_SIZE:
+            self._sys_cache.popitem(last=False)
         return system
 
-    def _build_contents(self, history: list[dict], max_chars: int) -> list[types.Content]:
-        """Convert DB history to Gemini contents format."""
-        contents: list[types.Content] = []
-        total_chars = 0
-
-        for msg in reversed(history):
-            total_chars += len(msg["content"])
-            if total_chars > max_chars:
-                break
-            role = "model" if msg["role"] == "assistant" else "user"
-            contents.insert(0, types.Content(
-                role=role,
-                parts=[types.Part.from_text(text=msg["content"])],
-            ))
-        return contents
+    def _build_contents(self, history: list[dict]) -> list[types.Content]:
+        """Convert DB history (already trimmed to the char budget) to Gemini contents format."""
+        content, part_from_text, role_of = types.Content, types.Part.from_text, _GEMINI_ROLES.get
+        return [
+            content(role=role_of(msg["role"], "user"), parts=[part_from_text(text=msg["content"])])
+            for msg in history
+        ]
 
     async def _extract_and_save_facts(self, user_id: int, user_message: str, assistant_response: str) -> None:
         try:
@@ -148,45 +421,29 @@ class GeminiService:
                 return await client.aio.models.generate_content(
                     model=self._config.gemini_model,
                     contents=exchange,
-                    config=types.GenerateContentConfig(
-                        system_instruction=(
-                            "Extract personal facts about the user from this conversation exchange. "
-                            "Only extract FACTUAL info the user explicitly stated about themselves: "
-                            "name, age, location, profession, hobbies, preferences, family, pets, etc. "
-                            "Do NOT extract opinions, questions, or temporary states. "
-                            "Return each fact on a new line, without numbering or bullets. "
-                            "If there are no personal facts, respond with exactly: NONE"
-                        ),
-                        max_output_tokens=200,
-                    ),
+                    config=_FACT_EXTRACT_CONFIG,
                 )
             response = await self._call_with_rotation(_gen)
-            answer = _extract_text(response).strip()
-            if answer.upper() == "NONE" or len(answer) < 3:
+            # fast path: the usual reply is a bare NONE in response.text
+            raw = response.text
+            answer = (raw if raw else _extract_text(response)).strip()
+            if len(answer) < 3 or answer.upper() == "NONE":
                 return
 
-            existing = await self._repo.get_user_facts(user_id, limit=50)
-            existing_texts = {f["fact"].lower() for f in existing}
-
-            for line in answer.splitlines():
-                fact = line.strip().lstrip("-•").strip()
-                if fact and len(fact) > 3 and fact.lower() not in existing_texts:
-                    await self._repo.add_user_fact(user_id, fact)
-                    logger.info("Saved fact for user %d: %s", user_id, fact)
+            facts = [f for f in (line.strip().lstrip("-•").strip() for line in answer.splitlines()) if len(f) > 3]
+            # duplicates of stored facts are skipped by the repository in the same statement
+            added = await self._repo.add_user_facts(user_id, facts)
+            if added:
+                logger.info("Saved %d facts for user %d", added, user_id)
         except Exception:
             logger.debug("Gemini fact extraction failed", exc_info=True)
 
     # ── chat ─────────────────────────────────────────────────────
 
     async def chat(self, user_id: int, user_message: str) -> str:
-        conv_id, conv = await self._ensure_conversation(user_id)
-        await self._repo.add_message(conv_id, "user", user_message)
-
-        memory_prompt = await self._get_memory_prompt(user_id)
-        history = await self._repo.get_messages(conv_id, self._config.max_context_messages)
-        max_chars = self._config.max_context_tokens * 4
-        contents = self._build_contents(history, max_chars)
-        system = self._build_system_instruction(conv, memory_prompt)
+        conv_id, conv, history, memory_prompt = await self._prepare_turn(user_id, user_message)
+        contents = self._build_contents(history)
+        config = types.GenerateContentConfig(system_instruction=self._build_system_instruction(conv, memory_prompt))
 
         logger.info("Gemini chat request: model=%s, messages=%d", self._config.gemini_model, len(contents))
 
@@ -194,7 +451,7 @@ class GeminiService:
             return await client.aio.models.generate_content(
                 model=self._config.gemini_model,
                 contents=contents,
-                config=types.GenerateContentConfig(system_instruction=system),
+                config=config,
             )
         response = await self._call_with_rotation(_gen)
 
@@ -204,59 +461,48 @@ class GeminiService:
             if response.usage_metadata else 0
         )
 
-        await self._repo.add_message(conv_id, "assistant", assistant_text, tokens_used)
-        await self._repo.log_api_usage(user_id, "chat", self._config.gemini_model, tokens_used)
+        self._store_turn(
+            conv_id, user_id, user_message, assistant_text, tokens_used, "chat", self._config.gemini_model,
+        )
 
-        asyncio.create_task(self._extract_and_save_facts(user_id, user_message, assistant_text))
+        self._schedule_fact_extraction(user_id, user_message, assistant_text)
         return assistant_text
 
     # ── chat stream ──────────────────────────────────────────────
 
     async def chat_stream(self, user_id: int, user_message: str, on_chunk) -> str:
-        conv_id, conv = await self._ensure_conversation(user_id)
-        await self._repo.add_message(conv_id, "user", user_message)
-
-        memory_prompt = await self._get_memory_prompt(user_id)
-        history = await self._repo.get_messages(conv_id, self._config.max_context_messages)
-        max_chars = self._config.max_context_tokens * 4
-        contents = self._build_contents(history, max_chars)
-        system = self._build_system_instruction(conv, memory_prompt)
+        conv_id, conv, history, memory_prompt = await self._prepare_turn(user_id, user_message)
+        contents = self._build_contents(history)
+        config = types.GenerateContentConfig(system_instruction=self._build_system_instruction(conv, memory_prompt))
 
-        logger.info("Gemini stream request: model=%s, messages=%d, key=%d", self._config.gemini_model, len(contents), self._current_idx)
+        logger.info("Gemini stream request: model=%s, messages=%d", self._config.gemini_model, len(contents))
 
         def _make_stream(client):
             return client.aio.models.generate_content_stream(
                 model=self._config.gemini_model,
                 contents=contents,
-                config=types.GenerateContentConfig(system_instruction=system),
+                config=config,
             )
 
-        full_text = await self._stream_with_rotation(_make_stream, on_chunk)
-        tokens_est = len(full_text) // 4
-        await self._repo.add_message(conv_id, "assistant", full_text, tokens_est)
-        await self._repo.log_api_usage(user_id, "chat", self._config.gemini_model, tokens_est)
+        usage: dict = {}
+        full_text = await self._stream_with_rotation(_make_stream, on_chunk, usage=usage)
+        tokens_used = usage.get("total_tokens") or estimate_tokens(full_text)
+        self._store_turn(
+            conv_id, user_id, user_message, full_text, tokens_used, "chat", self._config.gemini_model,
+        )
 
-        asyncio.create_task(self._extract_and_save_facts(user_id, user_message, full_text))
+        self._schedule_fact_extraction(user_id, user_message, full_text)
         return full_text
 
     # ── chat with injected search context ────────────────────────
 
     async def chat_with_search(self, user_id: int, user_message: str, search_results: str, on_chunk=None) -> str:
-        conv_id, conv = await self._ensure_conversation(user_id)
-        await self._repo.add_message(conv_id, "user", user_message)
-
-        memory_prompt = await self._get_memory_prompt(user_id)
-        history = await self._repo.get_messages(conv_id, self._config.max_context_messages)
-        max_chars = self._config.max_context_tokens * 4
-        contents = self._build_contents(history, max_chars)
-
-        system = self._build_system_instruction(conv, memory_prompt)
-        system += (
-            "\n\nIMPORTANT: The following data was obtained for the user's query. "
-            "You MUST use it to provide an accurate answer. "
-            "Cite sources with URLs where appropriate.\n\n"
-            f"{search_results}"
-        )
+        conv_id, conv, history, memory_prompt = await self._prepare_turn(user_id, user_message)
+        contents = self._build_contents(history)
+        # the context goes with the question, not into the system instruction: the
+        # instruction + history prefix then stays identical across turns and can be cached
+        contents[-1].parts.insert(0, types.Part.from_text(text=f"{_CONTEXT_HEADER}{search_results}"))
+        config = types.GenerateContentConfig(system_instruction=self._build_system_instruction(conv, memory_prompt))
 
         logger.info("Gemini+context request: model=%s, messages=%d", self._config.gemini_model, len(contents))
 
@@ -265,20 +511,22 @@ class GeminiService:
                 return client.aio.models.generate_content_stream(
                     model=self._config.gemini_model,
                     contents=contents,
-                    config=types.GenerateContentConfig(system_instruction=system),
+                    config=config,
                 )
 
-            full_text = await self._stream_with_rotation(_make_stream, on_chunk)
-            tokens_est = len(full_text) // 4
-            await self._repo.add_message(conv_id, "assistant", full_text, tokens_est)
-            await self._repo.log_api_usage(user_id, "chat", self._config.gemini_model, tokens_est)
+            usage: dict = {}
+            full_text = await self._stream_with_rotation(_make_stream, on_chunk, usage=usage)
+            tokens_used = usage.get("total_tokens") or estimate_tokens(full_text)
+            self._store_turn(
+                conv_id, user_id, user_message, full_text, tokens_used, "chat", self._config.gemini_model,
+            )
             return full_text
         else:
             async def _gen(client):
                 return await client.aio.models.generate_content(
                     model=self._config.gemini_model,
                     contents=contents,
-                    config=types.GenerateContentConfig(system_instruction=system),
+                    config=config,
                 )
             response = await self._call_with_rotation(_gen)
             assistant_text = _extract_text(response)
@@ -286,21 +534,18 @@ class GeminiService:
                 response.usage_metadata.total_token_count
                 if response.usage_metadata else 0
             )
-            await self._repo.add_message(conv_id, "assistant", assistant_text, tokens_used)
-            await self._repo.log_api_usage(user_id, "chat", self._config.gemini_model, tokens_used)
+            self._store_turn(
+                conv_id, user_id, user_message, assistant_text, tokens_used, "chat", self._config.gemini_model,
+            )
             return assistant_text
 
     # ── web search (Google Search grounding) ─────────────────────
 
     async def chat_web_search(self, user_id: int, user_message: str, on_chunk=None) -> str:
-        conv_id, conv = await self._ensure_conversation(user_id)
-        await self._repo.add_message(conv_id, "user", user_message)
-
-        memory_prompt = await self._get_memory_prompt(user_id)
-        history = await self._repo.get_messages(conv_id, self._config.max_context_messages)
-        max_chars = self._config.max_context_tokens * 4
-        contents = self._build_contents(history, max_chars)
+        conv_id, conv, history, memory_prompt = await self._prepare_turn(user_id, user_message)
+        contents = self._build_contents(history)
         system = self._build_system_instruction(conv, memory_prompt)
+        config = types.GenerateContentConfig(system_instruction=system, tools=[_GOOGLE_SEARCH_TOOL])
 
         logger.info("Gemini web_search: model=%s, messages=%d", self._config.gemini_model, len(contents))
 
@@ -308,90 +553,105 @@ class GeminiService:
             return await client.aio.models.generate_content(
                 model=self._config.gemini_model,
                 contents=contents,
-                config=types.GenerateContentConfig(
-                    system_instruction=system,
-                    tools=[types.Tool(google_search=types.GoogleSearch())],
-                ),
+                config=config,
             )
         response = await self._call_with_rotation(_gen)
 
         assistant_text = _extract_text(response)
 
         # extract citations from grounding metadata
-        sources = []
-        if response.candidates:
-            candidate = response.candidates[0]
-            gm = candidate.grounding_metadata
-            if gm and gm.grounding_chunks:
-                for gc in gm.grounding_chunks:
-                    if gc.web and gc.web.uri:
-                        title = gc.web.title or gc.web.uri
-                        sources.append(f"[{title}]({gc.web.uri})")
-
-        if sources:
-            unique_sources = list(dict.fromkeys(sources))[:5]
-            assistant_text += "\n\nИсточники:\n" + "\n".join(f"• {s}" for s in unique_sources)
+        sources: list[str] = []
+        _collect_sources(response, sources, set())
+        assistant_text = append_sources(assistant_text, sources)
 
         tokens_used = (
             response.usage_metadata.total_token_count
-            if response.usage_metadata else len(assistant_text) // 4
+            if response.usage_metadata else estimate_tokens(assistant_text)
+        )
+        self._store_turn(
+            conv_id, user_id, user_message, assistant_text, tokens_used, "web_search", self._config.gemini_model,
         )
-        await self._repo.add_message(conv_id, "assistant", assistant_text, tokens_used)
-        await self._repo.log_api_usage(user_id, "web_search", self._config.gemini_model, tokens_used)
 
         if on_chunk:
             await on_chunk(assistant_text)
 
         return assistant_text
 
-    # ── should_search ────────────────────────────────────────────
+    # ── chat with search as a tool ───────────────────────────────
 
-    async def should_search(self, user_message: str) -> bool:
-        async def _gen(client):
-            return await client.aio.models.generate_content(
+    async def chat_auto(self, user_id: int, user_message: str, on_chunk) -> str:
+        """Stream a reply with Google Search available as a tool.
+
+        The model decides itself whether to ground the answer in search
+        results, so no separate routing request is needed.
+        """
+        conv_id, conv, history, memory_prompt = await self._prepare_turn(user_id, user_message)
+        contents = self._build_contents(history)
+        system = self._build_system_instruction(conv, memory_prompt)
+        config = types.GenerateContentConfig(system_instruction=system, tools=[_GOOGLE_SEARCH_TOOL])
+
+        logger.info("Gemini auto request: model=%s, messages=%d", self._config.gemini_model, len(contents))
+
+        def _make_stream(client):
+            return client.aio.models.generate_content_stream(
                 model=self._config.gemini_model,
-                contents=user_message,
-                config=types.GenerateContentConfig(
-                    system_instruction=(
-                        "You decide if a web search is needed to answer the user's message. "
-                        "If the message asks about current events, real-time data, recent news, "
-                        "specific facts you might not know, prices, weather, or anything that "
-                        "requires up-to-date information — respond with ONLY the word YES. "
-                        "If no search is needed (general chat, coding, math, creative tasks) — respond with ONLY the word NO. "
-                        "Never explain, just output YES or NO."
-                    ),
-                    max_output_tokens=10,
-                ),
+                contents=contents,
+                config=config,
             )
-        response = await self._call_with_rotation(_gen)
-        answer = _extract_text(response).strip().upper()
-        return answer == "YES"
+
+        sources: list[str] = []
+        usage: dict = {}
+        full_text = await self._stream_with_rotation(_make_stream, on_chunk, sources=sources, usage=usage)
+        if sources:
+            full_text = append_sources(full_text, sources)
+            logger.info("Gemini used Google Search: %d sources", len(sources))
+
+        tokens_used = usage.get("total_tokens") or estimate_tokens(full_text)
+        self._store_turn(
+            conv_id, user_id, user_message, full_text, tokens_used,
+            "web_search" if sources else "chat", self._config.gemini_model,
+        )
+
+        self._schedule_fact_extraction(user_id, user_message, full_text)
+        return full_text
 
     # ── vision ───────────────────────────────────────────────────
 
-    async def chat_vision(self, user_id: int, image_url: str, caption: str = "") -> str:
-        conv_id, conv = await self._ensure_conversation(user_id)
-        text = caption or "What do you see in this image?"
-        await self._repo.add_message(conv_id, "user", text, content_type="vision", image_url=image_url)
+    async def _download_image(self, image_url: str) -> tuple[bytes, str]:
+        """Download an image and return (bytes, mime type).
 
-        # download the image
-        async with httpx.AsyncClient() as http:
-            img_resp = await http.get(image_url)
+        The body is streamed and the download aborted once it exceeds MAX_IMAGE_BYTES.
+        """
+        async with self._http.stream("GET", image_url) as img_resp:
             img_resp.raise_for_status()
-            image_bytes = img_resp.content
+            declared = img_resp.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > MAX_IMAGE_BYTES:
+                raise ValueError(f"Image too large: {declared} bytes")
+            chunks: list[bytes] = []
+            size = 0
+            async for chunk in img_resp.aiter_bytes():
+                size += len(chunk)
+                if size > MAX_IMAGE_BYTES:
+                    raise ValueError(f"Image too large: over {MAX_IMAGE_BYTES} bytes")
+                chunks.append(chunk)
+        image_bytes = b"".join(chunks)
+        # Telegram often returns application/octet-stream — trust the magic bytes first
+        content_type = _sniff_mime(image_bytes)
+        if content_type is None:
             content_type = img_resp.headers.get("content-type", "image/jpeg")
-
-        # Telegram often returns application/octet-stream — detect from URL
-        if "octet-stream" in content_type:
-            url_lower = image_url.lower()
-            if ".png" in url_lower:
-                content_type = "image/png"
-            elif ".webp" in url_lower:
-                content_type = "image/webp"
-            else:
+            if "octet-stream" in content_type:
                 content_type = "image/jpeg"
+        return image_bytes, content_type
 
-        system = self._build_system_instruction(conv)
+    async def chat_vision(self, user_id: int, image_url: str, caption: str = "") -> str:
+        text = caption or "What do you see in this image?"
+
+        # download the image while the conversation is looked up
+        (conv_id, conv), (image_bytes, content_type) = await asyncio.gather(
+            self._ensure_conversation(user_id), self._download_image(image_url),
+        )
+
+        config = types.GenerateContentConfig(system_instruction=self._build_system_instruction(conv))
 
         parts = [
             types.Part.from_bytes(data=image_bytes, mime_type=content_type),
@@ -405,7 +665,7 @@ class GeminiService:
             return await client.aio.models.generate_content(
                 model=self._config.gemini_model,
                 contents=types.Content(role="user", parts=parts),
-                config=types.GenerateContentConfig(system_instruction=system),
+                config=config,
             )
         response = await self._call_with_rotation(_gen)
 
@@ -415,8 +675,10 @@ class GeminiService:
             if response.usage_metadata else 0
         )
 
-        await self._repo.add_message(conv_id, "assistant", assistant_text, tokens_used)
-        await self._repo.log_api_usage(user_id, "vision", self._config.gemini_model, tokens_used)
+        self._store_turn(
+            conv_id, user_id, text, assistant_text, tokens_used, "vision", self._config.gemini_model,
+            content_type="vision", image_url=image_url,
+        )
         return assistant_text
 
     # ── image generation ─────────────────────────────────────────
@@ -429,9 +691,7 @@ class GeminiService:
             return await client.aio.models.generate_content(
                 model="gemini-2.0-flash-exp",
                 contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_modalities=["IMAGE", "TEXT"],
-                ),
+                config=_IMAGE_GEN_CONFIG,
             )
         response = await self._call_with_rotation(_gen)
 
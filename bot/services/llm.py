@@ -2,13 +2,24 @@ from __future__ import annotations
 
 import asyncio
 import base64
+import functools
+import hashlib
+import importlib.util
+import json
 import logging
+import re
+import time
+from collections import OrderedDict
 from typing import TYPE_CHECKING
 
+import httpx
 from openai import AsyncOpenAI
 
 from bot.config import Config
 from bot.database.repository import Repository
+from bot.services.rate_limiter import AsyncTokenBucket
+from bot.services.streaming import STREAM_CURSOR, CoalescingEditor
+from bot.utils import append_sources, estimate_tokens, likely_has_facts
 
 if TYPE_CHECKING:
     from bot.services.gemini import GeminiService
@@ -18,55 +29,423 @@ logger = logging.getLogger(__name__)
 # minimum interval between message edits (Telegram rate limit)
 STREAM_EDIT_INTERVAL = 1.5
 
+_FACT_EXTRACT_MSG = {"role": "system", "content": (
+    "Extract personal facts about the user from this conversation exchange. "
+    "Only extract FACTUAL info the user explicitly stated about themselves: "
+    "name, age, location, profession, hobbies, preferences, family, pets, etc. "
+    "Do NOT extract opinions, questions, or temporary states. "
+    "Return each fact on a new line, without numbering or bullets. "
+    "If there are no personal facts, respond with exactly: NONE"
+)}
+_SHOULD_SEARCH_MSG = {"role": "system", "content": (
+    "You decide if a web search is needed to answer the user's message. "
+    "If the message asks about current events, real-time data, recent news, "
+    "specific facts you might not know, prices, weather, or anything that "
+    "requires up-to-date information — respond with ONLY the word YES. "
+    "If no search is needed (general chat, coding, math, creative tasks) — respond with ONLY the word NO. "
+    "Never explain, just output YES or NO."
+)}
+_ROUTE_AND_FACTS_MSG = {"role": "system", "content": (
+    "You handle two tasks for the user's message and answer with a JSON object.\n"
+    "1. \"search\": \"YES\" if answering needs a web search (current events, real-time data, "
+    "recent news, prices, weather, specific facts you might not know), otherwise \"NO\".\n"
+    "2. \"facts\": a list of personal facts the user explicitly stated about themselves "
+    "(name, age, location, profession, hobbies, preferences, family, pets, etc.). "
+    "No opinions, questions or temporary states. Use an empty list if there are none.\n"
+    "Example: {\"search\": \"NO\", \"facts\": [\"Lives in Berlin\"]}"
+)}
+# appended to non-streamed chats so facts come back with the answer instead of a second request
+_FACTS_TRAILER_MSG = {"role": "system", "content": (
+    "After your reply, on a new line, add a <facts></facts> block listing personal facts "
+    "the user explicitly stated about themselves in their last message (name, age, location, "
+    "profession, hobbies, preferences, family, pets, etc.), one per line. "
+    "No opinions, questions or temporary states. Leave the block empty if there are none."
+)}
+_FACTS_BLOCK_RE = re.compile(r"\s*<facts>(.*?)(?:</facts>|$)", re.S)
+
+# per-user memory prompt cache (invalidated early by Repository.facts_version)
+MEMORY_CACHE_TTL = 60
+MEMORY_CACHE_SIZE = 10_000
+SYSTEM_CACHE_SIZE = 4096
+
+# search decisions for repeated messages (text -> YES/NO), LRU-ordered
+SEARCH_CACHE_SIZE = 2048
+SEARCH_CACHE_MAX_LEN = 300
+
+# obvious search decisions decided locally, without a model call
+_SEARCH_HINT_RE = re.compile(
+    r"https?://|\b(weather|forecast|prices?|stocks?|exchange rate|today|tonight|news|latest)\b"
+    r"|\b(погод|прогноз|новост|сегодн|стоимост|котировк|курс (доллар|евро|юан|рубл|валют|бит))",
+    re.IGNORECASE,
+)
+_CODE_HINT_RE = re.compile(r"```|^\s*(def|class|import|from|function|const|let|SELECT)\s", re.MULTILINE)
+SEARCH_HINT_MIN_LEN = 16  # shorter messages without a hint are greetings and small talk
+
+MAX_SOURCES = 5  # citations appended to web search answers
+
+# recently sent images (Telegram file URL -> data URL) for follow-up photos of the same file
+IMAGE_CACHE_TTL = 300
+IMAGE_CACHE_SIZE = 16
+# Telegram bots can't download files larger than this anyway
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+
+# answers of non-streamed chats keyed by user and the exact request (prompt, history, message)
+RESPONSE_CACHE_TTL = 600
+RESPONSE_CACHE_SIZE = 2048
+
+# max concurrent background tasks (fact extraction) per service
+BACKGROUND_CONCURRENCY = 4
+
+# one pooled client for all OpenAI calls; HTTP/2 multiplexes concurrent streams when h2 is installed
+_OPENAI_HTTP2 = importlib.util.find_spec("h2") is not None
+OPENAI_TIMEOUT = httpx.Timeout(120, connect=5)
+OPENAI_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=60)
+
+
+def _response_sources(response) -> list[str]:
+    """Unique url citations of a Responses API answer, up to MAX_SOURCES."""
+    sources: list[str] = []
+    seen: set[str] = set()
+    for item in response.output:
+        for block in getattr(item, "content", None) or ():
+            for ann in getattr(block, "annotations", None) or ():
+                url = getattr(ann, "url", None)
+                if url and hasattr(ann, "title") and url not in seen:
+                    seen.add(url)
+                    sources.append(f"[{ann.title}]({url})")
+                    if len(sources) >= MAX_SOURCES:
+                        return sources
+    return sources
+
+
+def _search_hint(text: str) -> bool | None:
+    """Decide locally whether to search when the answer is obvious, None if the model must decide."""
+    if _SEARCH_HINT_RE.search(text):
+        return True
+    if len(text) < SEARCH_HINT_MIN_LEN or _CODE_HINT_RE.search(text):
+        return False
+    return None
+
+
+def _split_facts_block(text: str) -> tuple[str, list[str]]:
+    """Strip the <facts> block requested by _FACTS_TRAILER_MSG and return (reply, facts)."""
+    match = _FACTS_BLOCK_RE.search(text)
+    if match is None:
+        return text, []
+    facts = [line.strip().lstrip("-•").strip() for line in match.group(1).splitlines()]
+    reply = (text[:match.start()] + text[match.end():]).rstrip()
+    return reply, [f for f in facts if f and f.upper() != "NONE"]
+
+
+def _single_flight(method):
+    """Coalesce concurrent identical requests (same user, same text arguments) into one.
+
+    A double-tapped or re-sent message while the first one is still being
+    answered waits for that answer instead of paying for a second request;
+    only the first call streams progress and stores the exchange.
+    """
+    @functools.wraps(method)
+    async def wrapper(self: LLMService, user_id: int, *args, **kwargs):
+        key = (method.__name__, user_id, *(a for a in (*args, *kwargs.values()) if isinstance(a, str)))
+        pending = self._inflight_calls.get(key)
+        if pending is not None:
+            logger.info("Coalescing duplicate %s request for user %d", method.__name__, user_id)
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight_calls[key] = future
+        try:
+            await self._wait_stored(user_id)  # history must include the previous answer
+            result = await method(self, user_id, *args, **kwargs)
+        except BaseException as e:
+            # waiters weren't cancelled themselves, so they get an ordinary error instead
+            if isinstance(e, asyncio.CancelledError):
+                e = RuntimeError("request cancelled")
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight_calls[key]
+
+    return wrapper
+
+
+async def _consume_stream(stream, on_chunk, usage: dict | None = None) -> str:
+    """Read an OpenAI completion stream, editing the message via on_chunk as it grows.
+
+    If usage is given, the token count reported in the final chunk
+    (stream_options include_usage) is stored in it as "total_tokens".
+    """
+    editor = CoalescingEditor(on_chunk, suffix=STREAM_CURSOR)
+    loop_time = asyncio.get_running_loop().time
+    parts: list[str] = []  # joined only when emitting, avoids O(n²) concatenation
+    last_edit = 0
+    try:
+        async for chunk in stream:
+            chunk_usage = getattr(chunk, "usage", None)
+            if chunk_usage is not None and usage is not None:
+                usage["total_tokens"] = chunk_usage.total_tokens
+            if not chunk.choices:  # the usage chunk has no choices
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+
+            now = loop_time()
+            if now - last_edit >= STREAM_EDIT_INTERVAL and parts:
+                editor.update("".join(parts))
+                last_edit = now
+    except Exception:
+        editor.cancel()
+        raise
+
+    full_text = "".join(parts)
+    if full_text:
+        await editor.finish(full_text)
+    return full_text
+
+
+async def _capped(chunks, limit: int):
+    """Pass an async byte stream through, raising ValueError once it exceeds limit bytes."""
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > limit:
+            raise ValueError(f"Image too large: over {limit} bytes")
+        yield chunk
+
+
+async def _b64_encode_stream(chunks) -> str:
+    """Base64-encode an async byte stream without holding the raw body in memory."""
+    out = bytearray()
+    tail = b""
+    async for chunk in chunks:
+        data = tail + chunk
+        cut = len(data) - len(data) % 3  # 3-byte groups encode without padding
+        out += base64.b64encode(data[:cut])
+        tail = data[cut:]
+    out += base64.b64encode(tail)
+    return out.decode("ascii")
+
 
 class LLMService:
     def __init__(self, config: Config, repo: Repository, gemini: GeminiService | None = None) -> None:
         self._client = AsyncOpenAI(
             api_key=config.openai_api_key,
             base_url=config.openai_base_url,
+            http_client=httpx.AsyncClient(http2=_OPENAI_HTTP2, timeout=OPENAI_TIMEOUT, limits=OPENAI_LIMITS),
         )
         self._config = config
+        # history budget, ~4 chars per token
+        self._max_chars = config.max_context_tokens * 4
         self._repo = repo
         self._gemini = gemini
+        # client-side admission control so bursts queue here instead of failing with 429
+        self._openai_sem = asyncio.Semaphore(max(config.openai_max_concurrency, 1))
+        self._rpm_bucket = AsyncTokenBucket(config.openai_rpm, 60) if config.openai_rpm > 0 else None
+        self._tpm_bucket = AsyncTokenBucket(config.openai_tpm, 60) if config.openai_tpm > 0 else None
+        # shared pool for image downloads (keep-alive instead of a TLS handshake per photo)
+        self._http = httpx.AsyncClient(
+            timeout=30, limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60),
+        )
         self._skills_prompt: str = ""
+        self._skills_version = 0
+        # (conv_id, skills_version, memory_prompt) -> (base system_prompt, full system prompt)
+        self._sys_cache: OrderedDict[tuple[int, int, str], tuple[str, str]] = OrderedDict()
+        self._search_decisions: OrderedDict[str, bool] = OrderedDict()
+        # image_url -> (created_at, data URL), LRU-ordered
+        self._image_cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        # request digest -> (created_at, answer, tokens used, extracted facts), LRU-ordered
+        self._resp_cache: OrderedDict[str, tuple[float, str, int, list[str]]] = OrderedDict()
+        # (method, user_id, text args) -> answer of the request in flight, see _single_flight
+        self._inflight_calls: dict[tuple, asyncio.Future] = {}
+        # user_id -> (created_at, facts_version, prompt), LRU-ordered
+        self._memory_cache: OrderedDict[int, tuple[float, int, str]] = OrderedDict()
+        # background work (fact extraction) is bounded so it can't starve user requests
+        self._bg_sem = asyncio.Semaphore(BACKGROUND_CONCURRENCY)
+        self._bg_tasks: set[asyncio.Task] = set()
+        # users with a fact extraction queued or running
+        self._fact_pending: set[int] = set()
+        # user_id -> exchange still being written, see _store_turn
+        self._pending_turns: dict[int, asyncio.Task] = {}
 
     def set_skills_prompt(self, prompt: str) -> None:
         """Set skills context to inject into system prompt."""
         self._skills_prompt = prompt
+        self._skills_version += 1
         if self._gemini:
             self._gemini.set_skills_prompt(prompt)
 
+    def _spawn_bg(self, coro) -> None:
+        """Run coro in the background, at most BACKGROUND_CONCURRENCY at a time."""
+        async def _run():
+            async with self._bg_sem:
+                await coro
+
+        task = asyncio.create_task(_run())
+        self._bg_tasks.add(task)
+        task.add_done_callback(self._bg_tasks.discard)
+
+    def _schedule_fact_extraction(self, user_id: int, user_message: str, reply: str) -> None:
+        """Extract facts in the background, at most one extraction per user at a time.
+
+        A message that arrives while the previous one is still being processed
+        is skipped; consecutive messages rarely state new facts.
+        """
+        if user_id in self._fact_pending or not likely_has_facts(user_message):
+            return
+        self._fact_pending.add(user_id)
+
+        async def _extract():
+            try:
+                await self._extract_and_save_facts(user_id, user_message, reply)
+            finally:
+                self._fact_pending.discard(user_id)
+
+        self._spawn_bg(_extract())
+
+    def _store_turn(self, conv_id: int, user_id: int, *args, **kwargs) -> None:
+        """Write the exchange in the background so the reply isn't held up by the DB.
+
+        The next request of the same user waits for it (see _wait_stored),
+        so its history always includes this exchange.
+        """
+        task = asyncio.create_task(self._repo.finalize_turn(conv_id, user_id, *args, **kwargs))
+        self._pending_turns[user_id] = task
+        self._bg_tasks.add(task)
+
+        def _done(t: asyncio.Task) -> None:
+            self._bg_tasks.discard(t)
+            if self._pending_turns.get(user_id) is t:
+                del self._pending_turns[user_id]
+            if not t.cancelled() and t.exception() is not None:
+                logger.error("Failed to store exchange for user %d: %s", user_id, t.exception())
+
+        task.add_done_callback(_done)
+
+    async def _wait_stored(self, user_id: int) -> None:
+        """Wait until the user's previous exchange is in the database."""
+        task = self._pending_turns.get(user_id)
+        if task is not None:
+            await asyncio.wait([task])
+        if self._gemini:
+            await self._gemini._wait_stored(user_id)
+
+    async def _throttle(self, kwargs: dict) -> None:
+        """Wait for the RPM/TPM buckets before a request with these arguments."""
+        if self._rpm_bucket:
+            await self._rpm_bucket.acquire()
+        if self._tpm_bucket:
+            prompt = kwargs.get("messages") or kwargs.get("input") or kwargs.get("prompt") or ""
+            if isinstance(prompt, list):
+                prompt = "".join(m["content"] for m in prompt if isinstance(m.get("content"), str))
+            await self._tpm_bucket.acquire(estimate_tokens(prompt) + 1)
+
+    async def _request(self, create, **kwargs):
+        """Call an OpenAI endpoint within the concurrency and RPM/TPM limits."""
+        async with self._openai_sem:
+            await self._throttle(kwargs)
+            return await create(**kwargs)
+
+    async def _request_stream(self, on_chunk, usage: dict, **kwargs) -> str:
+        """Stream a chat completion into on_chunk and return the full text.
+
+        The concurrency permit is held until the stream is read to the end,
+        not just until the response headers arrive.
+        """
+        async with self._openai_sem:
+            await self._throttle(kwargs)
+            stream = await self._client.chat.completions.create(
+                stream=True, stream_options={"include_usage": True}, **kwargs,
+            )
+            return await _consume_stream(stream, on_chunk, usage)
+
+    async def prewarm(self) -> None:
+        """Open a keep-alive connection to the OpenAI API so the first user request skips the handshake."""
+        try:
+            await asyncio.wait_for(self._client.models.list(), timeout=3)
+        except Exception as e:
+            logger.debug("OpenAI prewarm failed: %s", e)
+
+    async def aclose(self) -> None:
+        """Wait for pending background tasks and close HTTP connections (call on shutdown)."""
+        await asyncio.gather(*self._bg_tasks, return_exceptions=True)
+        await self._http.aclose()
+        await self._client.close()
+        if self._gemini:
+            await self._gemini.aclose()
+
     async def check_limits(self, user_id: int) -> str | None:
         """Return error message if limits exceeded, None otherwise."""
         cfg = self._config
-        if cfg.daily_token_limit > 0:
-            daily = await self._repo.get_daily_tokens(user_id)
-            if daily >= cfg.daily_token_limit:
-                return f"Daily token limit reached ({cfg.daily_token_limit:,} tokens). Try again tomorrow."
-        if cfg.monthly_token_limit > 0:
-            monthly = await self._repo.get_monthly_tokens(user_id)
-            if monthly >= cfg.monthly_token_limit:
-                return f"Monthly token limit reached ({cfg.monthly_token_limit:,} tokens)."
+        if cfg.daily_token_limit <= 0 and cfg.monthly_token_limit <= 0:
+            return None
+        # totals come from the repository's in-memory counters, not a query per message
+        daily, monthly = await self._repo.get_usage_totals(user_id)
+        if 0 < cfg.daily_token_limit <= daily:
+            return f"Daily token limit reached ({cfg.daily_token_limit:,} tokens). Try again tomorrow."
+        if 0 < cfg.monthly_token_limit <= monthly:
+            return f"Monthly token limit reached ({cfg.monthly_token_limit:,} tokens)."
         return None
 
     async def _ensure_conversation(self, user_id: int) -> tuple[int, dict]:
         conv = await self._repo.get_active_conversation(user_id)
         if conv is None:
-            conv_id = await self._repo.create_conversation(user_id, self._config.default_model)
-            conv = await self._repo.get_active_conversation(user_id)
-        else:
-            conv_id = conv["id"]
-        return conv_id, conv
+            conv = await self._repo.create_conversation(user_id, self._config.default_model)
+        return conv["id"], conv
+
+    async def _prepare_turn(self, user_id: int, user_message: str) -> tuple[int, dict, list[dict], str]:
+        """Return (conv_id, conv, history, memory_prompt) for a new user message.
+
+        Conversation, recent history and user facts are loaded in a single query.
+        The message itself is appended to history here and stored by
+        Repository.finalize_turn together with the answer.
+        """
+        max_messages = self._config.max_context_messages
+        memory_prompt = self._cached_memory_prompt(user_id)
+        facts_version = self._repo.facts_version(user_id)
+        # history is trimmed to the char budget in SQL; the new message counts towards it
+        max_chars = self._max_chars - len(user_message)
+        ctx = await self._repo.get_chat_context(
+            user_id, max_messages, max_facts=30 if memory_prompt is None else 0, max_chars=max(max_chars, 0),
+        )
+        if memory_prompt is None:
+            memory_prompt = self._format_memory_prompt(ctx["facts"])
+            self._store_memory_prompt(user_id, facts_version, memory_prompt)
+        conv = ctx["conversation"]
+        if conv is None:
+            conv = await self._repo.create_conversation(user_id, self._config.default_model)
+        history = (ctx["messages"] + [{"role": "user", "content": user_message}])[-max_messages:]
+        return conv["id"], conv, history, memory_prompt
+
+    def _cached_memory_prompt(self, user_id: int) -> str | None:
+        """Return cached memory prompt if it is fresh and facts haven't changed."""
+        entry = self._memory_cache.get(user_id)
+        if entry is None:
+            return None
+        ts, version, prompt = entry
+        if time.monotonic() - ts >= MEMORY_CACHE_TTL or version != self._repo.facts_version(user_id):
+            return None
+        self._memory_cache.move_to_end(user_id)
+        return prompt
 
-    async def _get_memory_prompt(self, user_id: int) -> str:
+    def _store_memory_prompt(self, user_id: int, version: int, prompt: str) -> None:
+        self._memory_cache[user_id] = (time.monotonic(), version, prompt)
+        self._memory_cache.move_to_end(user_id)
+        if len(self._memory_cache) > MEMORY_CACHE_SIZE:
+            self._memory_cache.popitem(last=False)
+
+    @staticmethod
+    def _format_memory_prompt(facts: list[str]) -> str:
         """Build memory context from stored user facts."""
-        facts = await self._repo.get_user_facts(user_id, limit=30)
         if not facts:
             return ""
-        lines = ["Known facts about this user (use them to personalize your responses):"]
-        for f in facts:
-            lines.append(f"- {f['fact']}")
-        return "\n".join(lines)
+        return "Known facts about this user (use them to personalize your responses):\n" + "\n".join(
+            f"- {fact}" for fact in facts
+        )
 
     async def _extract_and_save_facts(self, user_id: int, user_message: str, assistant_response: str) -> None:
         """Ask LLM to extract personal facts from the conversation."""
@@ -74,94 +453,113 @@ class LLMService:
             await self._gemini._extract_and_save_facts(user_id, user_message, assistant_response)
             return
         try:
-            response = await self._client.chat.completions.create(
+            response = await self._request(
+                self._client.chat.completions.create,
                 model="gpt-4o-mini",
                 messages=[
-                    {"role": "system", "content": (
-                        "Extract personal facts about the user from this conversation exchange. "
-                        "Only extract FACTUAL info the user explicitly stated about themselves: "
-                        "name, age, location, profession, hobbies, preferences, family, pets, etc. "
-                        "Do NOT extract opinions, questions, or temporary states. "
-                        "Return each fact on a new line, without numbering or bullets. "
-                        "If there are no personal facts, respond with exactly: NONE"
-                    )},
+                    _FACT_EXTRACT_MSG,
                     {"role": "user", "content": f"User said: {user_message}\nAssistant replied: {assistant_response[:500]}"},
                 ],
-                max_tokens=200,
+                max_tokens=120,
+                stop=["\n\n"],  # facts are one per line; a blank line means the model started explaining
             )
             answer = response.choices[0].message.content.strip()
             if answer.upper() == "NONE" or len(answer) < 3:
                 return
 
-            existing = await self._repo.get_user_facts(user_id, limit=50)
-            existing_texts = {f["fact"].lower() for f in existing}
-
-            for line in answer.splitlines():
-                fact = line.strip().lstrip("-•").strip()
-                if fact and len(fact) > 3 and fact.lower() not in existing_texts:
-                    await self._repo.add_user_fact(user_id, fact)
-                    logger.info("Saved fact for user %d: %s", user_id, fact)
+            await self._save_facts(user_id, [line.strip().lstrip("-•").strip() for line in answer.splitlines()])
         except Exception:
             logger.debug("Failed to extract facts", exc_info=True)
 
+    async def _save_facts(self, user_id: int, facts: list[str]) -> None:
+        facts = [f for f in facts if len(f) > 3]
+        try:
+            # duplicates of stored facts are skipped by the repository in the same statement
+            added = await self._repo.add_user_facts(user_id, facts)
+        except Exception:
+            logger.debug("Failed to save facts", exc_info=True)
+            return
+        if added:
+            logger.info("Saved %d facts for user %d", added, user_id)
+
+    def _build_system_prompt(self, conv: dict, memory_prompt: str = "") -> str:
+        # memory_prompt is usually the same cached str object, so hashing it is O(1)
+        key = (conv["id"], self._skills_version, memory_prompt)
+        cached = self._sys_cache.get(key)
+        if cached is not None and cached[0] == conv["system_prompt"]:
+            self._sys_cache.move_to_end(key)
+            return cached[1]
+
+        system = "\n\n".join(p for p in (conv["system_prompt"], self._skills_prompt, memory_prompt) if p)
+        self._sys_cache[key] = (conv["system_prompt"], system)
+        self._sys_cache.move_to_end(key)
+        if len(self._sys_cache) > SYSTEM_CACHE_SIZE:
+            self._sys_cache.popitem(last=False)
+        return system
+
     def _build_messages(self, conv: dict, history: list[dict], memory_prompt: str = "") -> list[dict]:
-        system = conv["system_prompt"]
-        if self._skills_prompt:
-            system += "\n\n" + self._skills_prompt
-        if memory_prompt:
-            system += "\n\n" + memory_prompt
+        """System prompt + history (already trimmed to the char budget by _prepare_turn)."""
+        system = self._build_system_prompt(conv, memory_prompt)
+        # Vision messages from history: include only the text caption.
+        # Never re-send the image URL — Telegram URLs expire quickly and
+        # cause BadRequestError: invalid_image_url on subsequent calls.
         messages: list[dict] = [{"role": "system", "content": system}]
-        total_chars = len(conv["system_prompt"])
-        max_chars = self._config.max_context_tokens * 4
-
-        for msg in reversed(history):
-            total_chars += len(msg["content"])
-            if total_chars > max_chars:
-                break
-            # Vision messages from history: include only the text caption.
-            # Never re-send the image URL — Telegram URLs expire quickly and
-            # cause BadRequestError: invalid_image_url on subsequent calls.
-            messages.insert(1, {"role": msg["role"], "content": msg["content"]})
-
+        messages.extend({"role": msg["role"], "content": msg["content"]} for msg in history)
         return messages
 
-    async def _delete_last_user_message(self, conv_id: int) -> None:
-        """Delete the last user message (used for Gemini fallback cleanup)."""
-        await self._repo.delete_last_user_message(conv_id)
-
-    async def chat(self, user_id: int, user_message: str) -> str:
+    @_single_flight
+    async def chat(self, user_id: int, user_message: str, cached: bool = True) -> str:
+        """Answer without streaming. cached=False skips the response cache (used by retry)."""
         if self._gemini:
             try:
                 return await self._gemini.chat(user_id, user_message)
             except Exception as e:
                 logger.warning("Gemini chat failed (%s), falling back to OpenAI", e)
-                # Gemini added user message before failing — remove it
-                conv_id, _ = await self._ensure_conversation(user_id)
-                await self._delete_last_user_message(conv_id)
 
-        return await self._chat_openai(user_id, user_message)
-
-    async def _chat_openai(self, user_id: int, user_message: str) -> str:
-        conv_id, conv = await self._ensure_conversation(user_id)
-        await self._repo.add_message(conv_id, "user", user_message)
+        return await self._chat_openai(user_id, user_message, cached)
 
-        memory_prompt = await self._get_memory_prompt(user_id)
-        history = await self._repo.get_messages(conv_id, self._config.max_context_messages)
+    async def _chat_openai(self, user_id: int, user_message: str, cached: bool = True) -> str:
+        conv_id, conv, history, memory_prompt = await self._prepare_turn(user_id, user_message)
         messages = self._build_messages(conv, history, memory_prompt)
+        want_facts = likely_has_facts(user_message)
+        if want_facts:
+            messages.append(_FACTS_TRAILER_MSG)
         model = conv["model"]
-        logger.info("LLM request: model=%s, messages=%d", model, len(messages))
 
-        response = await self._client.chat.completions.create(model=model, messages=messages)
+        # the same user repeating a request within the TTL gets the same answer without an API call;
+        # the answer may depend on the user's facts, so it is never shared between users
+        key = hashlib.blake2b(
+            json.dumps([user_id, model, messages], ensure_ascii=False).encode(), digest_size=16,
+        ).hexdigest()
+        hit = self._resp_cache.get(key) if cached else None
+        if hit is not None and time.monotonic() - hit[0] < RESPONSE_CACHE_TTL:
+            self._resp_cache.move_to_end(key)
+            _, assistant_text, tokens_used, facts = hit
+            logger.info("LLM response cache hit: model=%s", model)
+            if facts:
+                self._spawn_bg(self._save_facts(user_id, facts))
+            # logged with the original request's usage, as if it had been answered again
+            self._store_turn(conv_id, user_id, user_message, assistant_text, tokens_used, "chat", model)
+            return assistant_text
+
+        logger.info("LLM request: model=%s, messages=%d", model, len(messages))
+        response = await self._request(self._client.chat.completions.create, model=model, messages=messages)
         assistant_text = response.choices[0].message.content
         tokens_used = response.usage.total_tokens if response.usage else 0
-
-        await self._repo.add_message(conv_id, "assistant", assistant_text, tokens_used)
-        await self._repo.log_api_usage(user_id, "chat", model, tokens_used)
-
-        # extract facts in background
-        asyncio.create_task(self._extract_and_save_facts(user_id, user_message, assistant_text))
+        facts: list[str] = []
+        if want_facts:
+            assistant_text, facts = _split_facts_block(assistant_text)
+            if facts:
+                self._spawn_bg(self._save_facts(user_id, facts))
+
+        self._resp_cache[key] = (time.monotonic(), assistant_text, tokens_used, facts)
+        self._resp_cache.move_to_end(key)
+        if len(self._resp_cache) > RESPONSE_CACHE_SIZE:
+            self._resp_cache.popitem(last=False)
+        self._store_turn(conv_id, user_id, user_message, assistant_text, tokens_used, "chat", model)
         return assistant_text
 
+    @_single_flight
     async def chat_stream(self, user_id: int, user_message: str, on_chunk):
         """Stream chat response, calling on_chunk(accumulated_text) periodically."""
         if self._gemini:
@@ -169,49 +567,27 @@ class LLMService:
                 return await self._gemini.chat_stream(user_id, user_message, on_chunk)
             except Exception as e:
                 logger.warning("Gemini chat_stream failed (%s), falling back to OpenAI", e)
-                conv_id, _ = await self._ensure_conversation(user_id)
-                await self._delete_last_user_message(conv_id)
 
         return await self._chat_stream_openai(user_id, user_message, on_chunk)
 
-    async def _chat_stream_openai(self, user_id: int, user_message: str, on_chunk):
-        conv_id, conv = await self._ensure_conversation(user_id)
-        await self._repo.add_message(conv_id, "user", user_message)
-
-        memory_prompt = await self._get_memory_prompt(user_id)
-        history = await self._repo.get_messages(conv_id, self._config.max_context_messages)
+    async def _chat_stream_openai(self, user_id: int, user_message: str, on_chunk, extract_facts: bool = True):
+        conv_id, conv, history, memory_prompt = await self._prepare_turn(user_id, user_message)
         messages = self._build_messages(conv, history, memory_prompt)
         model = conv["model"]
         logger.info("LLM stream request: model=%s, messages=%d", model, len(messages))
 
-        stream = await self._client.chat.completions.create(
-            model=model, messages=messages, stream=True,
-        )
-
-        full_text = ""
-        last_edit = 0
-        async for chunk in stream:
-            delta = chunk.choices[0].delta.content if chunk.choices[0].delta.content else ""
-            full_text += delta
+        usage: dict = {}
+        full_text = await self._request_stream(on_chunk, usage, model=model, messages=messages)
 
-            now = asyncio.get_running_loop().time()
-            if now - last_edit >= STREAM_EDIT_INTERVAL and full_text:
-                await on_chunk(full_text + " ▌")
-                last_edit = now
-
-        # final update
-        if full_text:
-            await on_chunk(full_text)
-
-        # estimate tokens for streamed response
-        tokens_est = len(full_text) // 4
-        await self._repo.add_message(conv_id, "assistant", full_text, tokens_est)
-        await self._repo.log_api_usage(user_id, "chat", model, tokens_est)
+        tokens_used = usage.get("total_tokens") or estimate_tokens(full_text)
+        self._store_turn(conv_id, user_id, user_message, full_text, tokens_used, "chat", model)
 
         # extract facts in background
-        asyncio.create_task(self._extract_and_save_facts(user_id, user_message, full_text))
+        if extract_facts:
+            self._schedule_fact_extraction(user_id, user_message, full_text)
         return full_text
 
+    @_single_flight
     async def chat_with_search(self, user_id: int, user_message: str, search_results: str, on_chunk=None) -> str:
         """Chat with injected context (skill results, etc.)."""
         if self._gemini:
@@ -219,17 +595,11 @@ class LLMService:
                 return await self._gemini.chat_with_search(user_id, user_message, search_results, on_chunk)
             except Exception as e:
                 logger.warning("Gemini chat_with_search failed (%s), falling back to OpenAI", e)
-                conv_id, _ = await self._ensure_conversation(user_id)
-                await self._delete_last_user_message(conv_id)
 
         return await self._chat_with_search_openai(user_id, user_message, search_results, on_chunk)
 
     async def _chat_with_search_openai(self, user_id: int, user_message: str, search_results: str, on_chunk=None) -> str:
-        conv_id, conv = await self._ensure_conversation(user_id)
-        await self._repo.add_message(conv_id, "user", user_message)
-
-        memory_prompt = await self._get_memory_prompt(user_id)
-        history = await self._repo.get_messages(conv_id, self._config.max_context_messages)
+        conv_id, conv, history, memory_prompt = await self._prepare_turn(user_id, user_message)
         messages = self._build_messages(conv, history, memory_prompt)
 
         # inject context as system message right before the user's question
@@ -245,32 +615,19 @@ class LLMService:
         logger.info("LLM+context request: model=%s, messages=%d", model, len(messages))
 
         if on_chunk:
-            stream = await self._client.chat.completions.create(
-                model=model, messages=messages, stream=True,
-            )
-            full_text = ""
-            last_edit = 0
-            async for chunk in stream:
-                delta = chunk.choices[0].delta.content if chunk.choices[0].delta.content else ""
-                full_text += delta
-                now = asyncio.get_running_loop().time()
-                if now - last_edit >= STREAM_EDIT_INTERVAL and full_text:
-                    await on_chunk(full_text + " ▌")
-                    last_edit = now
-            if full_text:
-                await on_chunk(full_text)
-            tokens_est = len(full_text) // 4
-            await self._repo.add_message(conv_id, "assistant", full_text, tokens_est)
-            await self._repo.log_api_usage(user_id, "chat", model, tokens_est)
+            usage: dict = {}
+            full_text = await self._request_stream(on_chunk, usage, model=model, messages=messages)
+            tokens_used = usage.get("total_tokens") or estimate_tokens(full_text)
+            self._store_turn(conv_id, user_id, user_message, full_text, tokens_used, "chat", model)
             return full_text
         else:
-            response = await self._client.chat.completions.create(model=model, messages=messages)
+            response = await self._request(self._client.chat.completions.create, model=model, messages=messages)
             assistant_text = response.choices[0].message.content
             tokens_used = response.usage.total_tokens if response.usage else 0
-            await self._repo.add_message(conv_id, "assistant", assistant_text, tokens_used)
-            await self._repo.log_api_usage(user_id, "chat", model, tokens_used)
+            self._store_turn(conv_id, user_id, user_message, assistant_text, tokens_used, "chat", model)
             return assistant_text
 
+    @_single_flight
     async def chat_web_search(self, user_id: int, user_message: str, on_chunk=None) -> str:
         """Chat with web search. Tries Gemini (Google Search grounding), falls back to OpenAI."""
         if self._gemini:
@@ -278,137 +635,179 @@ class LLMService:
                 return await self._gemini.chat_web_search(user_id, user_message, on_chunk)
             except Exception as e:
                 logger.warning("Gemini web_search failed (%s), falling back to OpenAI", e)
-                conv_id, _ = await self._ensure_conversation(user_id)
-                await self._delete_last_user_message(conv_id)
 
         return await self._chat_web_search_openai(user_id, user_message, on_chunk)
 
     async def _chat_web_search_openai(self, user_id: int, user_message: str, on_chunk=None) -> str:
         """Chat using OpenAI Responses API with built-in web_search tool."""
-        conv_id, conv = await self._ensure_conversation(user_id)
-        await self._repo.add_message(conv_id, "user", user_message)
-
-        history = await self._repo.get_messages(conv_id, self._config.max_context_messages)
+        conv_id, conv, history, memory_prompt = await self._prepare_turn(user_id, user_message)
         model = conv["model"]
 
-        # build input for Responses API
-        memory_prompt = await self._get_memory_prompt(user_id)
-        system = conv["system_prompt"]
-        if self._skills_prompt:
-            system += "\n\n" + self._skills_prompt
-        if memory_prompt:
-            system += "\n\n" + memory_prompt
-
-        input_messages = [{"role": "system", "content": system}]
-        total_chars = len(system)
-        max_chars = self._config.max_context_tokens * 4
-
-        for msg in reversed(history):
-            total_chars += len(msg["content"])
-            if total_chars > max_chars:
-                break
-            input_messages.insert(1, {"role": msg["role"], "content": msg["content"]})
+        # the Responses API accepts the same message list as chat completions
+        input_messages = self._build_messages(conv, history, memory_prompt)
 
         logger.info("Responses API web_search: model=%s, messages=%d", model, len(input_messages))
 
-        try:
-            response = await self._client.responses.create(
-                model=model,
-                input=input_messages,
-                tools=[{"type": "web_search_preview", "search_context_size": "medium"}],
-                tool_choice="auto",
-            )
-
-            # extract text from response
-            assistant_text = response.output_text
+        response = await self._request(
+            self._client.responses.create,
+            model=model,
+            input=input_messages,
+            tools=[{"type": "web_search_preview", "search_context_size": "medium"}],
+            tool_choice="auto",
+        )
 
-            # extract citations
-            sources = []
-            for item in response.output:
-                if hasattr(item, "content"):
-                    for block in item.content:
-                        if hasattr(block, "annotations"):
-                            for ann in block.annotations:
-                                if hasattr(ann, "url") and hasattr(ann, "title"):
-                                    sources.append(f"[{ann.title}]({ann.url})")
+        # extract text from response
+        assistant_text = response.output_text
 
-            if sources:
-                unique_sources = list(dict.fromkeys(sources))[:5]
-                assistant_text += "\n\nИсточники:\n" + "\n".join(f"• {s}" for s in unique_sources)
+        assistant_text = append_sources(assistant_text, _response_sources(response))
 
-            tokens_used = response.usage.total_tokens if response.usage else len(assistant_text) // 4
-            await self._repo.add_message(conv_id, "assistant", assistant_text, tokens_used)
-            await self._repo.log_api_usage(user_id, "web_search", model, tokens_used)
+        tokens_used = response.usage.total_tokens if response.usage else estimate_tokens(assistant_text)
+        self._store_turn(
+            conv_id, user_id, user_message, assistant_text, tokens_used, "web_search", model,
+        )
 
-            if on_chunk:
-                await on_chunk(assistant_text)
+        if on_chunk:
+            await on_chunk(assistant_text)
 
-            return assistant_text
+        return assistant_text
 
-        except Exception as e:
-            logger.warning("Responses API failed (%s), falling back to DuckDuckGo search", e)
-            # fallback: remove the user message we already added
-            await self._repo.delete_last_exchange(conv_id)
-            raise
+    @_single_flight
+    async def chat_auto(self, user_id: int, user_message: str, on_chunk) -> str:
+        """Answer a message, searching the web only when it is needed.
 
-    async def should_search(self, user_message: str) -> bool:
-        """Ask LLM if web search is needed. Returns True/False."""
+        With Gemini this is a single streamed request where Google Search is
+        offered as a tool. The OpenAI fallback first decides whether to search
+        (_route_and_extract_openai, which also extracts facts, or
+        _should_search_openai, both through _cached_search_decision) and then
+        runs either web search or a plain streamed chat.
+        """
         if self._gemini:
             try:
-                return await self._gemini.should_search(user_message)
+                return await self._gemini.chat_auto(user_id, user_message, on_chunk)
             except Exception as e:
-                logger.warning("Gemini should_search failed (%s), falling back to OpenAI", e)
+                logger.warning("Gemini chat_auto failed (%s), falling back to OpenAI", e)
 
-        response = await self._client.chat.completions.create(
+        # when the message may state facts, route and extract them in one request
+        facts: list[str] | None = None
+
+        async def _route(text: str) -> bool:
+            nonlocal facts
+            search, facts = await self._route_and_extract_openai(text)
+            return search
+
+        wants_facts = user_id not in self._fact_pending and likely_has_facts(user_message)
+        search = await self._cached_search_decision(
+            user_message, _route if wants_facts else self._should_search_openai,
+        )
+        if facts:
+            self._spawn_bg(self._save_facts(user_id, facts))
+
+        if search:
+            return await self._chat_web_search_openai(user_id, user_message, on_chunk)
+        return await self._chat_stream_openai(user_id, user_message, on_chunk, extract_facts=facts is None)
+
+    async def _cached_search_decision(self, user_message: str, decide) -> bool:
+        """Decide whether a message needs a web search, calling decide() only when necessary.
+
+        Obvious cases are settled by _search_hint. The decision depends only on
+        the text, so exact repeats (ignoring case and whitespace) of short
+        messages are served from an LRU cache.
+        """
+        hint = _search_hint(user_message)
+        if hint is not None:
+            return hint
+        if len(user_message) > SEARCH_CACHE_MAX_LEN:
+            return await decide(user_message)
+        key = " ".join(user_message.lower().split())
+        cached = self._search_decisions.get(key)
+        if cached is not None:
+            self._search_decisions.move_to_end(key)
+            return cached
+        result = await decide(user_message)
+        self._search_decisions[key] = result
+        if len(self._search_decisions) > SEARCH_CACHE_SIZE:
+            self._search_decisions.popitem(last=False)
+        return result
+
+    async def _route_and_extract_openai(self, user_message: str) -> tuple[bool, list[str]]:
+        """One gpt-4o-mini call for both the search decision and fact extraction."""
+        response = await self._request(
+            self._client.chat.completions.create,
+            model="gpt-4o-mini",
+            messages=[_ROUTE_AND_FACTS_MSG, {"role": "user", "content": user_message}],
+            response_format={"type": "json_object"},
+            max_tokens=200,
+        )
+        try:
+            data = json.loads(response.choices[0].message.content)
+        except (TypeError, ValueError):
+            data = None
+        if not isinstance(data, dict):
+            logger.debug("Bad routing JSON: %r", response.choices[0].message.content)
+            return False, []
+        facts = data.get("facts")
+        if not isinstance(facts, list):
+            facts = []
+        return str(data.get("search", "")).strip().upper() == "YES", [str(f).strip() for f in facts]
+
+    async def _should_search_openai(self, user_message: str) -> bool:
+        response = await self._request(
+            self._client.chat.completions.create,
             model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": (
-                    "You decide if a web search is needed to answer the user's message. "
-                    "If the message asks about current events, real-time data, recent news, "
-                    "specific facts you might not know, prices, weather, or anything that "
-                    "requires up-to-date information — respond with ONLY the word YES. "
-                    "If no search is needed (general chat, coding, math, creative tasks) — respond with ONLY the word NO. "
-                    "Never explain, just output YES or NO."
-                )},
+                _SHOULD_SEARCH_MSG,
                 {"role": "user", "content": user_message},
             ],
-            max_tokens=10,
+            max_tokens=2,
         )
-        answer = response.choices[0].message.content.strip().upper()
-        return answer == "YES"
+        answer = response.choices[0].message.content or ""
+        return answer.lstrip()[:1] in ("Y", "y")
+
+    async def _image_data_url(self, image_url: str) -> str:
+        """Download an image as a base64 data URL so OpenAI can access it.
+
+        The body is streamed and the download aborted once it exceeds MAX_IMAGE_BYTES.
+        """
+        cached = self._image_cache.get(image_url)
+        if cached is not None and time.monotonic() - cached[0] < IMAGE_CACHE_TTL:
+            self._image_cache.move_to_end(image_url)
+            return cached[1]
+
+        async with self._http.stream("GET", image_url, timeout=15) as resp:
+            resp.raise_for_status()
+            declared = resp.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > MAX_IMAGE_BYTES:
+                raise ValueError(f"Image too large: {declared} bytes")
+            content_type = resp.headers.get("content-type", "image/jpeg")
+            if "octet-stream" in content_type:
+                url_lower = image_url.lower()
+                content_type = "image/png" if ".png" in url_lower else "image/jpeg"
+            b64 = await _b64_encode_stream(_capped(resp.aiter_bytes(65536), MAX_IMAGE_BYTES))
+        data_url = f"data:{content_type};base64,{b64}"
 
+        self._image_cache[image_url] = (time.monotonic(), data_url)
+        self._image_cache.move_to_end(image_url)
+        if len(self._image_cache) > IMAGE_CACHE_SIZE:
+            self._image_cache.popitem(last=False)
+        return data_url
+
+    @_single_flight
     async def chat_vision(self, user_id: int, image_url: str, caption: str = "") -> str:
         if self._gemini:
             try:
                 return await self._gemini.chat_vision(user_id, image_url, caption)
             except Exception as e:
                 logger.warning("Gemini vision failed (%s), falling back to OpenAI", e)
-                conv_id, _ = await self._ensure_conversation(user_id)
-                await self._delete_last_user_message(conv_id)
 
         return await self._chat_vision_openai(user_id, image_url, caption)
 
     async def _chat_vision_openai(self, user_id: int, image_url: str, caption: str = "") -> str:
-        import base64
-        import httpx
-
-        conv_id, conv = await self._ensure_conversation(user_id)
         text = caption or "What do you see in this image?"
-        # Store only the caption text — Telegram URLs expire and break future calls
-        await self._repo.add_message(conv_id, "user", text, content_type="vision")
 
-        # Download image and send as base64 so OpenAI can access it
-        async with httpx.AsyncClient() as http:
-            resp = await http.get(image_url, timeout=15)
-            resp.raise_for_status()
-            content_type = resp.headers.get("content-type", "image/jpeg")
-            if "octet-stream" in content_type:
-                url_lower = image_url.lower()
-                content_type = "image/png" if ".png" in url_lower else "image/jpeg"
-            b64 = base64.b64encode(resp.content).decode()
-            data_url = f"data:{content_type};base64,{b64}"
-
-        history = await self._repo.get_messages(conv_id, self._config.max_context_messages)
+        # the download overlaps with the DB round-trips of the prelude
+        (conv_id, conv, history, _), data_url = await asyncio.gather(
+            self._prepare_turn(user_id, text), self._image_data_url(image_url),
+        )
         messages = self._build_messages(conv, history)
         # Replace the last user message with the image content block
         for i in range(len(messages) - 1, -1, -1):
@@ -422,15 +821,18 @@ class LLMService:
         model = conv["model"]
         logger.info("Vision request: model=%s", model)
 
-        response = await self._client.chat.completions.create(model=model, messages=messages)
+        response = await self._request(self._client.chat.completions.create, model=model, messages=messages)
         assistant_text = response.choices[0].message.content
         tokens_used = response.usage.total_tokens if response.usage else 0
 
-        await self._repo.add_message(conv_id, "assistant", assistant_text, tokens_used)
-        await self._repo.log_api_usage(user_id, "vision", model, tokens_used)
+        # Store only the caption text — Telegram URLs expire and break future calls
+        self._store_turn(
+            conv_id, user_id, text, assistant_text, tokens_used, "vision", model, content_type="vision",
+        )
         return assistant_text
 
     async def retry_last(self, user_id: int) -> str | None:
+        await self._wait_stored(user_id)
         conv_id, conv = await self._ensure_conversation(user_id)
         # get the last user message before deleting
         history = await self._repo.get_messages(conv_id, 2)
@@ -447,8 +849,8 @@ class LLMService:
 
         await self._repo.delete_last_exchange(conv_id)
 
-        # re-send (uses Gemini fallback via self.chat)
-        return await self.chat(user_id, last_user_msg)
+        # re-send (uses Gemini fallback via self.chat); a retry wants a new answer
+        return await self.chat(user_id, last_user_msg, cached=False)
 
     async def generate_image(self, user_id: int, prompt: str) -> bytes | str:
         """Generate image. Tries Gemini first, falls back to OpenAI."""
@@ -465,7 +867,8 @@ class LLMService:
         model = self._config.image_model
         # gpt-image-1 only supports b64_json
         if "gpt-image" in model:
-            response = await self._client.images.generate(
+            response = await self._request(
+                self._client.images.generate,
                 model=model,
                 prompt=prompt,
                 n=1,
@@ -474,7 +877,8 @@ class LLMService:
             await self._repo.log_api_usage(user_id, "image", model)
             return base64.b64decode(response.data[0].b64_json)
         else:
-            response = await self._client.images.generate(
+            response = await self._request(
+                self._client.images.generate,
                 model=model,
                 prompt=prompt,
                 n=1,
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
 import asyncio
+import heapq
 import logging
 from datetime import datetime, timezone, timedelta
+from operator import itemgetter
 from typing import TYPE_CHECKING
 
 import feedparser
+import httpx
 
 if TYPE_CHECKING:
     from bot.database.repository import Repository
@@ -15,6 +18,10 @@ logger = logging.getLogger(__name__)
 # Maximum items shown per /news call
 MAX_ITEMS = 10
 
+FEED_TIMEOUT = 15
+# feeds are newest-first; stop after this many stale entries in a row (tolerates slight disorder)
+MAX_STALE_IN_ROW = 3
+
 
 def _entry_published_at(entry) -> datetime:
     """Parse publication time from a feedparser entry; fall back to now."""
@@ -28,21 +35,28 @@ def _entry_published_at(entry) -> datetime:
     return datetime.now(timezone.utc)
 
 
-async def fetch_feed(url: str) -> list[dict]:
-    """Fetch and parse one RSS feed in a thread pool. Returns list of items."""
-    loop = asyncio.get_running_loop()
+async def fetch_feed(url: str, client: httpx.AsyncClient) -> list[dict]:
+    """Download one RSS feed with the shared client and parse it. Returns list of items."""
     try:
-        parsed = await loop.run_in_executor(None, feedparser.parse, url)
+        resp = await client.get(url)
+        resp.raise_for_status()
+        # parsing is CPU-bound, keep it off the event loop
+        parsed = await asyncio.to_thread(feedparser.parse, resp.content)
     except Exception as exc:
         logger.warning("Failed to fetch feed %s: %s", url, exc)
         return []
 
     cutoff = datetime.now(timezone.utc) - timedelta(hours=24)
     items = []
+    stale_in_row = 0
     for entry in parsed.entries:
         pub = _entry_published_at(entry)
         if pub < cutoff:
+            stale_in_row += 1
+            if stale_in_row >= MAX_STALE_IN_ROW:
+                break
             continue
+        stale_in_row = 0
         link = entry.get("link", "")
         title = entry.get("title", "").strip()
         if not link or not title:
@@ -70,31 +84,30 @@ async def get_news_for_user(
     shown_urls = await repo.get_shown_urls_last_24h(user_id)
     disliked_sources = set(await repo.get_disliked_sources(user_id))
 
-    # Fetch all feeds concurrently
-    tasks = [fetch_feed(s["url"]) for s in sources]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    # Fetch all feeds concurrently over one connection pool
+    async with httpx.AsyncClient(
+        timeout=FEED_TIMEOUT, follow_redirects=True, headers={"User-Agent": feedparser.USER_AGENT},
+    ) as client:
+        tasks = [fetch_feed(s["url"], client) for s in sources]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
 
-    all_items: list[dict] = []
+    # Filter: skip already seen; deprioritize disliked sources
+    preferred, deprioritized = [], []
     for source, result in zip(sources, results):
         if isinstance(result, BaseException):
             logger.warning("Feed error for %s: %s", source["url"], result)
             continue
+        name = source["name"] or source["url"]
+        bucket = deprioritized if name in disliked_sources else preferred
         for item in result:
-            item["source"] = source["name"] or source["url"]
-            all_items.append(item)
-
-    # Sort newest first
-    all_items.sort(key=lambda x: x["published"], reverse=True)
-
-    # Filter: skip already seen; deprioritize disliked sources
-    preferred, deprioritized = [], []
-    for item in all_items:
-        if item["url"] in shown_urls:
-            continue
-        if item["source"] in disliked_sources:
-            deprioritized.append(item)
-        else:
-            preferred.append(item)
-
-    combined = preferred + deprioritized
-    return combined[:max_items]
+            if item["url"] in shown_urls:
+                continue
+            item["source"] = name
+            bucket.append(item)
+
+    # Newest first; only the items that can make the cut are ordered
+    by_date = itemgetter("published")
+    top = heapq.nlargest(max_items, preferred, key=by_date)
+    if len(top) < max_items:
+        top += heapq.nlargest(max_items - len(top), deprioritized, key=by_date)
+    return top
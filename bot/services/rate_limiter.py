@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+
+class AsyncTokenBucket:
+    """Token bucket allowing `capacity` acquisitions per `period` seconds.
+
+    Tokens refill continuously, so bursts up to `capacity` are allowed and
+    sustained throughput is capped at capacity / period. acquire() waits
+    instead of failing when the bucket is empty.
+    """
+
+    def __init__(self, capacity: int, period: float) -> None:
+        self._capacity = float(capacity)
+        self._rate = capacity / period  # tokens per second
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill()
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self._rate
+
+    async def acquire(self, amount: float = 1) -> None:
+        """Take `amount` tokens (capped at capacity), sleeping until they are available."""
+        amount = min(float(amount), self._capacity)
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                await asyncio.sleep((amount - self._tokens) / self._rate)
+                self._refill()
+            self._tokens -= amount
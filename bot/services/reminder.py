@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import re
 from datetime import datetime, timedelta, timezone
 
 from aiogram import Bot
@@ -10,14 +11,39 @@ from bot.database.repository import Repository
 
 logger = logging.getLogger(__name__)
 
+# "через 5 минут ...", "in 2 hours ..." (the preposition is optional)
+_REMIND_RE = re.compile(
+    r"(?:(?:через|in)\s+)?(?P<amount>\d+)\s*"
+    r"(?P<unit>мин(?:ут[аыу]?)?|час(?:а|ов)?|дн(?:ей|я)?|день|сек(?:унд[аыу]?)?"
+    r"|sec(?:ond)?s?|min(?:ute)?s?|hours?|days?)"
+    r"\s+(?P<text>.+)",
+    re.IGNORECASE,
+)
+# first two letters of the unit -> timedelta keyword
+_UNIT_KWARGS = {
+    "се": "seconds", "ми": "minutes", "ча": "hours", "дн": "days", "де": "days",
+    "se": "seconds", "mi": "minutes", "ho": "hours", "da": "days",
+}
+
+
+# upper bound for one sleep, so reminders written by other processes are still picked up
+MAX_SLEEP = 3600
+# retry delay after a failed iteration (e.g. database error)
+ERROR_RETRY_DELAY = 15
+
 
 class ReminderService:
-    """Background scheduler that checks and sends due reminders."""
+    """Background scheduler that sends reminders when they become due.
+
+    Instead of polling, the loop sleeps until the earliest pending reminder
+    (at most MAX_SLEEP); notify() wakes it when a new reminder is added.
+    """
 
     def __init__(self, bot: Bot, repo: Repository) -> None:
         self._bot = bot
         self._repo = repo
         self._task: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
 
     def start(self) -> None:
         self._task = asyncio.create_task(self._loop())
@@ -31,25 +57,49 @@ class ReminderService:
             except asyncio.CancelledError:
                 pass
 
+    def notify(self) -> None:
+        """Re-check the schedule now (call after adding a reminder)."""
+        self._wakeup.set()
+
+    async def _send_due(self) -> None:
+        reminders = await self._repo.get_pending_reminders()
+        if not reminders:
+            return
+        # mark sent first so a failed send_message doesn't cause double-delivery
+        await self._repo.mark_reminders_sent([r["id"] for r in reminders])
+        # different chats don't share Telegram's per-chat limit, so send concurrently
+        results = await asyncio.gather(
+            *(self._bot.send_message(r["chat_id"], f"🔔 Напоминание:\n{r['text']}") for r in reminders),
+            return_exceptions=True,
+        )
+        for r, result in zip(reminders, results):
+            if isinstance(result, BaseException):
+                logger.error("Failed to send reminder #%d: %s", r["id"], result)
+            else:
+                logger.info("Sent reminder #%d to user %d", r["id"], r["user_id"])
+
+    async def _seconds_until_next(self) -> float:
+        next_due = await self._repo.get_next_due_at()
+        if next_due is None:
+            return MAX_SLEEP
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return min(max((next_due - now).total_seconds(), 0.0), MAX_SLEEP)
+
     async def _loop(self) -> None:
         while True:
+            # cleared before reading the schedule, so a notify() during the queries isn't lost
+            self._wakeup.clear()
             try:
-                reminders = await self._repo.get_pending_reminders()
-                for r in reminders:
-                    try:
-                        # mark sent first so a failed send_message doesn't cause double-delivery
-                        await self._repo.mark_reminder_sent(r["id"])
-                        await self._bot.send_message(
-                            r["chat_id"],
-                            f"🔔 Напоминание:\n{r['text']}",
-                        )
-                        logger.info("Sent reminder #%d to user %d", r["id"], r["user_id"])
-                    except Exception:
-                        logger.exception("Failed to send reminder #%d", r["id"])
+                await self._send_due()
+                delay = await self._seconds_until_next()
             except Exception:
                 logger.exception("Reminder loop error")
+                delay = ERROR_RETRY_DELAY
 
-            await asyncio.sleep(15)  # check every 15 seconds
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
 
 
 def parse_remind_time(text: str) -> tuple[datetime, str] | None:
@@ -62,55 +112,9 @@ def parse_remind_time(text: str) -> tuple[datetime, str] | None:
     - 'in 30 minutes do something'
     - 'in 2 hours check email'
     """
-    import re
-
-    text = text.strip()
+    m = _REMIND_RE.match(text.strip())
+    if m is None:
+        return None
+    unit = _UNIT_KWARGS[m.group("unit")[:2].lower()]
     now = datetime.now(timezone.utc).replace(tzinfo=None)
-
-    # Russian: "через X минут/часов/дней ..."
-    m = re.match(
-        r"(?:через\s+)?(\d+)\s*(мин(?:ут[аыу]?)?|час(?:а|ов)?|дн(?:ей|я)?|день|сек(?:унд[аыу]?)?)\s+(.+)",
-        text, re.IGNORECASE,
-    )
-    if m:
-        amount = int(m.group(1))
-        unit = m.group(2).lower()
-        reminder_text = m.group(3)
-
-        if unit.startswith("сек"):
-            delta = timedelta(seconds=amount)
-        elif unit.startswith("мин"):
-            delta = timedelta(minutes=amount)
-        elif unit.startswith("час"):
-            delta = timedelta(hours=amount)
-        elif unit.startswith("дн") or unit == "день":
-            delta = timedelta(days=amount)
-        else:
-            return None
-
-        return now + delta, reminder_text
-
-    # English: "in X minutes/hours/days ..."
-    m = re.match(
-        r"(?:in\s+)?(\d+)\s*(sec(?:ond)?s?|min(?:ute)?s?|hours?|days?)\s+(.+)",
-        text, re.IGNORECASE,
-    )
-    if m:
-        amount = int(m.group(1))
-        unit = m.group(2).lower()
-        reminder_text = m.group(3)
-
-        if unit.startswith("sec"):
-            delta = timedelta(seconds=amount)
-        elif unit.startswith("min"):
-            delta = timedelta(minutes=amount)
-        elif unit.startswith("hour"):
-            delta = timedelta(hours=amount)
-        elif unit.startswith("day"):
-            delta = timedelta(days=amount)
-        else:
-            return None
-
-        return now + delta, reminder_text
-
-    return None
+    return now + timedelta(**{unit: int(m.group("amount"))}), m.group("text")
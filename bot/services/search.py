@@ -1,21 +1,56 @@
 from __future__ import annotations
 
 import asyncio
+import importlib.util
 import logging
-from concurrent.futures import ThreadPoolExecutor
+import time
+from collections import OrderedDict
 
 import httpx
 from bs4 import BeautifulSoup
 
 logger = logging.getLogger(__name__)
 
-_executor = ThreadPoolExecutor(max_workers=3)
+# lxml (C) parses several times faster than the pure-Python html.parser; use it when installed
+_HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+# repeated queries and pages are served from memory for a while (key -> (stored_at, value), LRU-ordered)
+SEARCH_CACHE_TTL = 600
+PAGE_CACHE_TTL = 300
+CACHE_SIZE = 512
+_search_cache: OrderedDict[tuple[str, int], tuple[float, list[dict]]] = OrderedDict()
+_page_cache: OrderedDict[tuple[str, int], tuple[float, str]] = OrderedDict()
+# searches and page fetches in progress, shared by concurrent identical requests
+_inflight: dict[tuple, asyncio.Future] = {}
+
+PAGE_FETCH_CONCURRENCY = 3  # parallel page downloads per search_and_fetch call
+
+# pages are read up to this size; fat pages (inline images, SVG) are cut instead of parsed whole
+MAX_PAGE_BYTES = 512 * 1024
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
 }
 
 
+def _cache_get(cache: OrderedDict, key, ttl: float):
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    if time.monotonic() - entry[0] >= ttl:
+        del cache[key]
+        return None
+    cache.move_to_end(key)
+    return entry[1]
+
+
+def _cache_put(cache: OrderedDict, key, value) -> None:
+    cache[key] = (time.monotonic(), value)
+    cache.move_to_end(key)
+    if len(cache) > CACHE_SIZE:
+        cache.popitem(last=False)
+
+
 def _search_sync(query: str, max_results: int = 5) -> list[dict]:
     from duckduckgo_search import DDGS
     results = []
@@ -29,43 +64,90 @@ def _search_sync(query: str, max_results: int = 5) -> list[dict]:
     return results
 
 
+async def _coalesced(key: tuple, make):
+    """Run make() once for concurrent callers with the same key; the others await its result."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(make())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shielded: a caller that gives up must not cancel the work others are waiting for
+    return await asyncio.shield(task)
+
+
 async def web_search(query: str, max_results: int = 5) -> list[dict]:
-    """Search the web using DuckDuckGo."""
-    loop = asyncio.get_event_loop()
+    """Search the web using DuckDuckGo (results are cached for SEARCH_CACHE_TTL)."""
+    key = (" ".join(query.lower().split()), max_results)
+    cached = _cache_get(_search_cache, key, SEARCH_CACHE_TTL)
+    if cached is None:
+        cached = await _coalesced(("search", *key), lambda: _search_uncached(query, key))
+    return list(cached)
+
+
+async def _search_uncached(query: str, key: tuple[str, int]) -> list[dict]:
     try:
-        results = await loop.run_in_executor(_executor, _search_sync, query, max_results)
-        logger.info("Web search: query=%r, results=%d", query, len(results))
-        return results
+        # duckduckgo_search has no async API; the default executor is shared with the rest of the bot
+        results = await asyncio.to_thread(_search_sync, query, key[1])
     except Exception:
         logger.exception("Web search error: %s", query)
         return []
+    logger.info("Web search: query=%r, results=%d", query, len(results))
+    if results:
+        _cache_put(_search_cache, key, results)
+    return results
 
 
-async def fetch_page_text(url: str, max_chars: int = 3000) -> str:
-    """Fetch a page and extract readable text."""
-    try:
-        async with httpx.AsyncClient(headers=HEADERS, timeout=10, follow_redirects=True) as client:
-            resp = await client.get(url)
-            resp.raise_for_status()
+def _extract_text(html: str | bytes, max_chars: int, encoding: str | None = None) -> str:
+    """Readable text of an HTML page: main content without navigation and scripts.
 
-        soup = BeautifulSoup(resp.text, "html.parser")
+    Raw bytes are decoded by BeautifulSoup: the header charset if given,
+    otherwise <meta charset> or detection.
+    """
+    soup = BeautifulSoup(html, _HTML_PARSER, from_encoding=encoding)
 
-        # remove noise
-        for tag in soup(["script", "style", "nav", "header", "footer", "aside", "form", "iframe"]):
-            tag.decompose()
+    # remove noise
+    for tag in soup(["script", "style", "nav", "header", "footer", "aside", "form", "iframe"]):
+        tag.decompose()
 
-        # try to find main content
-        main = soup.find("main") or soup.find("article") or soup.find("div", {"role": "main"})
-        if main:
-            text = main.get_text(separator="\n", strip=True)
-        else:
-            text = soup.get_text(separator="\n", strip=True)
+    # try to find main content
+    main = soup.find("main") or soup.find("article") or soup.find("div", {"role": "main"})
+    text = (main or soup).get_text(separator="\n", strip=True)
 
-        # clean up whitespace
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        text = "\n".join(lines)
+    # clean up whitespace
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    return "\n".join(lines)[:max_chars]
+
+
+async def fetch_page_text(url: str, max_chars: int = 3000) -> str:
+    """Fetch a page and extract readable text (cached for PAGE_CACHE_TTL)."""
+    cached = _cache_get(_page_cache, (url, max_chars), PAGE_CACHE_TTL)
+    if cached is not None:
+        return cached
+    return await _coalesced(("page", url, max_chars), lambda: _fetch_page_uncached(url, max_chars))
 
-        return text[:max_chars]
+
+async def _fetch_page_uncached(url: str, max_chars: int) -> str:
+    try:
+        async with httpx.AsyncClient(headers=HEADERS, timeout=10, follow_redirects=True) as client:
+            async with client.stream("GET", url) as resp:
+                resp.raise_for_status()
+                content_type = resp.headers.get("content-type", "")
+                if content_type and "html" not in content_type and "text/plain" not in content_type:
+                    logger.debug("Skipping %s: content-type %s", url, content_type)
+                    return ""
+                body = bytearray()
+                async for chunk in resp.aiter_bytes():
+                    body += chunk
+                    if len(body) >= MAX_PAGE_BYTES:
+                        break  # the first part of a page has more than enough text
+                html = bytes(body[:MAX_PAGE_BYTES])
+                encoding = resp.charset_encoding
+
+        # parsing a large page takes tens of milliseconds, keep it off the event loop
+        text = await asyncio.to_thread(_extract_text, html, max_chars, encoding)
+        if text:
+            _cache_put(_page_cache, (url, max_chars), text)
+        return text
     except Exception:
         logger.debug("Failed to fetch %s", url)
         return ""
@@ -77,10 +159,17 @@ async def search_and_fetch(query: str, max_results: int = 5, pages_to_fetch: int
     if not results:
         return "No search results found."
 
-    # fetch top pages in parallel
-    urls = [r["url"] for r in results[:pages_to_fetch]]
-    page_tasks = [fetch_page_text(url) for url in urls]
-    page_contents = await asyncio.gather(*page_tasks)
+    # fetch top pages in parallel, at most PAGE_FETCH_CONCURRENCY at a time
+    sem = asyncio.Semaphore(PAGE_FETCH_CONCURRENCY)
+
+    async def _fetch(url: str) -> str:
+        async with sem:
+            return await fetch_page_text(url)
+
+    page_contents = [
+        "" if isinstance(page, BaseException) else page
+        for page in await asyncio.gather(*(_fetch(r["url"]) for r in results[:pages_to_fetch]), return_exceptions=True)
+    ]
 
     # build rich context
     lines = []
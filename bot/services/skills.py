@@ -4,6 +4,7 @@ import asyncio
 import importlib.util
 import logging
 import os
+import re
 import sys
 from dataclasses import dataclass, field
 from pathlib import Path
@@ -13,8 +14,11 @@ import yaml
 
 logger = logging.getLogger(__name__)
 
+# libyaml-backed loader parses manifests several times faster; pure-Python fallback otherwise
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
-@dataclass
+
+@dataclass(slots=True)
 class Skill:
     """Loaded skill definition."""
     name: str
@@ -37,6 +41,14 @@ class SkillsService:
     def __init__(self, skills_dir: str = "skills") -> None:
         self._skills_dir = Path(skills_dir)
         self._skills: dict[str, Skill] = {}
+        # all keywords of enabled skills in one pattern, so a message is scanned once
+        self._keyword_re: re.Pattern | None = None
+        self._keyword_skill: dict[str, str] = {}
+        # slash command -> enabled skill
+        self._by_trigger: dict[str, Skill] = {}
+        # rendered get_skills_prompt / list_skills_text, reset by _skills_changed
+        self._prompt_cache: str | None = None
+        self._list_cache: str | None = None
 
     @property
     def skills(self) -> dict[str, Skill]:
@@ -48,25 +60,56 @@ class SkillsService:
             logger.warning("Skills directory not found: %s", self._skills_dir)
             return
 
+        # manifests are read and handlers imported in worker threads, all at once;
+        # results are applied in directory order so later entries still win name clashes
+        loaders = []
         for entry in sorted(self._skills_dir.iterdir()):
             if entry.is_dir():
-                await self._load_skill_dir(entry)
+                loaders.append(asyncio.to_thread(self._load_skill_dir, entry))
             elif entry.suffix in (".yml", ".yaml"):
-                await self._load_skill_file(entry)
+                loaders.append(asyncio.to_thread(self._load_skill_file, entry))
 
+        for skill in await asyncio.gather(*loaders):
+            if skill is not None:
+                self._skills[skill.name] = skill
+        self._skills_changed()
         logger.info("Loaded %d skills: %s", len(self._skills), list(self._skills.keys()))
 
-    async def _load_skill_dir(self, path: Path) -> None:
-        """Load skill from a directory (skill.yml + optional script.py)."""
+    def _skills_changed(self) -> None:
+        """Drop derived state; call whenever skills are loaded or toggled."""
+        self._prompt_cache = None
+        self._list_cache = None
+        self._by_trigger = {}
+        for skill in self._skills.values():
+            if skill.enabled:
+                self._by_trigger.setdefault(skill.trigger, skill)
+        self._index_keywords()
+
+    def _index_keywords(self) -> None:
+        self._keyword_skill = {}
+        for skill in self._skills.values():
+            if skill.enabled:
+                for kw in skill.keywords:
+                    # the first skill listing a keyword keeps it, as with the old linear scan
+                    self._keyword_skill.setdefault(kw.lower(), skill.name)
+        if not self._keyword_skill:
+            self._keyword_re = None
+            return
+        # longest first so a keyword never shadows a longer one starting at the same place
+        alternatives = sorted(self._keyword_skill, key=len, reverse=True)
+        self._keyword_re = re.compile("|".join(map(re.escape, alternatives)), re.IGNORECASE)
+
+    def _load_skill_dir(self, path: Path) -> Skill | None:
+        """Load skill from a directory (skill.yml + optional script.py). Blocking, runs in a thread."""
         manifest = path / "skill.yml"
         if not manifest.exists():
             manifest = path / "skill.yaml"
         if not manifest.exists():
-            return
+            return None
 
         try:
-            with open(manifest, "r", encoding="utf-8") as f:
-                data = yaml.safe_load(f)
+            with open(manifest, "rb") as f:
+                data = yaml.load(f, Loader=_YAML_LOADER)
 
             skill = self._parse_manifest(data, manifest)
             skill.path = path
@@ -75,22 +118,23 @@ class SkillsService:
             script = path / "handler.py"
             if script.exists():
                 skill.execute = self._load_handler(script, skill.name)
-
-            self._skills[skill.name] = skill
+            return skill
         except Exception:
             logger.exception("Failed to load skill from %s", path)
+            return None
 
-    async def _load_skill_file(self, path: Path) -> None:
-        """Load a single-file skill (just YAML, uses LLM for execution)."""
+    def _load_skill_file(self, path: Path) -> Skill | None:
+        """Load a single-file skill (just YAML, uses LLM for execution). Blocking, runs in a thread."""
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = yaml.safe_load(f)
+            with open(path, "rb") as f:
+                data = yaml.load(f, Loader=_YAML_LOADER)
 
             skill = self._parse_manifest(data, path)
             skill.path = path.parent
-            self._skills[skill.name] = skill
+            return skill
         except Exception:
             logger.exception("Failed to load skill from %s", path)
+            return None
 
     def _parse_manifest(self, data: dict, source: Path) -> Skill:
         """Parse skill manifest YAML into Skill object."""
@@ -108,10 +152,22 @@ class SkillsService:
         )
 
     def _load_handler(self, script: Path, skill_name: str) -> Callable:
-        """Dynamically import handler.py and return its execute() function."""
-        spec = importlib.util.spec_from_file_location(f"skill_{skill_name}", script)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
+        """Dynamically import handler.py and return its execute() function.
+
+        The module is registered in sys.modules, so loading the skills again
+        reuses it instead of re-executing the script.
+        """
+        modname = f"skill_{skill_name}"
+        module = sys.modules.get(modname)
+        if module is None or getattr(module, "__file__", None) != str(script):
+            spec = importlib.util.spec_from_file_location(modname, script)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[modname] = module
+            try:
+                spec.loader.exec_module(module)
+            except BaseException:
+                del sys.modules[modname]
+                raise
 
         if not hasattr(module, "execute"):
             raise AttributeError(f"Skill '{skill_name}' handler.py has no execute() function")
@@ -120,24 +176,24 @@ class SkillsService:
 
     def find_by_trigger(self, command: str) -> Skill | None:
         """Find skill by slash command trigger."""
-        for skill in self._skills.values():
-            if skill.enabled and skill.trigger == command:
-                return skill
-        return None
+        return self._by_trigger.get(command)
 
     def find_by_keywords(self, text: str) -> Skill | None:
-        """Find skill whose keywords match the text."""
-        text_lower = text.lower()
-        for skill in self._skills.values():
-            if not skill.enabled or not skill.keywords:
-                continue
-            for kw in skill.keywords:
-                if kw.lower() in text_lower:
-                    return skill
-        return None
+        """Find skill whose keywords match the text (the keyword found first wins)."""
+        if self._keyword_re is None:
+            return None
+        m = self._keyword_re.search(text)
+        if m is None:
+            return None
+        return self._skills[self._keyword_skill[m.group().lower()]]
 
     def get_skills_prompt(self) -> str:
         """Build system prompt section describing all available skills."""
+        if self._prompt_cache is None:
+            self._prompt_cache = self._render_skills_prompt()
+        return self._prompt_cache
+
+    def _render_skills_prompt(self) -> str:
         if not self._skills:
             return ""
 
@@ -161,6 +217,11 @@ class SkillsService:
 
     def list_skills_text(self) -> str:
         """Human-readable list of skills for /skills command."""
+        if self._list_cache is None:
+            self._list_cache = self._render_skills_list()
+        return self._list_cache
+
+    def _render_skills_list(self) -> str:
         if not self._skills:
             return "No skills installed. Add .yml files to the skills/ directory."
 
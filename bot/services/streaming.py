@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# appended to in-progress edits to show the answer is still being typed
+STREAM_CURSOR = " ▌"
+
+
+class CoalescingEditor:
+    """Deliver streaming progress to on_chunk without blocking the stream reader.
+
+    update() never awaits: it stores the latest text and starts a flush task
+    if none is running. The task keeps sending the newest text until nothing
+    new arrived, so slow Telegram edits are coalesced instead of queued.
+    The suffix (e.g. STREAM_CURSOR) is added only to edits actually sent,
+    never to the final text.
+    """
+
+    def __init__(self, on_chunk: Callable[[str], Awaitable[None]], suffix: str = "") -> None:
+        self._on_chunk = on_chunk
+        self._suffix = suffix
+        self._pending: str | None = None
+        self._task: asyncio.Task | None = None
+
+    def update(self, text: str) -> None:
+        self._pending = text
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush())
+
+    async def _flush(self) -> None:
+        while self._pending is not None:
+            text, self._pending = self._pending, None
+            try:
+                await self._on_chunk(text + self._suffix)
+            except Exception:
+                logger.debug("Stream edit failed", exc_info=True)
+
+    async def finish(self, text: str) -> None:
+        """Wait for the in-flight edit, then send the final text."""
+        self._pending = None
+        if self._task is not None:
+            await self._task
+        await self._on_chunk(text)
+
+    def cancel(self) -> None:
+        """Drop pending edits (stream failed and will be retried elsewhere)."""
+        self._pending = None
+        if self._task is not None:
+            self._task.cancel()
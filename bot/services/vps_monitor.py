@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+import html
 import json
 import logging
 from datetime import datetime, timedelta
@@ -12,6 +13,9 @@ from bot.database.repository import Repository
 
 logger = logging.getLogger(__name__)
 
+# servers polled at the same time
+POLL_CONCURRENCY = 10
+
 # One SSH session runs several lightweight commands
 METRICS_CMD = r"""
 awk '/cpu /{t=$2+$3+$4+$5+$6+$7+$8;i=$5;printf "%.1f",100*(t-i)/t}' /proc/stat
@@ -27,60 +31,57 @@ echo ""
 docker ps -a --format "{{.Names}}|{{.Status}}|{{.Image}}" 2>/dev/null || echo "DOCKER_UNAVAILABLE"
 """.strip()
 
+# METRICS_CMD is uploaded once per connection to this file in the remote user's home,
+# so each poll sends a short command instead of the whole script
+METRICS_SCRIPT = ".bot_metrics.sh"
+_UPLOAD_CMD = f"cat > {METRICS_SCRIPT} && chmod 700 {METRICS_SCRIPT}"
 
-def _parse_metrics(stdout: str) -> dict:
-    lines = stdout.strip().splitlines()
-    # expected order: cpu, mem (3 fields), disk (3 fields), uptime, loadavg, docker lines...
-    cpu_pct = float(lines[0]) if len(lines) > 0 else None
-
-    mem_parts = lines[1].split() if len(lines) > 1 else []
-    mem_pct = float(mem_parts[0]) if mem_parts else None
-    mem_used_mb = int(mem_parts[1]) if len(mem_parts) > 1 else None
-    mem_total_mb = int(mem_parts[2]) if len(mem_parts) > 2 else None
 
-    disk_parts = lines[2].split() if len(lines) > 2 else []
-    disk_pct = float(disk_parts[0]) if disk_parts else None
-    disk_used_gb = float(disk_parts[1]) if len(disk_parts) > 1 else None
-    disk_total_gb = float(disk_parts[2]) if len(disk_parts) > 2 else None
+class MetricsParseError(ValueError):
+    """The server answered, but METRICS_CMD output doesn't match the expected layout."""
 
-    uptime_sec = int(lines[3]) if len(lines) > 3 else None
 
-    load_parts = lines[4].split() if len(lines) > 4 else []
-    load_1 = float(load_parts[0]) if load_parts else None
-    load_5 = float(load_parts[1]) if len(load_parts) > 1 else None
-    load_15 = float(load_parts[2]) if len(load_parts) > 2 else None
+def _parse_metrics(stdout: str) -> dict:
+    """Parse METRICS_CMD output; raises MetricsParseError on an unexpected layout."""
+    # fixed order: cpu, mem (3 fields), disk (3 fields), uptime, loadavg, then docker lines
+    try:
+        cpu_line, mem_line, disk_line, uptime_line, load_line, *docker_lines = stdout.strip().splitlines()
+        mem_pct, mem_used_mb, mem_total_mb = mem_line.split()
+        disk_pct, disk_used_gb, disk_total_gb = disk_line.split()
+        load_1, load_5, load_15 = load_line.split()[:3]
+        metrics = {
+            "cpu_pct": float(cpu_line),
+            "mem_pct": float(mem_pct),
+            "mem_used_mb": int(mem_used_mb),
+            "mem_total_mb": int(mem_total_mb),
+            "disk_pct": float(disk_pct),
+            "disk_used_gb": float(disk_used_gb),
+            "disk_total_gb": float(disk_total_gb),
+            "uptime_sec": int(uptime_line),
+            "load_1": float(load_1),
+            "load_5": float(load_5),
+            "load_15": float(load_15),
+        }
+    except ValueError:
+        raise MetricsParseError(f"unexpected metrics output: {stdout[:200]!r}") from None
 
     containers_json = None
-    if len(lines) > 5:
-        docker_lines = lines[5:]
-        if docker_lines and docker_lines[0] != "DOCKER_UNAVAILABLE":
-            containers = []
-            for dl in docker_lines:
-                if not dl.strip():
-                    continue
-                parts = dl.split("|")
-                if len(parts) >= 3:
-                    containers.append({
-                        "name": parts[0],
-                        "status": parts[1],
-                        "image": parts[2],
-                    })
-            containers_json = json.dumps(containers, ensure_ascii=False)
-
-    return {
-        "cpu_pct": cpu_pct,
-        "mem_pct": mem_pct,
-        "mem_used_mb": mem_used_mb,
-        "mem_total_mb": mem_total_mb,
-        "disk_pct": disk_pct,
-        "disk_used_gb": disk_used_gb,
-        "disk_total_gb": disk_total_gb,
-        "uptime_sec": uptime_sec,
-        "load_1": load_1,
-        "load_5": load_5,
-        "load_15": load_15,
-        "containers_json": containers_json,
-    }
+    # cat /proc/loadavg ends with a newline of its own, so docker output follows a blank line
+    docker_lines = [dl for dl in docker_lines if dl.strip()]
+    if docker_lines and docker_lines[0] != "DOCKER_UNAVAILABLE":
+        containers = []
+        for dl in docker_lines:
+            parts = dl.split("|")
+            if len(parts) >= 3:
+                containers.append({
+                    "name": parts[0],
+                    "status": parts[1],
+                    "image": parts[2],
+                })
+        containers_json = json.dumps(containers, ensure_ascii=False)
+
+    metrics["containers_json"] = containers_json
+    return metrics
 
 
 class VpsMonitorService:
@@ -94,6 +95,15 @@ class VpsMonitorService:
         self._config = config
         self._task: asyncio.Task | None = None
         self._last_alert: dict[str, datetime] = {}
+        # alerts of the current polling cycle, sent together by _flush_alerts
+        self._pending_alerts: list[str] = []
+        # aliases whose metrics output can't be parsed; alerted once until it parses again
+        self._unreadable: set[str] = set()
+        # server_id -> {container name: status} from the previous poll
+        self._last_containers: dict[int, dict[str, str]] = {}
+        # (host, port, user) -> (SSH connection kept open between polls, metrics command for it)
+        self._conns: dict[tuple[str, int, str], tuple[object, str]] = {}
+        self._poll_sem = asyncio.Semaphore(POLL_CONCURRENCY)
 
     def start(self) -> None:
         self._task = asyncio.create_task(self._loop())
@@ -106,6 +116,9 @@ class VpsMonitorService:
                 await self._task
             except asyncio.CancelledError:
                 pass
+        conns = [conn for conn, _ in self._conns.values()]
+        self._conns.clear()
+        await asyncio.gather(*(self._close(conn) for conn in conns))
 
     async def _loop(self) -> None:
         while True:
@@ -116,18 +129,31 @@ class VpsMonitorService:
                         *[self._poll_server(s) for s in servers],
                         return_exceptions=True,
                     )
+                    polled: list[tuple[int, dict]] = []
                     for server, result in zip(servers, results):
                         alias = server["alias"]
-                        if isinstance(result, Exception):
+                        if isinstance(result, MetricsParseError):
+                            # the host answered, so this isn't an outage
+                            logger.warning("VPS metrics from %s could not be parsed: %s", alias, result)
+                            if self._config.admin_id and alias not in self._unreadable:
+                                self._unreadable.add(alias)
+                                self._pending_alerts.append(
+                                    f"⚠️ Метрики сервера <b>{alias}</b> не читаются, мониторинг не работает\n"
+                                    f"<code>{html.escape(str(result))}</code>"
+                                )
+                        elif isinstance(result, Exception):
                             logger.warning("VPS poll failed for %s: %s", alias, result)
                             await self._maybe_alert(
                                 alias,
                                 f"🔴 Сервер <b>{alias}</b> недоступен!\n<code>{result}</code>",
                             )
                         else:
-                            await self._repo.add_vps_metric(server["id"], **result)
+                            self._unreadable.discard(alias)
+                            polled.append((server["id"], result))
                             await self._check_thresholds(server, result)
                             await self._check_container_changes(server, result)
+                    await self._repo.add_vps_metrics(polled)
+                    await self._flush_alerts()
             except Exception:
                 logger.exception("VPS monitor loop error")
 
@@ -136,18 +162,76 @@ class VpsMonitorService:
     async def _poll_server(self, server: dict) -> dict:
         import asyncssh  # lazy import — optional dependency
 
-        async with asyncssh.connect(
+        async with self._poll_sem:
+            key = (server["host"], server["port"], server["user"])
+            conn, cmd = self._conns.pop(key, (None, METRICS_CMD))
+            if conn is not None and conn.is_closed():
+                conn = None
+            if conn is not None:
+                try:
+                    stdout = await self._run_metrics(conn, cmd)
+                except (asyncssh.DisconnectError, asyncssh.ChannelOpenError, ConnectionError) as e:
+                    # the connection went stale between polls; retry once on a fresh one
+                    logger.debug("Reconnecting to %s: %s", server["alias"], e)
+                    await self._close(conn)
+                    conn = None
+            if conn is None:
+                conn = await self._connect(server)
+                cmd = await self._upload_script(conn, server["alias"])
+                stdout = await self._run_metrics(conn, cmd)
+            # kept only after a successful run; on errors the connection is dropped
+            self._conns[key] = (conn, cmd)
+            return _parse_metrics(stdout)
+
+    @staticmethod
+    async def _upload_script(conn, alias: str) -> str:
+        """Install METRICS_CMD as a script on the server; return the command to poll with."""
+        try:
+            # METRICS_CMD sticks to POSIX sh, so /bin/sh runs it like the login shell did
+            await conn.run(_UPLOAD_CMD, input=f"#!/bin/sh\n{METRICS_CMD}\n", check=True, timeout=15)
+        except Exception as e:
+            # read-only home or similar: keep sending the script inline
+            logger.debug("Metrics script upload to %s failed: %s", alias, e)
+            return METRICS_CMD
+        return f"./{METRICS_SCRIPT}"
+
+    @staticmethod
+    async def _run_metrics(conn, cmd: str) -> str:
+        try:
+            result = await conn.run(cmd, check=True, timeout=30)
+        except asyncio.CancelledError:
+            conn.close()  # no awaiting once cancelled
+            raise
+        except BaseException:
+            await VpsMonitorService._close(conn)
+            raise
+        return result.stdout
+
+    @staticmethod
+    async def _close(conn) -> None:
+        """Close an SSH connection and wait for its transport to shut down."""
+        conn.close()
+        try:
+            await asyncio.wait_for(conn.wait_closed(), timeout=5)
+        except Exception as e:
+            logger.debug("SSH connection did not close cleanly: %s", e)
+
+    async def _connect(self, server: dict):
+        import asyncssh  # lazy import — optional dependency
+
+        return await asyncssh.connect(
             server["host"],
             port=server["port"],
             username=server["user"],
             client_keys=[self._config.vps_ssh_key_path],
             known_hosts=None,
             connect_timeout=15,
-        ) as conn:
-            result = await conn.run(METRICS_CMD, check=True, timeout=30)
-            return _parse_metrics(result.stdout)
+            keepalive_interval=30,
+            keepalive_count_max=3,
+        )
 
     async def _maybe_alert(self, key: str, text: str) -> None:
+        """Queue an alert for this cycle unless the same key alerted within ALERT_COOLDOWN."""
         if not self._config.admin_id:
             return
         now = datetime.utcnow()
@@ -155,10 +239,22 @@ class VpsMonitorService:
         if last and now - last < self.ALERT_COOLDOWN:
             return
         self._last_alert[key] = now
-        try:
-            await self._bot.send_message(self._config.admin_id, text, parse_mode="HTML")
-        except Exception:
-            logger.exception("Failed to send VPS alert for %s", key)
+        self._pending_alerts.append(text)
+
+    async def _flush_alerts(self) -> None:
+        """Send the cycle's alerts as one message (split only at the Telegram length limit)."""
+        pending, self._pending_alerts = self._pending_alerts, []
+        chunks: list[str] = []
+        for text in pending:
+            if chunks and len(chunks[-1]) + 2 + len(text) <= 4096:
+                chunks[-1] += "\n\n" + text
+            else:
+                chunks.append(text)
+        for chunk in chunks:
+            try:
+                await self._bot.send_message(self._config.admin_id, chunk, parse_mode="HTML")
+            except Exception:
+                logger.exception("Failed to send VPS alerts")
 
     async def _check_thresholds(self, server: dict, metrics: dict) -> None:
         alias = server["alias"]
@@ -186,15 +282,15 @@ class VpsMonitorService:
         if not new_json:
             return
 
-        prev = await self._repo.get_vps_latest_metric(server["id"])
-        if not prev or not prev.get("containers_json"):
-            return
-
         try:
-            old_containers = {c["name"]: c["status"] for c in json.loads(prev["containers_json"])}
             new_containers = {c["name"]: c for c in json.loads(new_json)}
         except (json.JSONDecodeError, KeyError):
             return
+        # compared with the previous poll kept in memory: the latest DB row is this poll already
+        old_containers = self._last_containers.get(server["id"])
+        self._last_containers[server["id"]] = {name: c.get("status", "") for name, c in new_containers.items()}
+        if old_containers is None:
+            return
 
         alerts = []
         for name, new_c in new_containers.items():
@@ -2,7 +2,8 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from datetime import datetime
+import time
+from datetime import date
 
 import httpx
 
@@ -10,6 +11,8 @@ logger = logging.getLogger(__name__)
 
 _RETRY_ATTEMPTS = 3
 _RETRY_DELAY = 2.0  # seconds between retries
+# Open-Meteo updates hourly; the digest and /weather share one fetch per window
+CACHE_TTL = 600
 
 # WMO Weather interpretation codes → Russian description + emoji
 _WMO: dict[int, str] = {
@@ -44,8 +47,14 @@ _DAYS_RU = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
 BASE_URL = "https://api.open-meteo.com/v1/forecast"
 
 
-def _desc(code: int) -> str:
-    return _WMO.get(code, f"Неизвестно ({code})")
+# codes are 0..99, so a flat table indexed by code replaces the dict lookup
+_WMO_TABLE: tuple[str, ...] = tuple(_WMO.get(i, "") for i in range(100))
+
+
+def _desc(code: int | None) -> str:
+    # the API may send null (or omit the field) for the weather code
+    desc = _WMO_TABLE[code] if isinstance(code, int) and 0 <= code < 100 else ""
+    return desc or f"Неизвестно ({code})"
 
 
 class WeatherService:
@@ -56,9 +65,19 @@ class WeatherService:
         self._lon = lon
         self._city = city
         self._timezone = timezone
+        # one keep-alive connection pool for all requests
+        self._http = httpx.AsyncClient(timeout=25, limits=httpx.Limits(max_keepalive_connections=10))
+        self._cache: tuple[float, str] | None = None
+
+    async def aclose(self) -> None:
+        """Close HTTP connections (call on shutdown)."""
+        await self._http.aclose()
 
     async def get_forecast_text(self) -> str:
         """Return formatted weather block: current conditions + 5-day forecast."""
+        if self._cache is not None and time.monotonic() - self._cache[0] < CACHE_TTL:
+            return self._cache[1]
+
         params = {
             "latitude": self._lat,
             "longitude": self._lon,
@@ -72,10 +91,9 @@ class WeatherService:
         last_exc: Exception | None = None
         for attempt in range(1, _RETRY_ATTEMPTS + 1):
             try:
-                async with httpx.AsyncClient(timeout=25) as client:
-                    resp = await client.get(BASE_URL, params=params)
-                    resp.raise_for_status()
-                    data = resp.json()
+                resp = await self._http.get(BASE_URL, params=params)
+                resp.raise_for_status()
+                data = resp.json()
 
                 cur = data.get("current") or {}
                 daily = data.get("daily") or {}
@@ -101,16 +119,18 @@ class WeatherService:
                 precip = daily.get("precipitation_sum") or []
 
                 for i in range(1, min(6, len(dates))):
-                    date = datetime.strptime(dates[i], "%Y-%m-%d")
-                    day = _DAYS_RU[date.weekday()]
+                    day_date = date.fromisoformat(dates[i])
+                    day = _DAYS_RU[day_date.weekday()]
                     desc = _desc(codes[i] if i < len(codes) else 0)
                     hi = t_max[i] if i < len(t_max) else "?"
                     lo = t_min[i] if i < len(t_min) else "?"
                     rain = precip[i] if i < len(precip) else 0
                     rain_str = f", осадки {rain:.1f} мм" if rain else ""
-                    lines.append(f"{day} {date.strftime('%d.%m')}: {desc}, {lo}°..{hi}°{rain_str}")
+                    lines.append(f"{day} {day_date:%d.%m}: {desc}, {lo}°..{hi}°{rain_str}")
 
-                return "\n".join(lines)
+                text = "\n".join(lines)
+                self._cache = (time.monotonic(), text)
+                return text
 
             except Exception as exc:
                 last_exc = exc
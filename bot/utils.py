@@ -7,6 +7,83 @@ from aiogram.types import Message, InlineKeyboardMarkup
 
 logger = logging.getLogger(__name__)
 
+# first-person pronouns (ru + en) — a message without them rarely states personal facts.
+# Russian often drops the pronoun ("живу в Казани"), so common first-person verbs count too.
+_FIRST_PERSON_RE = re.compile(
+    r"\b(я|мой|моя|моё|мое|мои|меня|мне|мной|у нас|мы|наш|наша|i|i'm|my|me|mine"
+    r"|зовут|живу|работаю|учусь|люблю|обожаю|занимаюсь)\b",
+    re.IGNORECASE,
+)
+
+
+def likely_has_facts(text: str) -> bool:
+    """Cheap pre-check before spending an LLM call on fact extraction.
+
+    True only for messages long enough to state something, written in the
+    first person and not phrased as a question. Pasted code is skipped too:
+    identifiers like `my_list` or `me` would otherwise pass the pronoun check.
+    """
+    text = text.strip()
+    return (
+        len(text) >= 20
+        and not text.endswith("?")
+        and not text.startswith("```")
+        and _FIRST_PERSON_RE.search(text) is not None
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for when the API reports no usage.
+
+    English averages ~4 characters per token, Cyrillic and other non-ASCII
+    text is closer to 2, so len() // 4 badly undercounts Russian replies.
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return ascii_chars // 4 + (len(text) - ascii_chars) // 2
+
+
+def append_sources(text: str, sources: list[str]) -> str:
+    """Append a "Источники" list of citations to an answer in a single join."""
+    if not sources:
+        return text
+    return "\n".join((text, "\nИсточники:", *(f"• {s}" for s in sources)))
+
+
+# md_to_html rules fused into one pattern so the text is scanned once; the
+# leftmost match wins, and code spans are never formatted inside
+_MD_CHARS = "`*_~[#"
+_MD_RE = re.compile(
+    r"```\w*\n(?P<pre>.*?)```"                          # code block
+    r"|`(?P<code>[^`]+)`"                                # inline code
+    r"|\*\*\*(?P<bolditalic>.+?)\*\*\*"                   # bold italic ***text***
+    r"|\*\*(?P<bold>.+?)\*\*|__(?P<bold2>.+?)__"          # bold **text** or __text__
+    # italic *text* or _text_ (but not inside words with underscores; may contain bold)
+    r"|(?<!\w)\*(?P<italic>(?:[^*]|\*\*[^*]+\*\*)+?)\*(?![\w*])"
+    r"|(?<!\w)_(?P<italic2>(?:[^_]|__[^_]+__)+?)_(?!\w)"
+    r"|~~(?P<strike>[^\n]+?)~~"                          # strikethrough
+    r"|\[(?P<text>[^\]]+)\]\((?P<url>[^)]+)\)"            # links [text](url)
+    r"|^#{1,6}\s+(?P<header>[^\n]+)$",                  # headers ### text → bold
+    re.DOTALL | re.MULTILINE,
+)
+_MD_TAGS = {
+    "bold": "b", "bold2": "b", "italic": "i", "italic2": "i", "strike": "s", "header": "b",
+}
+
+
+def _md_repl(m: re.Match) -> str:
+    kind = m.lastgroup
+    if kind == "pre":
+        return f"<pre>{m['pre']}</pre>"
+    if kind == "code":
+        return f"<code>{m['code']}</code>"
+    if kind == "url":
+        return f'<a href="{m["url"]}">{_MD_RE.sub(_md_repl, m["text"])}</a>'
+    if kind == "bolditalic":
+        return f"<b><i>{_MD_RE.sub(_md_repl, m[kind])}</i></b>"
+    tag = _MD_TAGS[kind]
+    # formatting may nest (**bold _italic_**), so convert the inner text too
+    return f"<{tag}>{_MD_RE.sub(_md_repl, m[kind])}</{tag}>"
+
 
 def md_to_html(text: str) -> str:
     """Convert common Markdown to Telegram HTML.
@@ -16,39 +93,28 @@ def md_to_html(text: str) -> str:
     """
     # escape raw HTML chars before adding our own tags
     text = html.escape(text, quote=False)
-    # code blocks ``` ... ```
-    text = re.sub(r"```(\w*)\n(.*?)```", r"<pre>\2</pre>", text, flags=re.DOTALL)
-    # inline code
-    text = re.sub(r"`([^`]+)`", r"<code>\1</code>", text)
-    # bold **text** or __text__
-    text = re.sub(r"\*\*(.+?)\*\*", r"<b>\1</b>", text, flags=re.DOTALL)
-    text = re.sub(r"__(.+?)__", r"<b>\1</b>", text, flags=re.DOTALL)
-    # italic *text* or _text_ (but not inside words with underscores)
-    text = re.sub(r"(?<!\w)\*([^*]+?)\*(?!\w)", r"<i>\1</i>", text)
-    text = re.sub(r"(?<!\w)_([^_]+?)_(?!\w)", r"<i>\1</i>", text)
-    # strikethrough ~~text~~
-    text = re.sub(r"~~(.+?)~~", r"<s>\1</s>", text)
-    # links [text](url)
-    text = re.sub(r"\[([^\]]+)\]\(([^)]+)\)", r'<a href="\2">\1</a>', text)
-    # headers ### text → bold
-    text = re.sub(r"^#{1,6}\s+(.+)$", r"<b>\1</b>", text, flags=re.MULTILINE)
-    return text
+    # most replies have no markup at all
+    if not any(c in text for c in _MD_CHARS):
+        return text
+    return _MD_RE.sub(_md_repl, text)
 
 
 async def safe_edit(msg: Message, text: str, reply_markup: InlineKeyboardMarkup | None = None) -> None:
     """Edit message with HTML formatting, fallback to plain text."""
+    text = text[:4096]  # same object when already short enough
     try:
-        await msg.edit_text(md_to_html(text[:4096]), parse_mode="HTML", reply_markup=reply_markup)
+        await msg.edit_text(md_to_html(text), parse_mode="HTML", reply_markup=reply_markup)
     except Exception:
         try:
-            await msg.edit_text(text[:4096], reply_markup=reply_markup)
+            await msg.edit_text(text, reply_markup=reply_markup)
         except Exception:
             pass
 
 
 async def safe_reply(msg: Message, text: str, reply_markup: InlineKeyboardMarkup | None = None) -> Message:
     """Send message with HTML formatting, fallback to plain text."""
+    text = text[:4096]
     try:
-        return await msg.answer(md_to_html(text[:4096]), parse_mode="HTML", reply_markup=reply_markup)
+        return await msg.answer(md_to_html(text), parse_mode="HTML", reply_markup=reply_markup)
     except Exception:
-        return await msg.answer(text[:4096], reply_markup=reply_markup)
+        return await msg.answer(text, reply_markup=reply_markup)
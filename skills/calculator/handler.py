@@ -2,9 +2,11 @@
 from __future__ import annotations
 
 import ast
+import functools
 import math
 import operator
 import re
+from types import CodeType
 
 # safe operators
 OPERATORS = {
@@ -33,46 +35,57 @@ SAFE_FUNCS = {
 }
 
 
-def _eval_node(node):
+def _check_node(node) -> None:
+    """Raise ValueError unless the tree only uses whitelisted numbers, operators and names."""
     if isinstance(node, ast.Constant):
-        if isinstance(node.value, (int, float)):
-            return node.value
-        raise ValueError(f"Unsupported constant: {node.value}")
+        if not isinstance(node.value, (int, float)):
+            raise ValueError(f"Unsupported constant: {node.value}")
     elif isinstance(node, ast.BinOp):
-        left = _eval_node(node.left)
-        right = _eval_node(node.right)
-        op = OPERATORS.get(type(node.op))
-        if op is None:
+        if type(node.op) not in OPERATORS:
             raise ValueError(f"Unsupported operator: {type(node.op).__name__}")
-        return op(left, right)
+        _check_node(node.left)
+        _check_node(node.right)
     elif isinstance(node, ast.UnaryOp):
-        operand = _eval_node(node.operand)
-        op = OPERATORS.get(type(node.op))
-        if op is None:
+        if type(node.op) not in OPERATORS:
             raise ValueError(f"Unsupported operator: {type(node.op).__name__}")
-        return op(operand)
+        _check_node(node.operand)
     elif isinstance(node, ast.Call):
-        if isinstance(node.func, ast.Name) and node.func.id in SAFE_FUNCS:
-            func = SAFE_FUNCS[node.func.id]
-            if callable(func):
-                args = [_eval_node(a) for a in node.args]
-                return func(*args)
-        raise ValueError(f"Unsupported function: {ast.dump(node.func)}")
+        if (
+            not isinstance(node.func, ast.Name)
+            or not callable(SAFE_FUNCS.get(node.func.id))
+            or node.keywords
+        ):
+            raise ValueError(f"Unsupported function: {ast.dump(node.func)}")
+        for arg in node.args:
+            _check_node(arg)
     elif isinstance(node, ast.Name):
-        if node.id in SAFE_FUNCS:
-            val = SAFE_FUNCS[node.id]
-            if not callable(val):
-                return val
-        raise ValueError(f"Unknown name: {node.id}")
+        if node.id not in SAFE_FUNCS or callable(SAFE_FUNCS[node.id]):
+            raise ValueError(f"Unknown name: {node.id}")
     elif isinstance(node, ast.Expression):
-        return _eval_node(node.body)
-    raise ValueError(f"Unsupported node: {type(node).__name__}")
+        _check_node(node.body)
+    else:
+        raise ValueError(f"Unsupported node: {type(node).__name__}")
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(expr: str) -> CodeType:
+    """Parse and validate once; the checked tree is then evaluated by CPython itself."""
+    tree = ast.parse(expr, mode="eval")
+    _check_node(tree)
+    return compile(tree, "<calc>", "eval")
+
+
+# command prefix and "15% of 250" pattern, compiled once
+_PREFIX_RE = re.compile(r"(?:/calc|посчитай|вычисли|calculate|compute) ", re.IGNORECASE)
+_PCT_RE = re.compile(r"([\d.]+)\s*%\s*(?:of|от)\s*([\d.]+)", re.IGNORECASE)
+
+# only the whitelisted names are visible to the compiled expression
+_EVAL_GLOBALS = {"__builtins__": {}, **SAFE_FUNCS}
 
 
 def safe_eval(expr: str) -> float:
     """Safely evaluate a mathematical expression."""
-    tree = ast.parse(expr, mode="eval")
-    return _eval_node(tree)
+    return eval(_compile(expr), _EVAL_GLOBALS)
 
 
 def execute(query: str, **kwargs) -> str:
@@ -80,15 +93,14 @@ def execute(query: str, **kwargs) -> str:
     # try to extract expression: remove common words
     expr = query.strip()
     # remove command prefix
-    for prefix in ("/calc ", "посчитай ", "вычисли ", "calculate ", "compute "):
-        if expr.lower().startswith(prefix):
-            expr = expr[len(prefix):]
-            break
+    prefix = _PREFIX_RE.match(expr)
+    if prefix:
+        expr = expr[prefix.end():]
 
     # replace common symbols
     expr = expr.replace("^", "**").replace("×", "*").replace("÷", "/")
     # replace percentage pattern: "15% of 250" → "0.15 * 250"
-    pct = re.match(r"([\d.]+)\s*%\s*(?:of|от)\s*([\d.]+)", expr, re.IGNORECASE)
+    pct = _PCT_RE.match(expr)
     if pct:
         expr = f"{float(pct.group(1)) / 100} * {pct.group(2)}"
 
@@ -1,9 +1,18 @@
 """Code runner skill — executes Python in a restricted sandbox."""
 from __future__ import annotations
 
+import asyncio
 import io
+import os
 import contextlib
-import threading
+import signal
+import sys
+from types import CodeType
+
+try:
+    import resource
+except ImportError:  # not POSIX: only the wall-clock timeout applies
+    resource = None
 
 SAFE_BUILTINS = {
     "abs": abs, "all": all, "any": any, "bin": bin, "bool": bool,
@@ -21,50 +30,105 @@ SAFE_BUILTINS = {
 MAX_OUTPUT = 2000
 TIMEOUT_SECONDS = 5
 TIMEOUT_MSG = f"Execution timed out (max {TIMEOUT_SECONDS}s)"
+MEMORY_LIMIT = 256 * 1024 * 1024  # address space of the child process, bytes
+
+
+class _OutputTruncated(BaseException):
+    """Stops the code once MAX_OUTPUT is reached (BaseException: user `except Exception` can't swallow it)."""
+
+
+class _BoundedIO(io.StringIO):
+    """stdout that keeps at most MAX_OUTPUT characters instead of buffering everything."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._size = 0
+
+    def write(self, s: str) -> int:
+        room = MAX_OUTPUT - self._size
+        if len(s) > room:
+            super().write(s[:room])
+            self._size = MAX_OUTPUT
+            raise _OutputTruncated
+        self._size += len(s)
+        return super().write(s)
+
+
+def _compile(code: str) -> tuple[CodeType, bool]:
+    """Compile as an expression if possible (its value gets printed), else as statements."""
+    try:
+        return compile(code, "<run>", "eval"), True
+    except SyntaxError:
+        return compile(code, "<run>", "exec"), False
 
 
 def _run_in_sandbox(code: str) -> str:
-    stdout = io.StringIO()
+    stdout = _BoundedIO()
     sandbox = {"__builtins__": SAFE_BUILTINS}
     try:
+        compiled, is_expr = _compile(code)
         with contextlib.redirect_stdout(stdout):
-            try:
-                result = eval(code, sandbox)
+            if is_expr:
+                result = eval(compiled, sandbox)
                 if result is not None:
                     print(repr(result))
-            except SyntaxError:
-                exec(code, sandbox)
+            else:
+                exec(compiled, sandbox)
+    except _OutputTruncated:
+        return stdout.getvalue() + "\n... (truncated)"
     except Exception as e:
         return f"Error: {type(e).__name__}: {e}"
 
     output = stdout.getvalue()
     if not output:
         return "Code executed successfully (no output)"
-    if len(output) > MAX_OUTPUT:
-        output = output[:MAX_OUTPUT] + "\n... (truncated)"
     return output
 
 
-def execute(query: str, **kwargs) -> str:
-    """Run Python code in sandbox with a hard 5-second timeout."""
+def _limit_resources() -> None:
+    """Called first thing in the child: the kernel stops runaway CPU and memory use."""
+    resource.setrlimit(resource.RLIMIT_CPU, (TIMEOUT_SECONDS, TIMEOUT_SECONDS))
+    resource.setrlimit(resource.RLIMIT_AS, (MEMORY_LIMIT, MEMORY_LIMIT))
+
+
+async def execute(query: str, **kwargs) -> str:
+    """Run Python code in sandbox with a hard 5-second timeout.
+
+    The code runs in a separate interpreter process (this file as a script),
+    so an endless loop is killed instead of spinning in a thread forever.
+    """
     code = query.strip()
-    for prefix in ("/run ", "/run\n"):
-        if code.startswith(prefix):
-            code = code[len(prefix):]
-            break
+    if code[:5] in ("/run ", "/run\n"):
+        code = code[5:]
 
     if not code:
         return "No code provided. Usage: /run <python code>"
 
-    result: list[str] = []
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-I", __file__,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+        # no bot token or API keys in the process that runs user code
+        env={"PATH": os.defpath},
+    )
+    try:
+        output, _ = await asyncio.wait_for(proc.communicate(code.encode()), TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return TIMEOUT_MSG
 
-    def _run() -> None:
-        result.append(_run_in_sandbox(code))
+    if proc.returncode == -getattr(signal, "SIGXCPU", 0):
+        return TIMEOUT_MSG
+    if proc.returncode != 0:
+        return f"Error: sandbox exited with code {proc.returncode}"
+    return output.decode(errors="replace") or "Code executed successfully (no output)"
 
-    thread = threading.Thread(target=_run, daemon=True)
-    thread.start()
-    thread.join(timeout=TIMEOUT_SECONDS)
 
-    if thread.is_alive():
-        return TIMEOUT_MSG
-    return result[0] if result else "Code executed successfully (no output)"
+if __name__ == "__main__":
+    # set here rather than via preexec_fn, which is unsafe to fork with while the bot runs threads
+    if resource:
+        _limit_resources()
+    # bytes on both pipes, whatever the child's locale
+    sys.stdout.buffer.write(_run_in_sandbox(sys.stdin.buffer.read().decode()).encode())
@@ -1,7 +1,10 @@
 """DateTime skill — provides current date/time info."""
 from __future__ import annotations
 
+import re
 from datetime import datetime, timezone, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 TIMEZONES = {
     "msk": ("Europe/Moscow", 3),
@@ -23,29 +26,41 @@ TIMEZONES = {
     "челябинск": ("Asia/Yekaterinburg", 5),
     "екатеринбург": ("Asia/Yekaterinburg", 5),
 }
+# all zone names in one pattern, so the query is scanned once
+_TZ_RE = re.compile("|".join(map(re.escape, TIMEZONES)), re.IGNORECASE)
+
+
+@lru_cache(maxsize=None)
+def _tz(name: str, offset: int):
+    """Real zone (with DST) when tz data is available, else the fixed standard offset."""
+    try:
+        return ZoneInfo(name)
+    except ZoneInfoNotFoundError:
+        return timezone(timedelta(hours=offset))
+
+
+# both lines in one strftime call
+_DATE_TIME_FMT = "Date: %Y-%m-%d\nTime: %H:%M:%S"
+_WEEKDAYS_RU = ("Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье")
 
 
 def execute(query: str, **kwargs) -> str:
     """Return current date/time, optionally for a specific timezone."""
-    query_lower = query.lower()
-
     # find timezone in query
     tz_name = "Europe/Moscow"
     tz_offset = 3
-    for key, (name, offset) in TIMEZONES.items():
-        if key in query_lower:
-            tz_name = name
-            tz_offset = offset
-            break
-
-    now = datetime.now(timezone(timedelta(hours=tz_offset)))
+    m = _TZ_RE.search(query)
+    if m:
+        tz_name, tz_offset = TIMEZONES[m.group().lower()]
 
-    weekdays_ru = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+    now = datetime.now(_tz(tz_name, tz_offset))
+    offset_min = int(now.utcoffset().total_seconds()) // 60
+    hours, minutes = divmod(abs(offset_min), 60)
+    utc_offset = ("-" if offset_min < 0 else "+") + str(hours) + (f":{minutes:02d}" if minutes else "")
 
     return (
-        f"Timezone: {tz_name} (UTC{tz_offset:+d})\n"
-        f"Date: {now.strftime('%Y-%m-%d')}\n"
-        f"Time: {now.strftime('%H:%M:%S')}\n"
-        f"Day: {weekdays_ru[now.weekday()]}\n"
+        f"Timezone: {tz_name} (UTC{utc_offset})\n"
+        f"{now.strftime(_DATE_TIME_FMT)}\n"
+        f"Day: {_WEEKDAYS_RU[now.weekday()]}\n"
         f"ISO: {now.isoformat()}"
     )
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+from bot.services.gemini import (
+    MAX_SOURCES,
+    RATE_LIMIT_MAX_BACKOFF,
+    _collect_sources,
+    _is_rate_limit,
+    _retry_delay,
+    _sniff_mime,
+)
+
+
+def _grounded(*uris):
+    chunks = [SimpleNamespace(web=SimpleNamespace(uri=u, title=f"T{u}")) for u in uris]
+    gm = SimpleNamespace(grounding_chunks=chunks)
+    return SimpleNamespace(candidates=[SimpleNamespace(grounding_metadata=gm)])
+
+
+class TestIsRateLimit:
+    def test_http_429(self):
+        assert _is_rate_limit("429 Too Many Requests")
+
+    def test_resource_exhausted(self):
+        assert _is_rate_limit("RESOURCE_EXHAUSTED: quota exceeded")
+
+    def test_other_error(self):
+        assert not _is_rate_limit("500 Internal Server Error")
+
+
+class TestRetryDelay:
+    def test_retry_delay_field(self):
+        assert _retry_delay("""{'retryDelay': '37s'}""") == 37.0
+
+    def test_retry_in_phrase(self):
+        assert _retry_delay("Please retry in 12.5s.") == 12.5
+
+    def test_retry_after_header(self):
+        assert _retry_delay("Retry-After: 30") == 30.0
+
+    def test_capped(self):
+        assert _retry_delay("retry in 3600s") == RATE_LIMIT_MAX_BACKOFF
+
+    def test_missing(self):
+        assert _retry_delay("429 RESOURCE_EXHAUSTED") is None
+
+
+class TestSniffMime:
+    def test_jpeg(self):
+        assert _sniff_mime(b"\xff\xd8\xff\xe0rest") == "image/jpeg"
+
+    def test_png(self):
+        assert _sniff_mime(b"\x89PNG\r\n\x1a\n....") == "image/png"
+
+    def test_webp(self):
+        assert _sniff_mime(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+
+    def test_gif(self):
+        assert _sniff_mime(b"GIF89a...") == "image/gif"
+
+    def test_unknown(self):
+        assert _sniff_mime(b"<html>") is None
+
+
+class TestCollectSources:
+    def test_dedup_by_uri(self):
+        sources: list[str] = []
+        seen: set[str] = set()
+        _collect_sources(_grounded("a", "b", "a"), sources, seen)
+        _collect_sources(_grounded("b", "c"), sources, seen)
+        assert sources == ["[Ta](a)", "[Tb](b)", "[Tc](c)"]
+
+    def test_capped(self):
+        sources: list[str] = []
+        _collect_sources(_grounded(*"abcdefgh"), sources, set())
+        assert len(sources) == MAX_SOURCES
+
+    def test_no_grounding(self):
+        sources: list[str] = []
+        _collect_sources(SimpleNamespace(candidates=[SimpleNamespace(grounding_metadata=None)]), sources, set())
+        assert sources == []
@@ -0,0 +1,395 @@
+import asyncio
+import base64
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+
+from bot.services.llm import MAX_SOURCES, _b64_encode_stream, _consume_stream, _response_sources, _split_facts_block
+
+
+@pytest_asyncio.fixture
+async def repo():
+    from bot.database.repository import Repository
+
+    repo = Repository(":memory:")
+    await repo.connect()
+    await repo.upsert_user(1, "user", "User")
+    yield repo
+    await repo.close()
+
+
+@pytest_asyncio.fixture
+async def make_llm(monkeypatch):
+    """LLMService factory (env is read at call time); every service built is closed after the test.
+
+    Request it after `repo`, so services are closed before the database.
+    """
+    from bot.config import Config
+    from bot.services.llm import LLMService
+
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "x")
+    monkeypatch.setenv("OPENAI_API_KEY", "x")
+    built: list[tuple] = []
+
+    def make(repo=None) -> LLMService:
+        llm = LLMService(Config.from_env(), repo)
+        built.append((llm, llm._http, llm._client))
+        return llm
+
+    yield make
+    for llm, http, client in built:
+        llm._http, llm._client = http, client  # tests may swap in fakes
+        await llm.aclose()
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+async def _stream(*texts):
+    for text in texts:
+        yield _chunk(text)
+
+
+def test_consume_stream_joins_deltas():
+    sent: list[str] = []
+
+    async def edit(text: str) -> None:
+        sent.append(text)
+
+    full = asyncio.run(_consume_stream(_stream("Hel", None, "lo", ""), edit))
+    assert full == "Hello"
+    assert sent[-1] == "Hello"
+
+
+def test_consume_stream_empty_sends_nothing():
+    sent: list[str] = []
+
+    async def edit(text: str) -> None:
+        sent.append(text)
+
+    assert asyncio.run(_consume_stream(_stream(None), edit)) == ""
+    assert sent == []
+
+
+def test_consume_stream_records_usage_chunk():
+    async def stream():
+        yield _chunk("Hi")
+        yield SimpleNamespace(choices=[], usage=SimpleNamespace(total_tokens=42))
+
+    async def edit(text: str) -> None:
+        pass
+
+    usage: dict = {}
+    assert asyncio.run(_consume_stream(stream(), edit, usage)) == "Hi"
+    assert usage == {"total_tokens": 42}
+
+
+async def _bytes(*parts):
+    for part in parts:
+        yield part
+
+
+def test_b64_encode_stream_matches_one_shot_encoding():
+    parts = (b"a", b"bcde", b"", b"fghijklm", b"no")
+    encoded = asyncio.run(_b64_encode_stream(_bytes(*parts)))
+    assert encoded == base64.b64encode(b"".join(parts)).decode()
+
+
+@pytest.mark.asyncio
+async def test_memory_prompt_cache_follows_fact_changes(repo, make_llm):
+    llm = make_llm(repo)
+    prompts = [(await llm._prepare_turn(1, "hi"))[3]]
+    await repo.add_user_fact(1, "Likes tea")
+    prompts.append((await llm._prepare_turn(1, "hi"))[3])
+    prompts.append((await llm._prepare_turn(1, "hi"))[3])
+    await repo.clear_user_memory(1)
+    prompts.append((await llm._prepare_turn(1, "hi"))[3])
+
+    empty, with_fact, cached, cleared = prompts
+    assert empty == "" and cleared == ""
+    assert "Likes tea" in with_fact
+    assert cached is with_fact
+
+
+@pytest.mark.asyncio
+async def test_prepare_turn_trims_history_to_char_budget(repo, make_llm, monkeypatch):
+    monkeypatch.setenv("MAX_CONTEXT_TOKENS", "10")  # 40 chars
+    llm = make_llm(repo)
+    conv = await repo.create_conversation(1, "gpt-4o")
+    await repo.finalize_turn(conv["id"], 1, "a" * 15, "b" * 15, 0, "chat", "gpt-4o")
+    _, conv, history, memory_prompt = await llm._prepare_turn(1, "c" * 15)
+    messages = llm._build_messages(conv, history, memory_prompt)
+    assert [m["content"] for m in messages][1:] == ["b" * 15, "c" * 15]
+
+
+@pytest.mark.asyncio
+async def test_fact_extraction_runs_once_per_user_at_a_time(make_llm):
+    llm = make_llm()
+    calls: list[tuple[int, str]] = []
+
+    async def fake_extract(user_id, user_message, reply):
+        await asyncio.sleep(0.01)
+        calls.append((user_id, user_message))
+
+    llm._extract_and_save_facts = fake_extract
+    msg = "Меня зовут Пётр, я живу в Москве"
+
+    llm._schedule_fact_extraction(1, msg, "ok")
+    llm._schedule_fact_extraction(1, msg + "!", "ok")  # user 1 is busy — skipped
+    llm._schedule_fact_extraction(2, msg, "ok")
+    llm._schedule_fact_extraction(3, "hi", "ok")  # no facts — skipped
+    await asyncio.gather(*llm._bg_tasks)
+    llm._schedule_fact_extraction(1, msg, "ok")  # previous extraction finished
+    await asyncio.gather(*llm._bg_tasks)
+    assert sorted(calls) == [(1, msg), (1, msg), (2, msg)]
+
+
+def _responses_output(*urls):
+    anns = [SimpleNamespace(url=u, title=f"T{u}") for u in urls]
+    return SimpleNamespace(output=[
+        SimpleNamespace(type="web_search_call"),
+        SimpleNamespace(content=[SimpleNamespace(annotations=anns), SimpleNamespace(text="no annotations")]),
+    ])
+
+
+def test_response_sources_dedup_by_url():
+    assert _response_sources(_responses_output("a", "b", "a")) == ["[Ta](a)", "[Tb](b)"]
+
+
+def test_response_sources_capped():
+    assert len(_response_sources(_responses_output(*"abcdefgh"))) == MAX_SOURCES
+
+
+@pytest.mark.asyncio
+async def test_search_decision_cached_for_repeated_text(make_llm):
+    llm = make_llm()
+    asked: list[str] = []
+
+    async def decide(text: str) -> bool:
+        asked.append(text)
+        return "чемпионат" in text.lower()
+
+    assert [
+        await llm._cached_search_decision("Кто выиграл чемпионат мира", decide),
+        await llm._cached_search_decision("  кто выиграл   чемпионат мира ", decide),
+        await llm._cached_search_decision("Напиши стих про осень", decide),
+    ] == [True, True, False]
+    assert asked == ["Кто выиграл чемпионат мира", "Напиши стих про осень"]
+
+
+def test_search_hint_decides_obvious_cases():
+    from bot.services.llm import _search_hint
+
+    assert _search_hint("Какая погода в Москве завтра") is True
+    assert _search_hint("latest news about SpaceX") is True
+    assert _search_hint("Привет!") is False
+    assert _search_hint("```python\nprint(1)\n``` почему не работает") is False
+    assert _search_hint("Объясни, как работает TCP handshake") is None
+
+
+@pytest.mark.asyncio
+async def test_route_and_extract_parses_json(make_llm):
+    llm = make_llm()
+    replies = iter(['{"search": "yes", "facts": ["Lives in Berlin"]}', "not json", "[1, 2]"])
+
+    async def create(**kwargs):
+        assert kwargs["response_format"] == {"type": "json_object"}
+        message = SimpleNamespace(content=next(replies))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    llm._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    results = [await llm._route_and_extract_openai("I live in Berlin, weather?") for _ in range(3)]
+    assert results == [(True, ["Lives in Berlin"]), (False, []), (False, [])]
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_duplicate_requests(make_llm):
+    llm = make_llm()
+    calls: list[str] = []
+
+    async def fake_chat_openai(user_id, user_message, cached=True):
+        calls.append(user_message)
+        await asyncio.sleep(0.01)
+        return f"answer to {user_message}"
+
+    llm._chat_openai = fake_chat_openai
+
+    results = await asyncio.gather(llm.chat(1, "hi"), llm.chat(1, "hi"), llm.chat(2, "hi"), llm.chat(1, "bye"))
+    results.append(await llm.chat(1, "hi"))  # nothing in flight any more
+    assert results == ["answer to hi", "answer to hi", "answer to hi", "answer to bye", "answer to hi"]
+    assert calls == ["hi", "hi", "bye", "hi"]
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_errors(make_llm):
+    llm = make_llm()
+
+    async def failing(user_id, user_message, cached=True):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    llm._chat_openai = failing
+
+    results = await asyncio.gather(llm.chat(1, "hi"), llm.chat(1, "hi"), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert llm._inflight_calls == {}
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cancelled_leader_fails_waiters_normally(make_llm):
+    llm = make_llm()
+
+    async def slow(user_id, user_message, cached=True):
+        await asyncio.sleep(1)
+
+    llm._chat_openai = slow
+
+    leader = asyncio.create_task(llm.chat(1, "hi"))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(llm.chat(1, "hi"))
+    await asyncio.sleep(0)
+    leader.cancel()
+    leader_result, waiter_result = await asyncio.gather(leader, waiter, return_exceptions=True)
+    assert isinstance(leader_result, asyncio.CancelledError)
+    assert isinstance(waiter_result, RuntimeError)
+
+
+@pytest.mark.asyncio
+async def test_next_request_sees_exchange_stored_in_background(repo, make_llm):
+    llm = make_llm(repo)
+    seen: list[list[str]] = []
+
+    async def fake_chat_openai(user_id, user_message, cached=True):
+        conv_id, _, history, _ = await llm._prepare_turn(user_id, user_message)
+        seen.append([m["content"] for m in history])
+        llm._store_turn(conv_id, user_id, user_message, f"re: {user_message}", 0, "chat", "gpt-4o")
+        return f"re: {user_message}"
+
+    llm._chat_openai = fake_chat_openai
+    await llm.chat(1, "first")
+    await llm.chat(1, "second")
+    assert seen[1] == ["first", "re: first", "second"]
+
+
+@pytest.mark.asyncio
+async def test_identical_chat_requests_of_a_user_served_from_cache(repo, make_llm):
+    calls = 0
+
+    async def fake_create(**kwargs):
+        nonlocal calls
+        calls += 1
+        message = SimpleNamespace(content=f"answer {calls}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=SimpleNamespace(total_tokens=10))
+
+    await repo.upsert_user(2, "two", "Two")
+    llm = make_llm(repo)
+    llm._client.chat.completions.create = fake_create
+    first = await llm.chat(1, "what can you do")
+    await repo.create_conversation(1, llm._config.default_model)
+    repeated = await llm.chat(1, "what can you do")  # same prompt and (empty) history
+    other_user = await llm.chat(2, "what can you do")  # never served another user's answer
+    retried = await llm.retry_last(2)
+    await llm._wait_stored(1)
+    usage = await repo.get_usage_totals(1)
+
+    assert (first, repeated, other_user, retried, usage) == ("answer 1", "answer 1", "answer 2", "answer 3", (20, 20))
+    assert calls == 3
+
+
+@pytest.mark.asyncio
+async def test_request_respects_concurrency_limit(make_llm, monkeypatch):
+    monkeypatch.setenv("OPENAI_MAX_CONCURRENCY", "2")
+    active = peak = 0
+
+    async def create(**kwargs):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return kwargs["model"]
+
+    llm = make_llm()
+    results = await asyncio.gather(*(llm._request(create, model=str(i), messages=[]) for i in range(5)))
+    assert results == ["0", "1", "2", "3", "4"]
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_stream_holds_concurrency_slot_until_consumed(make_llm, monkeypatch):
+    monkeypatch.setenv("OPENAI_MAX_CONCURRENCY", "1")
+    active = peak = 0
+
+    async def body(text):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        yield _chunk(text)
+        active -= 1
+
+    async def create(**kwargs):
+        return body(kwargs["model"])
+
+    async def edit(text: str) -> None:
+        pass
+
+    llm = make_llm()
+    llm._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    results = await asyncio.gather(*(llm._request_stream(edit, {}, model=str(i), messages=[]) for i in range(3)))
+    assert results == ["0", "1", "2"]
+    assert peak == 1
+
+
+def test_split_facts_block_strips_block_from_reply():
+    reply, facts = _split_facts_block("Nice to meet you!\n<facts>\n- Lives in Berlin\nHas a cat\n</facts>")
+    assert reply == "Nice to meet you!"
+    assert facts == ["Lives in Berlin", "Has a cat"]
+
+
+def test_split_facts_block_without_facts():
+    assert _split_facts_block("Hello") == ("Hello", [])
+    assert _split_facts_block("Hello\n<facts>NONE</facts>") == ("Hello", [])
+    # a reply cut off inside the block still hides it
+    assert _split_facts_block("Hello <facts>Likes tea") == ("Hello", ["Likes tea"])
+
+
+@pytest.mark.asyncio
+async def test_image_data_url_cached_per_url(make_llm):
+    import httpx
+
+    requests: list[str] = []
+
+    def handler(request):
+        requests.append(str(request.url))
+        return httpx.Response(200, content=b"png-bytes", headers={"content-type": "image/png"})
+
+    llm = make_llm()
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as llm._http:
+        first = await llm._image_data_url("https://example.com/a.png")
+        second = await llm._image_data_url("https://example.com/a.png")
+    assert first == second == "data:image/png;base64," + base64.b64encode(b"png-bytes").decode()
+    assert requests == ["https://example.com/a.png"]
+
+
+@pytest.mark.asyncio
+async def test_image_data_url_rejects_oversized_image(make_llm, monkeypatch):
+    import httpx
+
+    from bot.services import llm as llm_module
+
+    monkeypatch.setattr(llm_module, "MAX_IMAGE_BYTES", 8)
+    bodies = {
+        # no Content-Length: the cap is hit while reading
+        "/stream.png": httpx.Response(200, content=_bytes(b"12345", b"67890")),
+        "/declared.png": httpx.Response(200, content=b"1234567890"),
+    }
+    llm = make_llm()
+    async with httpx.AsyncClient(transport=httpx.MockTransport(lambda r: bodies[r.url.path])) as llm._http:
+        for path in bodies:
+            with pytest.raises(ValueError):
+                await llm._image_data_url(f"https://example.com{path}")
+    assert llm._image_cache == {}
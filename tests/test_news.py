@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httpx
+
+from bot.services.news import fetch_feed, get_news_for_user
+
+
+def _rss(*ages_hours: int) -> bytes:
+    now = datetime.now(timezone.utc)
+    items = "".join(
+        f"<item><title>Item {i}</title><link>https://example.com/{i}</link>"
+        f"<pubDate>{format_datetime(now - timedelta(hours=age))}</pubDate></item>"
+        for i, age in enumerate(ages_hours)
+    )
+    return f'<?xml version="1.0"?><rss version="2.0"><channel><title>t</title>{items}</channel></rss>'.encode()
+
+
+def _fetch(body: bytes) -> list[dict]:
+    async def run():
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await fetch_feed("https://example.com/rss", client)
+
+    return asyncio.run(run())
+
+
+def test_fetch_feed_skips_old_entries():
+    items = _fetch(_rss(1, 30, 2))
+    assert [i["title"] for i in items] == ["Item 0", "Item 2"]
+
+
+def test_fetch_feed_stops_after_stale_run():
+    items = _fetch(_rss(1, 30, 40, 50, 3))
+    assert [i["title"] for i in items] == ["Item 0"]
+
+
+def test_fetch_feed_http_error_returns_empty():
+    async def run():
+        transport = httpx.MockTransport(lambda request: httpx.Response(500))
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await fetch_feed("https://example.com/rss", client)
+
+    assert asyncio.run(run()) == []
+
+
+def test_get_news_for_user_filters_and_orders(monkeypatch):
+    now = datetime.now(timezone.utc)
+
+    class FakeRepo:
+        async def list_news_sources(self, user_id):
+            return [{"name": "A", "url": "https://a.example/rss"}, {"name": "B", "url": "https://b.example/rss"}]
+
+        async def get_shown_urls_last_24h(self, user_id):
+            return {"https://a.example/seen"}
+
+        async def get_disliked_sources(self, user_id):
+            return ["B"]
+
+    feeds = {
+        "https://a.example/rss": [
+            {"title": "a1", "url": "https://a.example/1", "published": now - timedelta(hours=3)},
+            {"title": "seen", "url": "https://a.example/seen", "published": now},
+            {"title": "a2", "url": "https://a.example/2", "published": now - timedelta(hours=1)},
+        ],
+        "https://b.example/rss": [
+            {"title": "b1", "url": "https://b.example/1", "published": now},
+            {"title": "b2", "url": "https://b.example/2", "published": now - timedelta(hours=2)},
+        ],
+    }
+
+    async def fake_fetch(url, client):
+        return [dict(item) for item in feeds[url]]
+
+    monkeypatch.setattr("bot.services.news.fetch_feed", fake_fetch)
+    items = asyncio.run(get_news_for_user(1, FakeRepo(), max_items=3))
+
+    assert [i["title"] for i in items] == ["a2", "a1", "b1"]
+    assert items[2]["source"] == "B"
@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from bot.services.rate_limiter import AsyncTokenBucket
+
+
+async def _acquire_n(bucket: AsyncTokenBucket, n: int) -> float:
+    start = time.monotonic()
+    for _ in range(n):
+        await bucket.acquire()
+    return time.monotonic() - start
+
+
+def test_burst_does_not_wait():
+    bucket = AsyncTokenBucket(5, 60)
+    assert asyncio.run(_acquire_n(bucket, 5)) < 0.05
+
+
+def test_waits_for_refill_when_empty():
+    # 10 tokens/second: the 3rd acquire on a 2-token bucket waits ~0.1s
+    bucket = AsyncTokenBucket(2, 0.2)
+    elapsed = asyncio.run(_acquire_n(bucket, 3))
+    assert 0.08 <= elapsed < 0.5
+
+
+def test_wait_time_zero_when_tokens_left():
+    bucket = AsyncTokenBucket(1, 60)
+    assert bucket.wait_time() == 0.0
+
+
+def test_wait_time_positive_when_empty():
+    bucket = AsyncTokenBucket(1, 60)
+    asyncio.run(bucket.acquire())
+    assert 59 < bucket.wait_time() <= 60
+
+
+def test_acquire_amount_takes_several_tokens():
+    bucket = AsyncTokenBucket(10, 60)
+    asyncio.run(bucket.acquire(4))
+    assert bucket.wait_time() == 0.0
+    asyncio.run(bucket.acquire(6))
+    assert bucket.wait_time() > 0
+
+
+def test_acquire_amount_capped_at_capacity():
+    # an oversized request must not wait forever
+    bucket = AsyncTokenBucket(2, 60)
+    assert asyncio.run(asyncio.wait_for(bucket.acquire(100), 1)) is None
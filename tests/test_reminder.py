@@ -1,6 +1,8 @@
+import asyncio
 from datetime import datetime, timedelta
 
-from bot.services.reminder import parse_remind_time
+from bot.database.repository import Repository
+from bot.services.reminder import ReminderService, parse_remind_time
 
 
 # ---------------------------------------------------------------------------
@@ -130,3 +132,41 @@ def test_invalid_returns_none():
 
 def test_empty_returns_none():
     assert parse_remind_time("") is None
+
+
+# ---------------------------------------------------------------------------
+# Scheduler
+# ---------------------------------------------------------------------------
+
+def test_scheduler_sends_reminder_added_while_sleeping():
+    class FakeBot:
+        def __init__(self):
+            self.sent: list[tuple[int, str]] = []
+
+        async def send_message(self, chat_id, text):
+            self.sent.append((chat_id, text))
+
+    async def run():
+        repo = Repository(":memory:")
+        await repo.connect()
+        await repo.upsert_user(1, "user", "User")
+        bot = FakeBot()
+        service = ReminderService(bot, repo)
+        service.start()
+        try:
+            await asyncio.sleep(0.05)  # scheduler is now sleeping with nothing pending
+            assert await repo.get_next_due_at() is None
+            await repo.add_reminder(1, 42, "купить молоко", datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"))
+            service.notify()
+            for _ in range(50):
+                if bot.sent:
+                    break
+                await asyncio.sleep(0.02)
+            return bot.sent, await repo.get_next_due_at()
+        finally:
+            await service.stop()
+            await repo.close()
+
+    sent, next_due = asyncio.run(run())
+    assert sent == [(42, "🔔 Напоминание:\nкупить молоко")]
+    assert next_due is None
@@ -0,0 +1,143 @@
+import asyncio
+
+from bot.database.repository import Repository
+
+
+async def _repo() -> Repository:
+    repo = Repository(":memory:")
+    await repo.connect()
+    await repo.upsert_user(1, "user", "User")
+    return repo
+
+
+def test_add_user_facts_skips_duplicates_case_insensitively():
+    async def run():
+        repo = await _repo()
+        try:
+            await repo.add_user_fact(1, "Живёт в Москве")
+            version = repo.facts_version(1)
+            added = await repo.add_user_facts(1, ["живёт в москве", "Has a cat", "has a CAT"])
+            facts = [f["fact"] for f in await repo.get_user_facts(1)]
+            return added, facts, repo.facts_version(1) - version
+        finally:
+            await repo.close()
+
+    added, facts, bumps = asyncio.run(run())
+    assert added == 1
+    assert sorted(facts) == ["Has a cat", "Живёт в Москве"]
+    assert bumps == 1
+
+
+def test_add_user_facts_nothing_new_keeps_version():
+    async def run():
+        repo = await _repo()
+        try:
+            await repo.add_user_fact(1, "Likes tea")
+            version = repo.facts_version(1)
+            added = await repo.add_user_facts(1, ["likes tea"])
+            return added, repo.facts_version(1) == version
+        finally:
+            await repo.close()
+
+    assert asyncio.run(run()) == (0, True)
+
+
+def test_finalize_turn_stores_exchange_and_usage():
+    async def run():
+        repo = await _repo()
+        try:
+            conv = await repo.create_conversation(1, "gpt-4o")
+            await repo.finalize_turn(conv["id"], 1, "hi", "hello", 7, "chat", "gpt-4o")
+            messages = await repo.get_messages(conv["id"])
+            usage = await repo.get_api_usage_summary(1)
+            return messages, usage
+        finally:
+            await repo.close()
+
+    messages, usage = asyncio.run(run())
+    assert [(m["role"], m["content"]) for m in messages] == [("user", "hi"), ("assistant", "hello")]
+    assert usage == [{"type": "chat", "count": 1, "total_tokens": 7}]
+
+
+def test_reads_see_committed_writes_on_file_db(tmp_path):
+    async def run():
+        repo = Repository(str(tmp_path / "bot.db"))
+        await repo.connect()
+        try:
+            await repo.upsert_user(1, "user", "User")
+            conv = await repo.create_conversation(1, "gpt-4o")
+            await repo.finalize_turn(conv["id"], 1, "hi", "hello", 7, "chat", "gpt-4o")
+            await repo.add_user_fact(1, "Likes tea")
+            ctx = await repo.get_chat_context(1)
+            return conv, ctx, await repo.get_active_conversation(1)
+        finally:
+            await repo.close()
+
+    conv, ctx, active = asyncio.run(run())
+    assert active == conv == ctx["conversation"]
+    assert [m["content"] for m in ctx["messages"]] == ["hi", "hello"]
+    assert ctx["facts"] == ["Likes tea"]
+
+
+def test_char_len_backfilled_for_existing_messages(tmp_path):
+    import sqlite3
+
+    path = tmp_path / "bot.db"
+    with sqlite3.connect(path) as db:
+        db.executescript(
+            """CREATE TABLE messages (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id INTEGER NOT NULL,
+                   role TEXT NOT NULL, content TEXT NOT NULL, content_type TEXT DEFAULT 'text',
+                   image_url TEXT, tokens_used INTEGER DEFAULT 0,
+                   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+               INSERT INTO messages (conversation_id, role, content) VALUES (1, 'user', 'привет');"""
+        )
+
+    async def run():
+        repo = Repository(str(path))
+        await repo.connect()
+        try:
+            cursor = await repo._db.execute("SELECT char_len FROM messages")
+            return [row["char_len"] for row in await cursor.fetchall()]
+        finally:
+            await repo.close()
+
+    assert asyncio.run(run()) == [6]
+
+
+def test_usage_totals_follow_writes_without_requery():
+    async def run():
+        repo = await _repo()
+        try:
+            conv = await repo.create_conversation(1, "gpt-4o")
+            await repo.log_api_usage(1, "chat", "gpt-4o", 10)
+            first = await repo.get_usage_totals(1)
+            await repo.finalize_turn(conv["id"], 1, "hi", "hello", 5, "chat", "gpt-4o")
+            await repo.log_api_usage(1, "tts", "tts-1")
+            cached = await repo.get_usage_totals(1)
+            repo._usage_totals.clear()
+            fresh = await repo.get_usage_totals(1)
+            return first, cached, fresh
+        finally:
+            await repo.close()
+
+    first, cached, fresh = asyncio.run(run())
+    assert first == (10, 10)
+    assert cached == fresh == (15, 15)
+
+
+def test_add_vps_metrics_stores_cycle():
+    async def run():
+        repo = await _repo()
+        try:
+            web = await repo.add_vps_server("web", "10.0.0.1", 22, "root")
+            db = await repo.add_vps_server("db", "10.0.0.2", 22, "root")
+            await repo.add_vps_metrics([(web, {"cpu_pct": 10.0}), (db, {"cpu_pct": 20.0, "uptime_sec": 5})])
+            await repo.add_vps_metrics([])
+            return await repo.get_vps_latest_metric(web), await repo.get_vps_latest_metric(db)
+        finally:
+            await repo.close()
+
+    web, db = asyncio.run(run())
+    assert web["cpu_pct"] == 10.0 and web["uptime_sec"] is None
+    assert (db["cpu_pct"], db["uptime_sec"]) == (20.0, 5)
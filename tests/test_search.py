@@ -0,0 +1,108 @@
+import asyncio
+
+from bot.services import search
+
+
+def test_web_search_cached_for_repeated_query(monkeypatch):
+    calls: list[str] = []
+
+    def fake_search(query, max_results=5):
+        calls.append(query)
+        return [{"title": "t", "url": "https://example.com", "snippet": "s"}]
+
+    monkeypatch.setattr(search, "_search_sync", fake_search)
+    monkeypatch.setattr(search, "_search_cache", type(search._search_cache)())
+
+    async def run():
+        first = await search.web_search("Python news")
+        second = await search.web_search("  python   NEWS ")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second
+    assert calls == ["Python news"]
+
+
+def test_web_search_empty_result_not_cached(monkeypatch):
+    calls: list[str] = []
+
+    def fake_search(query, max_results=5):
+        calls.append(query)
+        return []
+
+    monkeypatch.setattr(search, "_search_sync", fake_search)
+    monkeypatch.setattr(search, "_search_cache", type(search._search_cache)())
+
+    async def run():
+        await search.web_search("nothing")
+        await search.web_search("nothing")
+
+    asyncio.run(run())
+    assert calls == ["nothing", "nothing"]
+
+
+def test_extract_text_prefers_main_and_drops_noise():
+    html = (
+        "<html><body><nav>Menu</nav><main><h1>Title</h1><script>x()</script>"
+        "<p>  First  </p><p>Second</p></main><footer>Footer</footer></body></html>"
+    )
+    assert search._extract_text(html, 3000) == "Title\nFirst\nSecond"
+    assert search._extract_text(html, 8) == "Title\nFi"
+
+
+def _fetch(monkeypatch, response, max_chars=3000):
+    import httpx
+
+    real_client = httpx.AsyncClient
+    transport = httpx.MockTransport(lambda request: response)
+    monkeypatch.setattr(search.httpx, "AsyncClient", lambda **kwargs: real_client(transport=transport, **kwargs))
+    monkeypatch.setattr(search, "_page_cache", type(search._page_cache)())
+    return asyncio.run(search.fetch_page_text("https://example.com/page", max_chars))
+
+
+def test_fetch_page_text_caps_body_size(monkeypatch):
+    import httpx
+
+    html = "<p>start</p>" + "<p>filler</p>" * 100_000 + "<p>TAIL</p>"
+    response = httpx.Response(200, text=html, headers={"content-type": "text/html"})
+    text = _fetch(monkeypatch, response, max_chars=len(html))
+    assert text.startswith("start")
+    assert "TAIL" not in text
+
+
+def test_fetch_page_text_skips_non_html(monkeypatch):
+    import httpx
+
+    response = httpx.Response(200, content=b"%PDF-1.7", headers={"content-type": "application/pdf"})
+    assert _fetch(monkeypatch, response) == ""
+
+
+def test_fetch_page_text_uses_meta_charset(monkeypatch):
+    import httpx
+
+    html = '<html><head><meta charset="windows-1251"></head><body><p>Привет</p></body></html>'
+    response = httpx.Response(200, content=html.encode("cp1251"), headers={"content-type": "text/html"})
+    assert _fetch(monkeypatch, response) == "Привет"
+
+
+def test_concurrent_identical_searches_share_one_request(monkeypatch):
+    import time
+
+    calls: list[str] = []
+
+    def slow_search(query, max_results=5):
+        calls.append(query)
+        time.sleep(0.05)
+        return [{"title": "t", "url": "https://example.com", "snippet": "s"}]
+
+    monkeypatch.setattr(search, "_search_sync", slow_search)
+    monkeypatch.setattr(search, "_search_cache", type(search._search_cache)())
+
+    async def run():
+        return await asyncio.gather(search.web_search("same"), search.web_search("Same"))
+
+    first, second = asyncio.run(run())
+    assert first == second
+    assert first is not second  # callers get their own list
+    assert calls == ["same"]
+    assert search._inflight == {}
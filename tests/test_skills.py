@@ -0,0 +1,72 @@
+import asyncio
+
+from bot.services.skills import SkillsService
+
+
+def _service(tmp_path, manifests: dict[str, str]) -> SkillsService:
+    for name, body in manifests.items():
+        (tmp_path / f"{name}.yml").write_text(body, encoding="utf-8")
+    service = SkillsService(str(tmp_path))
+    asyncio.run(service.load_all())
+    return service
+
+
+def test_find_by_keywords(tmp_path):
+    service = _service(tmp_path, {
+        "calc": "name: calc\nkeywords: [посчитай, calculate]\n",
+        "weather": "name: weather\nkeywords: [погода]\n",
+        "off": "name: off\nenabled: false\nkeywords: [hello]\n",
+    })
+    assert service.find_by_keywords("Посчитай 2+2").name == "calc"
+    assert service.find_by_keywords("какая ПОГОДА завтра").name == "weather"
+    assert service.find_by_keywords("hello there") is None
+    assert service.find_by_keywords("nothing here") is None
+
+
+def test_find_by_keywords_without_keywords(tmp_path):
+    service = _service(tmp_path, {"plain": "name: plain\n"})
+    assert service.find_by_keywords("anything") is None
+
+
+def test_skills_texts_cached_until_reload(tmp_path):
+    service = _service(tmp_path, {"calc": "name: calc\ndescription: Calculator\n"})
+    prompt = service.get_skills_prompt()
+    assert "### Skill: calc" in prompt
+    assert service.get_skills_prompt() is prompt
+    assert "calc v1.0 [llm]" in service.list_skills_text()
+
+    (tmp_path / "notes.yml").write_text("name: notes\n", encoding="utf-8")
+    asyncio.run(service.load_all())
+    assert "### Skill: notes" in service.get_skills_prompt()
+    assert "notes v1.0" in service.list_skills_text()
+
+
+def test_handler_module_reused_on_reload(tmp_path):
+    import sys
+
+    skill_dir = tmp_path / "echo"
+    skill_dir.mkdir()
+    (skill_dir / "skill.yml").write_text("name: echo_test\n", encoding="utf-8")
+    (skill_dir / "handler.py").write_text("def execute(query):\n    return query\n", encoding="utf-8")
+
+    service = SkillsService(str(tmp_path))
+    try:
+        asyncio.run(service.load_all())
+        first = service.skills["echo_test"].execute
+        asyncio.run(service.load_all())
+        assert service.skills["echo_test"].execute is first
+        assert asyncio.run(service.execute_skill(service.skills["echo_test"], "hi")) == "hi"
+    finally:
+        sys.modules.pop("skill_echo_test", None)
+
+
+def test_find_by_trigger(tmp_path):
+    service = _service(tmp_path, {
+        "calc": "name: calc\ntrigger: /calc\n",
+        "notes": "name: notes\n",
+        "off": "name: off\ntrigger: /off\nenabled: false\n",
+    })
+    assert service.find_by_trigger("/calc").name == "calc"
+    assert service.find_by_trigger("/notes").name == "notes"  # default trigger is /<name>
+    assert service.find_by_trigger("/off") is None
+    assert service.find_by_trigger("/missing") is None
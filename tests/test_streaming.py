@@ -0,0 +1,70 @@
+import asyncio
+
+from bot.services.streaming import CoalescingEditor
+
+
+def test_coalesces_updates_during_slow_edit():
+    sent: list[str] = []
+
+    async def slow_edit(text: str) -> None:
+        await asyncio.sleep(0.05)
+        sent.append(text)
+
+    async def run():
+        editor = CoalescingEditor(slow_edit)
+        editor.update("a")
+        await asyncio.sleep(0)  # first edit starts
+        editor.update("ab")
+        editor.update("abc")  # replaces "ab" before it is sent
+        await asyncio.sleep(0.12)
+        await editor.finish("abcd")
+
+    asyncio.run(run())
+    assert sent == ["a", "abc", "abcd"]
+
+
+def test_finish_drops_stale_pending_text():
+    sent: list[str] = []
+
+    async def slow_edit(text: str) -> None:
+        await asyncio.sleep(0.05)
+        sent.append(text)
+
+    async def run():
+        editor = CoalescingEditor(slow_edit)
+        editor.update("a")
+        await asyncio.sleep(0)
+        editor.update("ab")
+        await editor.finish("abc")
+
+    asyncio.run(run())
+    assert sent == ["a", "abc"]
+
+
+def test_edit_errors_are_swallowed():
+    async def failing_edit(text: str) -> None:
+        raise RuntimeError("message is not modified")
+
+    async def run():
+        editor = CoalescingEditor(failing_edit)
+        editor.update("a")
+        await asyncio.sleep(0.01)
+        editor.cancel()
+
+    asyncio.run(run())
+
+
+def test_suffix_only_on_progress_edits():
+    sent: list[str] = []
+
+    async def edit(text: str) -> None:
+        sent.append(text)
+
+    async def run():
+        editor = CoalescingEditor(edit, suffix=" ▌")
+        editor.update("ab")
+        await asyncio.sleep(0)
+        await editor.finish("abc")
+
+    asyncio.run(run())
+    assert sent == ["ab ▌", "abc"]
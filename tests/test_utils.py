@@ -1,4 +1,4 @@
-from bot.utils import md_to_html
+from bot.utils import append_sources, estimate_tokens, likely_has_facts, md_to_html
 
 
 def test_escape_less_than():
@@ -59,3 +59,64 @@ def test_combo_bold_with_html_chars():
 
 def test_empty_string():
     assert md_to_html("") == ""
+
+
+def test_likely_has_facts_first_person_ru():
+    assert likely_has_facts("Меня зовут Пётр, я живу в Москве")
+
+
+def test_likely_has_facts_first_person_en():
+    assert likely_has_facts("I'm a software engineer from Berlin")
+
+
+def test_likely_has_facts_dropped_pronoun_ru():
+    assert likely_has_facts("Живу в Казани, работаю врачом")
+
+
+def test_likely_has_facts_question():
+    assert not likely_has_facts("What do you think about my plan?")
+
+
+def test_likely_has_facts_short():
+    assert not likely_has_facts("я тут")
+
+
+def test_likely_has_facts_no_pronouns():
+    assert not likely_has_facts("Напиши стихотворение про осень")
+
+
+def test_likely_has_facts_code_block():
+    assert not likely_has_facts("```python\nfor me in my_list:\n    print(me)\n```")
+
+
+def test_append_sources():
+    assert append_sources("Ответ", ["[A](a)", "[B](b)"]) == "Ответ\n\nИсточники:\n• [A](a)\n• [B](b)"
+
+
+def test_append_sources_empty():
+    assert append_sources("Ответ", []) == "Ответ"
+
+
+def test_estimate_tokens_ascii():
+    assert estimate_tokens("a" * 40) == 10
+
+
+def test_estimate_tokens_cyrillic_counts_more():
+    assert estimate_tokens("п" * 40) == 20
+
+
+def test_plain_text_only_escaped():
+    assert md_to_html("2 < 3, no markup here") == "2 &lt; 3, no markup here"
+
+
+def test_markup_inside_inline_code_kept_literal():
+    assert md_to_html("`a**b**c`") == "<code>a**b**c</code>"
+
+
+def test_nested_bold_and_italic():
+    assert md_to_html("**bold _it_**") == "<b>bold <i>it</i></b>"
+    assert md_to_html("*a **b** c*") == "<i>a <b>b</b> c</i>"
+
+
+def test_bold_italic_triple_asterisk():
+    assert md_to_html("***bold italic***") == "<b><i>bold italic</i></b>"
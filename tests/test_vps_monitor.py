@@ -0,0 +1,206 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from bot.services.vps_monitor import METRICS_CMD, MetricsParseError, _parse_metrics
+
+_OUTPUT = (
+    "12.5\n"
+    "43.2 1720 3980\n"
+    "61 24.1234 39.1000\n"
+    "86400\n"
+    "0.15 0.10 0.05 1/123 4567\n"
+    "\n"
+    "web|Up 3 hours|nginx:latest\n"
+    "db|Exited (1) 2 minutes ago|postgres:16\n"
+)
+
+
+def test_parse_metrics():
+    metrics = _parse_metrics(_OUTPUT)
+    assert metrics["cpu_pct"] == 12.5
+    assert (metrics["mem_pct"], metrics["mem_used_mb"], metrics["mem_total_mb"]) == (43.2, 1720, 3980)
+    assert (metrics["disk_pct"], metrics["disk_total_gb"]) == (61.0, 39.1)
+    assert metrics["uptime_sec"] == 86400
+    assert (metrics["load_1"], metrics["load_5"], metrics["load_15"]) == (0.15, 0.10, 0.05)
+    assert [c["name"] for c in json.loads(metrics["containers_json"])] == ["web", "db"]
+
+
+def test_parse_metrics_without_docker():
+    metrics = _parse_metrics(_OUTPUT.split("\n\n")[0] + "\n\nDOCKER_UNAVAILABLE\n")
+    assert metrics["containers_json"] is None
+
+
+def test_parse_metrics_rejects_truncated_output():
+    with pytest.raises(MetricsParseError):
+        _parse_metrics("12.5\n43.2 1720\n")
+    with pytest.raises(MetricsParseError):
+        _parse_metrics(_OUTPUT.replace("86400", "86x"))
+
+
+def test_unparseable_metrics_alerted_once_until_they_parse_again():
+    import asyncio
+    from types import SimpleNamespace
+
+    from bot.services.vps_monitor import VpsMonitorService
+
+    sent: list[str] = []
+    stored: list = []
+    # poll results per cycle: two bad outputs, a good one, then bad again
+    results = [MetricsParseError("unexpected metrics output"), MetricsParseError("unexpected metrics output"),
+               _parse_metrics(_OUTPUT), MetricsParseError("unexpected metrics output")]
+
+    async def send_message(chat_id, text, parse_mode=None):
+        sent.append(text)
+
+    async def get_vps_servers():
+        return [{"id": 1, "alias": "main"}]
+
+    async def add_vps_metrics(metrics):
+        stored.extend(metrics)
+
+    repo = SimpleNamespace(get_vps_servers=get_vps_servers, add_vps_metrics=add_vps_metrics)
+    config = SimpleNamespace(
+        admin_id=1, vps_poll_interval=0,
+        vps_cpu_threshold=100, vps_mem_threshold=100, vps_disk_threshold=100,
+    )
+    service = VpsMonitorService(bot=SimpleNamespace(send_message=send_message), repo=repo, config=config)
+
+    async def run():
+        cycles_done = asyncio.Event()
+
+        async def poll(server):
+            if not results:
+                cycles_done.set()
+                await asyncio.Event().wait()  # parked until stop()
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        service._poll_server = poll
+        service.start()
+        await cycles_done.wait()
+        await service.stop()
+
+    asyncio.run(run())
+    assert len(stored) == 1
+    assert len(sent) == 2
+    assert all("не читаются" in text and "недоступен" not in text for text in sent)
+
+
+
+def test_container_change_alerts_against_previous_poll():
+    import asyncio
+    from types import SimpleNamespace
+
+    from bot.services.vps_monitor import VpsMonitorService
+
+    service = VpsMonitorService(bot=None, repo=None, config=SimpleNamespace())
+    alerts: list[str] = []
+
+    async def fake_alert(key, text):
+        alerts.append(key)
+
+    service._maybe_alert = fake_alert
+    server = {"id": 1, "alias": "main"}
+    running = _parse_metrics(_OUTPUT)
+    stopped = _parse_metrics(_OUTPUT.replace("web|Up 3 hours", "web|Exited (0) 1 second ago"))
+
+    async def run():
+        await service._check_container_changes(server, running)  # first poll only records
+        await service._check_container_changes(server, running)
+        await service._check_container_changes(server, stopped)
+
+    asyncio.run(run())
+    assert alerts == ["main:containers"]
+
+
+def test_poll_reuses_connection_and_reconnects_when_stale():
+    import asyncio
+    from types import SimpleNamespace
+
+    from bot.services.vps_monitor import VpsMonitorService
+
+    class FakeConn:
+        def __init__(self):
+            self.closed = False
+            self.fail = False
+
+        def is_closed(self):
+            return self.closed
+
+        def close(self):
+            self.closed = True
+
+        async def wait_closed(self):
+            self.waited = True
+
+        async def run(self, cmd, check, timeout, input=None):
+            if input is not None:
+                self.script = input
+                return SimpleNamespace(stdout="")
+            if self.fail:
+                raise ConnectionResetError("gone")
+            assert cmd == "./.bot_metrics.sh" and self.script.startswith("#!/bin/sh\n")
+            return SimpleNamespace(stdout=_OUTPUT)
+
+    service = VpsMonitorService(bot=None, repo=None, config=SimpleNamespace())
+    opened: list[FakeConn] = []
+
+    async def fake_connect(server):
+        opened.append(FakeConn())
+        return opened[-1]
+
+    service._connect = fake_connect
+    server = {"id": 1, "alias": "main", "host": "h", "port": 22, "user": "u"}
+
+    async def run():
+        await service._poll_server(server)
+        await service._poll_server(server)
+        opened[0].fail = True
+        metrics = await service._poll_server(server)
+        await service.stop()
+        return metrics
+
+    assert asyncio.run(run())["cpu_pct"] == 12.5
+    assert len(opened) == 2
+    assert all(conn.closed and conn.waited for conn in opened)
+
+
+@pytest.mark.skipif(
+    not shutil.which("dash") or not os.path.exists("/proc/stat"), reason="needs dash and /proc",
+)
+def test_metrics_script_runs_under_posix_sh():
+    # the uploaded script has a #!/bin/sh shebang, often dash rather than bash
+    result = subprocess.run(["dash", "-c", METRICS_CMD], capture_output=True, text=True, check=True)
+    metrics = _parse_metrics(result.stdout)
+    assert 0 <= metrics["mem_pct"] <= 100
+
+
+def test_alerts_of_a_cycle_sent_as_one_message():
+    import asyncio
+    from types import SimpleNamespace
+
+    from bot.services.vps_monitor import VpsMonitorService
+
+    sent: list[str] = []
+
+    async def send_message(chat_id, text, parse_mode=None):
+        sent.append(text)
+
+    bot = SimpleNamespace(send_message=send_message)
+    service = VpsMonitorService(bot=bot, repo=None, config=SimpleNamespace(admin_id=1))
+
+    async def run():
+        await service._maybe_alert("a", "first")
+        await service._maybe_alert("b", "second")
+        await service._maybe_alert("a", "first again")  # cooldown
+        await service._flush_alerts()
+        await service._flush_alerts()  # nothing pending
+
+    asyncio.run(run())
+    assert sent == ["first\n\nsecond"]
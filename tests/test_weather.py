@@ -0,0 +1,47 @@
+import asyncio
+
+import httpx
+
+from bot.services.weather import WeatherService, _desc
+
+_FORECAST = {
+    "current": {
+        "temperature_2m": 5.1, "apparent_temperature": 2.0, "weather_code": 3,
+        "wind_speed_10m": 4.0, "relative_humidity_2m": 80,
+    },
+    "daily": {
+        "time": ["2026-10-12", "2026-10-13", "2026-10-14"],
+        "temperature_2m_max": [8, 9, 10],
+        "temperature_2m_min": [1, 2, 3],
+        "weather_code": [3, 61, 0],
+        "precipitation_sum": [0, 2.5, 0],
+    },
+}
+
+
+def test_forecast_fetched_once_per_cache_window():
+    requests = 0
+
+    def handler(request):
+        nonlocal requests
+        requests += 1
+        return httpx.Response(200, json=_FORECAST)
+
+    async def run():
+        service = WeatherService(55.75, 37.62, "Москве", "Europe/Moscow")
+        service._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await service.get_forecast_text(), await service.get_forecast_text()
+        finally:
+            await service.aclose()
+
+    first, second = asyncio.run(run())
+    assert first == second
+    assert "Пасмурно" in first and "Вт 13.10: 🌧 Дождь слабый, 2°..9°, осадки 2.5 мм" in first
+    assert requests == 1
+
+
+def test_desc_handles_missing_code():
+    assert _desc(3) == "☁️ Пасмурно"
+    assert _desc(None) == "Неизвестно (None)"
+    assert _desc(150) == "Неизвестно (150)"